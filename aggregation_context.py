@@ -0,0 +1,84 @@
+"""This script contains the per-request cache of the column aggregates.
+
+Several charts are built from the same aggregate of a column (eg., the bar
+graph and the pie chart of a categorical question both need its value counts).
+An AggregationContext computes each aggregate on first use only and hands it
+to every chart builder that needs it.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class AggregationContext:
+    """Lazy cache of the value counts, null counts and numeric summaries of the columns of a frame.
+    The frame must not be modified while the context is used.
+
+    Parameters
+    ----------
+    df: dataframe
+        The frame the aggregates are computed on.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._counts = {}
+        self._numeric_values = {}
+        self._numeric_summaries = {}
+
+    def _count(self, column):
+        # a single value_counts gives both the counts and the nulls
+        if column not in self._counts:
+            counts = self.df[column].value_counts(dropna=False)
+            nulls = counts.index.isna()
+            self._counts[column] = (counts[~nulls], int(counts[nulls].sum()))
+        return self._counts[column]
+
+    def value_counts(self, column):
+        """Function to get the counts of the answers of a column, the most frequent first.
+
+        Returns
+        -------
+        value_counts: Pandas Series
+        """
+        return self._count(column)[0]
+
+    def null_count(self, column):
+        """Function to get the number of missing answers of a column."""
+        return self._count(column)[1]
+
+    def class_count(self, column):
+        """Function to get the number of distinct answers of a column."""
+        return len(self.value_counts(column))
+
+    def numeric_values(self, column):
+        """Function to get the answers of a column as numbers, without the missing ones.
+
+        Returns
+        -------
+        values: numpy array
+        """
+        if column not in self._numeric_values:
+            self._numeric_values[column] = pd.to_numeric(self.df[column], errors='coerce').dropna().to_numpy()
+        return self._numeric_values[column]
+
+    def numeric_summary(self, column):
+        """Function to get the count, the mean and the quartiles of the numeric answers of a column.
+
+        Returns
+        -------
+        summary: dict
+            'count', 'mean' and 'quantiles' (min, q1, median, q3 and max), None without answers.
+        """
+        if column not in self._numeric_summaries:
+            values = self.numeric_values(column)
+            if len(values):
+                quartiles = np.quantile(values, [0.0, 0.25, 0.5, 0.75, 1.0]).tolist()
+                mean = float(values.mean())
+            else:
+                quartiles, mean = [None] * 5, None
+            self._numeric_summaries[column] = {'count': int(len(values)),
+                                               'mean': mean,
+                                               'quantiles': dict(zip(['min', 'q1', 'median', 'q3', 'max'],
+                                                                     quartiles))}
+        return self._numeric_summaries[column]
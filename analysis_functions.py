@@ -8,7 +8,16 @@ import pandas as pd
 import seaborn as sns
 import numpy as np
 
-def compute_bar_graph_data(series, title, survey_item_id):
+# A pie chart is only drawn for questions with fewer classes than this
+PIE_CHART_MAX_CLASSES = 5
+# Number of clusters of near-duplicate answers in a common answers chart
+COMMON_ANSWERS_TOP = 20
+# Zoom levels of the geography heatmap tiles, the web maps go from the whole world (0) to buildings (22)
+MIN_ZOOM = 0
+MAX_ZOOM = 22
+
+
+def compute_bar_graph_data(series, title, survey_item_id, value_counts=None):
     """Function to compute data for a bar graph.
     
     Parameters
@@ -19,8 +28,11 @@ def compute_bar_graph_data(series, title, survey_item_id):
         Title of the plot. Let this be the column name
     survey_item_id: int,
         id associated with the quest survey question    
+    value_counts: Pandas Series, optional
+        The counts of the series, when they were computed already.
     """
-    value_counts = series.value_counts()
+    if value_counts is None:
+        value_counts = series.value_counts()
     data = {
         'plot_type': 'bar_graph', 
         'alternative_chart': 'horizontal_bar_graph',
@@ -34,7 +46,7 @@ def compute_bar_graph_data(series, title, survey_item_id):
     return data
 
 
-def compute_pie_chart_data(series, title, survey_item_id):
+def compute_pie_chart_data(series, title, survey_item_id, value_counts=None):
     """Function to compute data for a pie chart.
     
     Parameters
@@ -45,8 +57,11 @@ def compute_pie_chart_data(series, title, survey_item_id):
         Title of the plot. Let this be the column name
     survey_item_id: int,
         id associated with the quest survey question
+    value_counts: Pandas Series, optional
+        The counts of the series, when they were computed already.
     """
-    value_counts = series.value_counts()
+    if value_counts is None:
+        value_counts = series.value_counts()
     labels = value_counts.index.tolist()
     sizes = value_counts.values.tolist()
     data = {
@@ -128,7 +143,71 @@ def compute_histogram_data(data, title, survey_item_id):
     return data
 
 
-def compute_wordcloud_data(data, title, survey_item_id):
+def compute_histogram_summary_data(data, title, survey_item_id, bins=20):
+    """Function to compute data for a histogram from binned counts instead of the raw values.
+    
+    Parameters
+    ----------
+    data: Pandas Series or numpy array
+        Data to plot the histogram.
+    title: str
+        Title of the plot.
+    survey_item_id: int,
+        id associated with the quest survey question
+    bins: int
+        Number of histogram bins.
+    """
+    values = pd.to_numeric(pd.Series(data), errors='coerce').dropna().to_numpy()
+    counts, edges = np.histogram(values, bins=bins) if len(values) else (np.array([]), np.array([]))
+    data = {
+        'plot_type': 'histogram',
+        'alternative_charts': ['density_plot',],
+        'title': title,
+        'bin_edges': edges.tolist(),
+        'counts': counts.tolist(),
+        'x_label': 'Values',
+        'y_label': 'Frequency',
+        'summary': True,
+        'survey_item_id': survey_item_id
+    }
+    return data
+
+
+def compute_box_plot_summary_data(data, title, survey_item_id, summary=None):
+    """Function to compute data for a box plot from quartiles instead of the raw values.
+    
+    Parameters
+    ----------
+    data: Pandas Series.
+        Data to plot the box plot.
+    title: str, title of the plot.
+        Let this be the column name
+    survey_item_id: int,
+        id associated with the quest survey question
+    summary: dict, optional
+        The 'count', 'mean' and 'quantiles' of the data, when they were computed already.
+    """
+    if summary is None:
+        values = pd.to_numeric(pd.Series(data), errors='coerce').dropna()
+        quartiles = values.quantile([0.0, 0.25, 0.5, 0.75, 1.0]).tolist() if len(values) else [None] * 5
+        summary = {'count': int(len(values)),
+                   'mean': float(values.mean()) if len(values) else None,
+                   'quantiles': dict(zip(['min', 'q1', 'median', 'q3', 'max'], quartiles))}
+    data = {
+        'plot_type': 'boxplot',
+        'alternative_chart': 'violin_plot',
+        'title': title,
+        'quantiles': summary['quantiles'],
+        'mean': summary['mean'],
+        'count': summary['count'],
+        'y_label': 'Value',
+        'summary': True,
+        'survey_item_id': survey_item_id
+    }
+    return data
+
+
+def compute_wordcloud_data(data, title, survey_item_id, words=None):
     """Function to compute data for a word cloud.
     
     Parameters
@@ -139,10 +218,15 @@ def compute_wordcloud_data(data, title, survey_item_id):
         Title of the plot.
     survey_item_id: int,
         id associated with the quest survey question
+    words: list, optional
+        The words of the answers, when they were already extracted.
     """
-    text = ' '.join(data.astype(str).tolist())
-    # replace nan with empty string
-    text = text.replace('nan', '')
+    if words is not None:
+        text = ' '.join(words)
+    else:
+        text = ' '.join(data.astype(str).tolist())
+        # replace nan with empty string
+        text = text.replace('nan', '')
     data = {
         'plot_type': 'wordcloud',
         'title': title,
@@ -152,28 +236,58 @@ def compute_wordcloud_data(data, title, survey_item_id):
     return data
 
 
+def compute_common_answers_data(representatives, title, survey_item_id, top=COMMON_ANSWERS_TOP):
+    """Function to compute data for a bar graph of the most common answers of an open_ended question.
+    Near-duplicate answers are counted together, under their representative answer.
+
+    Parameters
+    ----------
+    representatives: Pandas Series
+        The representative answer of each answer, see 'cluster_answers'.
+    title: str
+        Title of the plot.
+    survey_item_id: int,
+        id associated with the quest survey question
+    top: int
+        The number of clusters in the graph, the largest first.
+    """
+    cluster_sizes = representatives.value_counts().head(top)
+    data = {
+        'plot_type': 'bar_graph',
+        'alternative_chart': 'horizontal_bar_graph',
+        'title': title,
+        'x_values': cluster_sizes.index.tolist(),
+        'y_values': cluster_sizes.values.tolist(),
+        'x_label': 'Answers',
+        'y_label': 'Count',
+        'survey_item_id': survey_item_id
+    }
+    return data
+
+
 # Line Chart
 def get_daily_response_count_data(df):
     """
     Function to return data points for daily response counts.
 
     Parameters:
-    - df: DataFrame with a 'created_at' column containing datetime values.
+    - df: DataFrame with one row per respondent and a 'created_at' column
+      (or index) containing datetime values, eg., the response metadata.
 
     Returns:
     - data: A dictionary containing 'dates' and 'counts' lists.
     """
-     # Reset the index and make 'created_at' an actual column
-    df.reset_index(inplace=True)
-    
-    # Ensure that 'created_at' is in datetime format
-    df['created_at'] = pd.to_datetime(df['created_at'])
+    # 'created_at' is a column, or the index of older parsed surveys
+    created_at = df['created_at'] if 'created_at' in df.columns else df.index.to_series()
+
+    # Ensure that 'created_at' is in datetime format, it is only parsed if it isn't already
+    created_at = pd.to_datetime(created_at)
 
     # Extract the date as a string from the 'created_at' column
-    df['date'] = df['created_at'].dt.strftime('%Y-%m-%d')
+    dates = created_at.dt.strftime('%Y-%m-%d').rename('date')
 
     # Group by date and count the number of responses for each day
-    daily_counts = df.groupby('date').size().reset_index()
+    daily_counts = dates.groupby(dates).size()
 
     # Create a dictionary with data points
     data = {
@@ -181,27 +295,28 @@ def get_daily_response_count_data(df):
         'title': 'Daily Response Counts Over Time',
         'x_label': 'Date',
         'y_label': 'Response Counts',
-        'dates': daily_counts['date'].tolist(),
-        'counts': daily_counts[0].tolist(),
+        'dates': daily_counts.index.tolist(),
+        'counts': daily_counts.tolist(),
     }
     return data
  
 
-def analyze_city(dataframe):
+def analyze_city(dataframe, value_counts=None):
     """
     Analyze city data and compute the number of users from each city.
 
     Parameters:
-    - dataframe: DataFrame containing a 'city' column.
+    - dataframe: DataFrame containing a 'city' column, one row per respondent.
+    - value_counts: The number of respondents of each city, when it was computed already.
 
     Returns:
     - city_data: A JSON object with 'city' and 'user_count' fields.
     """
-    # Drop duplicates based on the entire row
-    dataframe.drop_duplicates(subset=None, keep='first', inplace=True)
+    if value_counts is None:
+        value_counts = dataframe['city'].value_counts()
     
     # Count the number of users for each city
-    city_data = dataframe['city'].value_counts().reset_index()
+    city_data = value_counts.reset_index()
     city_data.columns = ['city', 'user_count']
     
     # Convert to JSON in the desired format
@@ -217,21 +332,22 @@ def analyze_city(dataframe):
     return city_json
 
 
-def analyze_country(dataframe):
+def analyze_country(dataframe, value_counts=None):
     """
     Analyze country data and compute the number of users from each country.
 
     Parameters:
-    - dataframe: DataFrame containing a 'country' column.
+    - dataframe: DataFrame containing a 'country' column, one row per respondent.
+    - value_counts: The number of respondents of each country, when it was computed already.
 
     Returns:
     - country_data: A JSON object with 'country' and 'user_count' fields.
     """
-    # Drop duplicates based on the entire row
-    dataframe.drop_duplicates(subset=None, keep='first', inplace=True)
+    if value_counts is None:
+        value_counts = dataframe['country'].value_counts()
     
     # Count the number of users for each country
-    country_data = dataframe['country'].value_counts().reset_index()
+    country_data = value_counts.reset_index()
     country_data.columns = ['country', 'user_count']
     
     # Convert to JSON in the desired format
@@ -247,21 +363,22 @@ def analyze_country(dataframe):
     return country_json
 
 
-def analyze_region(dataframe):
+def analyze_region(dataframe, value_counts=None):
     """
     Analyze region data and compute the number of users from each region.
 
     Parameters:
-    - dataframe: DataFrame containing a 'region' column.
+    - dataframe: DataFrame containing a 'region' column, one row per respondent.
+    - value_counts: The number of respondents of each region, when it was computed already.
 
     Returns:
     - region_data: A JSON object with 'region' and 'user_count' fields.
     """
-    # Drop duplicates based on the entire row
-    dataframe.drop_duplicates(subset=None, keep='first', inplace=True)
+    if value_counts is None:
+        value_counts = dataframe['region'].value_counts()
     
     # Count the number of users for each region
-    region_data = dataframe['region'].value_counts().reset_index()
+    region_data = value_counts.reset_index()
     region_data.columns = ['region', 'user_count']
     
     # Convert to JSON in the desired format
@@ -275,3 +392,55 @@ def analyze_region(dataframe):
         'y_label': 'Count'
     }
     return region_json
+
+
+def compute_geo_heatmap_data(response_metadata, zoom=6, latitude_field='latitude', longitude_field='longitude'):
+    """
+    Aggregate the respondent locations into map tiles for a geography heatmap.
+    The points are binned into Web Mercator tiles at the requested zoom level
+    with vectorized integer math, so the payload grows with the number of
+    occupied tiles instead of the number of respondents.
+
+    Parameters:
+    - response_metadata: DataFrame containing the latitude and longitude columns.
+    - zoom: The tile zoom level, there are 2**zoom x 2**zoom tiles covering the world.
+      It is clipped to MIN_ZOOM - MAX_ZOOM.
+    - latitude_field: The name of the latitude field.
+    - longitude_field: The name of the longitude field.
+
+    Returns:
+    - heatmap_json: A JSON object with the tile, count and centroid of every occupied cell.
+    """
+    latitude = pd.to_numeric(response_metadata[latitude_field], errors='coerce').to_numpy(dtype='float64')
+    longitude = pd.to_numeric(response_metadata[longitude_field], errors='coerce').to_numpy(dtype='float64')
+
+    # keep the valid coordinates only
+    valid = ~np.isnan(latitude) & ~np.isnan(longitude) & (np.abs(latitude) <= 90) & (np.abs(longitude) <= 180)
+    latitude, longitude = latitude[valid], longitude[valid]
+
+    # Web Mercator tile of every point, a zoom out of range would give fractional
+    # tiles (negative) or overflow the int64 tile codes (32 and above)
+    zoom = int(min(max(zoom, MIN_ZOOM), MAX_ZOOM))
+    tiles = 2 ** zoom
+    clipped_latitude = np.radians(np.clip(latitude, -85.05112878, 85.05112878))
+    tile_x = np.floor((longitude + 180.0) / 360.0 * tiles).astype('int64').clip(0, tiles - 1)
+    tile_y = np.floor((1.0 - np.arcsinh(np.tan(clipped_latitude)) / np.pi) / 2.0 * tiles).astype('int64').clip(0, tiles - 1)
+
+    # count the points and average the coordinates of every occupied tile
+    cells, cell_index, counts = np.unique(tile_x * tiles + tile_y, return_inverse=True, return_counts=True)
+    centroid_latitude = np.bincount(cell_index, weights=latitude, minlength=len(cells)) / np.maximum(counts, 1)
+    centroid_longitude = np.bincount(cell_index, weights=longitude, minlength=len(cells)) / np.maximum(counts, 1)
+
+    heatmap_json = {
+        'plot_type': 'geo_heatmap',
+        'alternative_chart': 'bubble_map',
+        'title': 'Geographic Distribution of Survey Respondents.',
+        'zoom': zoom,
+        'tile_x': (cells // tiles).tolist(),
+        'tile_y': (cells % tiles).tolist(),
+        'counts': counts.tolist(),
+        'centroid_latitude': np.round(centroid_latitude, 6).tolist(),
+        'centroid_longitude': np.round(centroid_longitude, 6).tolist(),
+        'total_points': int(valid.sum())
+    }
+    return heatmap_json
@@ -1,17 +1,88 @@
 """This script contains logic.
-This is the engine of the project."""
+This is the engine of the project.
 
+The engine functions never modify their inputs, so a parsed survey can be shared
+between threads and requests. The ones that add or change columns return a new
+frame, a shallow copy that shares the unchanged columns with the input."""
 
-# from profanity_check import predict
+
+import numpy as np
 import pandas as pd
 from textblob import TextBlob
 from seaborn_plot_functions import *
 from analysis_functions import * 
+from crosstab_analysis import build_segment_frame, compute_crosstabs
+from scaling_analysis import analyze_scaling_questions, read_metadata_scales
+from language_detection import add_language_columns, english_answers
+from text_extraction import TextCache, extract_text_features, get_answer_words
+from profanity_filter import count_profanity_matches
+from request_guardrails import describe_degradations, plan_degradations
+from aggregation_context import AggregationContext
+from respondent_quality import score_respondents, summarize_quality
+from answer_clustering import cluster_open_answers
+from correlation_analysis import analyze_correlations
+from temporal_analysis import PERIOD_FORMATS, analyze_trends
 
 
 # SECTION 1: Read and Parse the survey data
 # The survey data will be gotten from a link
-def parse_quest_data(df, df_meta):
+# How duplicate answers of a respondent to the same question are resolved
+DEDUP_POLICIES = ('first', 'last', 'latest')
+
+
+def get_respondent_keys(quest_data):
+    """Function to get the key of the respondent of every answer.
+    It is the response_id, answers without a response_id are grouped by their submission time instead.
+
+    Parameters
+    ----------
+    quest_data: DataFrame
+        The quest survey data, one row per answer.
+
+    Returns
+    -------
+    keys: Pandas Series
+    """
+    return quest_data['response_id'].fillna(pd.to_datetime(quest_data['created_at']).astype(str))
+
+
+def build_respondent_index(merged_df, dedup='latest'):
+    """Function to give every respondent an integer code and keep one answer per question.
+
+    Parameters
+    ----------
+    merged_df: DataFrame
+        The quest survey data merged with the metadata.
+    dedup: str
+        'first' or 'last' keeps the first or last answer in the file,
+        'latest' keeps the answer with the latest 'created_at'.
+        The row of the response metadata of a respondent is chosen the same way.
+
+    Returns
+    -------
+    merged_df: DataFrame
+        The answers with a 'respondent' code column, without duplicate answers.
+    respondent_rows: DataFrame
+        One of the kept answers of each respondent, the one its response metadata is taken from.
+    """
+    if dedup not in DEDUP_POLICIES:
+        raise ValueError(f"Unknown dedup policy '{dedup}', use one of {DEDUP_POLICIES}.")
+
+    merged_df = merged_df.copy()
+    # parse the timestamps once, they are reused by every temporal chart
+    merged_df['created_at'] = pd.to_datetime(merged_df['created_at'])
+    merged_df['respondent'] = pd.factorize(get_respondent_keys(merged_df))[0]
+
+    if dedup == 'latest':
+        merged_df = merged_df.sort_values('created_at', kind='stable')
+    keep = 'first' if dedup == 'first' else 'last'
+    merged_df = merged_df.drop_duplicates(subset=['respondent', 'question'], keep=keep)
+    # the response metadata comes from the same selection as the answers
+    respondent_rows = merged_df.drop_duplicates(subset=['respondent'], keep=keep)
+    return merged_df, respondent_rows
+
+
+def parse_quest_data(df, df_meta, dedup='latest'):
     """Function to get and parse the survey data from URL.
     Note, the URL will be extracted from the post request sent to our API.
 
@@ -20,12 +91,16 @@ def parse_quest_data(df, df_meta):
         This is the dataframe to get the quest survey data.
     quest_metadata_df: DataFrame,
         This is the dataframe to get the quest survey metadata.
+    dedup: str,
+        How duplicate answers of a respondent are resolved, see 'build_respondent_index'.
 
     :return
     restructured_df: DataFrame
-        The quest survey data for analysis
+        The quest survey data for analysis, one row per respondent code
     metadata_df; DataFrame
         The metadata showing the unique questions and the question type
+    response_metadata: DataFrame
+        One row per respondent code, in the same order as restructured_df
 
     """
     # Merge the two DataFrames based on the survey_item_id
@@ -34,26 +109,21 @@ def parse_quest_data(df, df_meta):
     # Extract a metadata dataframe as one of the output
     metadata_df = merged_df[['question', 'type', 'survey_item_id']]
     # drop duplicates in the metadata_df, if any.
-    metadata_df = metadata_df.drop_duplicates()
-        
-    # Extract a response metadata
-    response_metadata = merged_df[['response_id', 'quest_completion_time', 'city',
-                                   'country', 'region', 'latitude', 'longitude']]
-    # drop duplicates in the response_metadata, if any.
-    response_metadata = response_metadata.drop_duplicates()
-        
-    # Keep only a subset of the data. The question and the response
-    # created_at shows the individual responses based on the time survey was taken
-    merged_df = merged_df[['question', 'response', 'created_at']]
-    merged_df.drop_duplicates(inplace=True)
-    
+    metadata_df = metadata_df.drop_duplicates(subset=['survey_item_id'])
+
+    # Index the respondents on their response_id, and keep one answer per question
+    merged_df, respondent_rows = build_respondent_index(merged_df, dedup=dedup)
+
+    # Extract a response metadata, one row per respondent
+    response_metadata = respondent_rows[['respondent', 'response_id', 'created_at', 'quest_completion_time', 'city',
+                                         'country', 'region', 'latitude', 'longitude']]
+    response_metadata = response_metadata.set_index('respondent').sort_index()
+
     # Use pivot to restructure the data
-    # Use 'created at' to get the individual response to all the questions
-    restructured_df = merged_df.pivot(index='created_at', columns='question')
-    # Flatten the column index by joining the levels with underscore
-    restructured_df.columns = ['_'.join(col) for col in restructured_df.columns]
-    # Remove the 'response_' prefix from the column names
-    restructured_df.columns = [col.replace('response_', '') for col in restructured_df.columns]
+    # Use the respondent code to get the individual response to all the questions
+    restructured_df = merged_df.pivot(index='respondent', columns='question', values='response')
+    restructured_df.columns = restructured_df.columns.tolist()
+    response_metadata = response_metadata.reindex(restructured_df.index)
     return restructured_df, metadata_df, response_metadata
 
 
@@ -63,6 +133,7 @@ def categorize_survey_questions(df, df_meta):
 
     Categorical - For scaling questions and multichoice questions. Also if the question is a profiling question
         (eg., gender & country), check if it is categorical, then add it to this group.
+    Scaling - The scaling questions are also listed on their own for the radar and line charts.
     Numeric - If the profiling question (eg., age) is of type integer or float, add it to the numeric group.
     Open_ended - If the question is an open ended question, add it to this group.
         Sentiment analysis will be carried out later, as well as entity extraction.
@@ -81,6 +152,7 @@ def categorize_survey_questions(df, df_meta):
     """
     # create empty lists for the different categories of survey questions
     categorical = []
+    scaling = []
     numeric = []
     open_ended = []
     others = []
@@ -99,6 +171,7 @@ def categorize_survey_questions(df, df_meta):
             open_ended.append(i)
         elif j == "scaling":
             categorical.append(i)
+            scaling.append(i)
         elif j == "multiple_choice":
             categorical.append(i)
         # REMEMBER: TEST THIS PROFILING SECTION LATER WHEN YOU GET MORE SURVEY DATA***
@@ -116,6 +189,7 @@ def categorize_survey_questions(df, df_meta):
             others.append(i)
 
     return {'categorical': categorical,
+            'scaling': scaling,
             'numeric': numeric,
             'open_ended': open_ended,
             'others': others}
@@ -128,6 +202,8 @@ def categorize_survey_questions(df, df_meta):
 # Section 3: Text Correction
 def correct_text(df, columns_to_correct):
     """Function to correct response to open_ended responses.
+    Only English answers are corrected, see 'english_answers'. Each distinct answer is
+    corrected once, and every answer keeps the correction of its own text.
 
     Parameters
     ----------
@@ -139,19 +215,27 @@ def correct_text(df, columns_to_correct):
     Returns
     -------
     df : Pandas DataFrame
-        The DataFrame with corrected text values.
+        A new DataFrame with corrected text values, the input is not modified.
     """
+    df = df.copy(deep=False)
     # Iterate over the columns
     for column in columns_to_correct:
-        # Apply the text correction operation using TextBlob if row isn't missing
-        df[column] = df[column].apply(lambda x: str(TextBlob(x).correct()) if not pd.isna(x) else x)
+        # Apply the text correction operation using TextBlob if the answer is in English
+        to_correct = english_answers(df, column)
+        corrected = df[column].copy()
+        answers = corrected[to_correct]
+        corrections = {text: str(TextBlob(text).correct()) for text in answers.unique()}
+        corrected[to_correct] = answers.map(corrections)
+        # the column is replaced, not written into, so the input keeps its answers
+        df[column] = corrected
     return df
 
 
 # section 4: Sentiment Analysis
-def perform_sentiment_analysis(df, columns_to_analyze):
+def perform_sentiment_analysis(df, columns_to_analyze, text_cache=None):
     """Function to perform sentiment analysis on specified columns of a DataFrame and categorize the sentiment.
     This works with the 'categorize_sentiment' function.
+    Only English answers are analyzed, the others get a missing sentiment.
 
     Parameters
     ----------
@@ -159,20 +243,26 @@ def perform_sentiment_analysis(df, columns_to_analyze):
         The DataFrame containing the columns to analyze.
     columns_to_analyze : list
         List of column names to perform sentiment analysis on.
+    text_cache : TextCache, optional
+        The per-request cache of parsed answers, so each distinct answer is only analyzed once.
 
     Returns
     -------
     df : Pandas DataFrame
-        The DataFrame with the sentiment analysis results added as new columns.
+        A new DataFrame with the sentiment analysis results added as new columns.
     sentiment_columns: list
         This is a list of the sentiment columns for plotting
     """
+    df = df.copy(deep=False)
+    if text_cache is None:
+        text_cache = TextCache()
     sentiment_columns = []
     for column in columns_to_analyze:
         new_column = column + "_sentiment"
         sentiment_columns.append(new_column)
-        df[new_column] = df[column].apply(
-            lambda x: categorize_sentiment(TextBlob(str(x)).sentiment.polarity) if not pd.isna(x) else x)
+        to_analyze = english_answers(df, column)
+        df[new_column] = df.loc[to_analyze, column].apply(
+            lambda x: categorize_sentiment(text_cache.get(str(x)).blob.sentiment.polarity))
 
     return df, sentiment_columns
 
@@ -313,8 +403,44 @@ def get_quest_id(df_meta, column):
 
 
 # SECTION 4 Revamped: Plot Data Based on Category
+def compute_summary_charts_data(df, response_metadata):
+    """Function to compute the survey level charts data, the ones that don't depend on a question.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data
+    response_metadata: dataframe
+        The quest response metadata
+
+    Returns
+    -------
+    charts: list
+    """
+    charts = []
+
+    # compute line chart for daily response, from the submission time of each respondent
+    charts.append(get_daily_response_count_data(response_metadata))
+
+    # response_metadata has one row per respondent, its counts are shared by the location charts
+    respondents = AggregationContext(response_metadata)
+
+    # compute chart for distribution of respondent by city
+    charts.append(analyze_city(respondents.df, value_counts=respondents.value_counts('city')))
+
+    # compute chart for distribution of respondent by country
+    charts.append(analyze_country(respondents.df, value_counts=respondents.value_counts('country')))
+
+    # compute chart for distribution of respondent by region
+    charts.append(analyze_region(respondents.df, value_counts=respondents.value_counts('region')))
+
+    return charts
+
+
 def compute_charts_data(categorical_variables, sentiment_columns, 
-                        numeric_variables, open_questions, df, df_meta, response_metadata):
+                        numeric_variables, open_questions, df, df_meta, response_metadata,
+                        language_columns=None, keyword_columns=None,
+                        numeric_summaries=False, skip_wordcloud=False, context=None, answer_clusters=None):
     """Function to compute charts data based on the category of the survey question
 
     Parameters
@@ -333,36 +459,45 @@ def compute_charts_data(categorical_variables, sentiment_columns,
         The quest survey metadata
     response_metadata: dataframe
         The quest response metadata
+    language_columns: list, optional
+        This contains the detected languages of open_ended question categories.
+    keyword_columns: list, optional
+        This contains the keywords of open_ended question categories.
+    numeric_summaries: bool
+        If True, the numeric charts are sent as summaries instead of raw values.
+    skip_wordcloud: bool
+        If True, the word clouds are not computed.
+    context: AggregationContext, optional
+        The cache of the column aggregates of df. A new one is used by default.
+    answer_clusters: dict, optional
+        The representatives of the near-duplicate open_ended answers, for the common answers charts.
     """
-    # create a list to store all the charts
-    charts = []
-
-    # compute line chart for daily response
-    charts.append(get_daily_response_count_data(df))
-
-    # compute chart for distribution of respondent by city
-    charts.append(analyze_city(response_metadata))
+    # create a list to store all the charts, starting with the survey level charts
+    charts = compute_summary_charts_data(df, response_metadata)
 
-    # compute chart for distribution of respondent by country
-    charts.append(analyze_country(response_metadata))
-
-    # compute chart for distribution of respondent by region
-    charts.append(analyze_region(response_metadata))
-
-    # Convert the datatype of all the column in the categorical list to the categorical datatype
+    # Convert the datatype of all the column in the categorical list to the categorical datatype,
+    # on a shallow copy so the input keeps its columns
+    df = df.copy(deep=False)
     for i in categorical_variables:
         df[i] = df[i].astype('category')
 
-    # if categorical list is not empty, plot bar graphs & pie charts.
+    # every column is counted once, for all the charts that need it
+    if context is None:
+        context = AggregationContext(df)
+
+    # if categorical list is not empty, plot bar graphs & pie charts (only for a few classes).
     if len(categorical_variables) != 0:
         for column in categorical_variables:
             quest_id = get_quest_id(df_meta, column)
             charts.append(compute_bar_graph_data(series=df[column],
                                            title=column,
-                                           survey_item_id=quest_id))
-            charts.append(compute_pie_chart_data(series=df[column],
-                                           title=column,
-                                           survey_item_id=quest_id))
+                                           survey_item_id=quest_id,
+                                           value_counts=context.value_counts(column)))
+            if context.class_count(column) < PIE_CHART_MAX_CLASSES:
+                charts.append(compute_pie_chart_data(series=df[column],
+                                               title=column,
+                                               survey_item_id=quest_id,
+                                               value_counts=context.value_counts(column)))
 
     # if sentiment_columns list is not empty, plot bar graphs & pie charts.
     if len(sentiment_columns) != 0:
@@ -371,13 +506,24 @@ def compute_charts_data(categorical_variables, sentiment_columns,
             quest_id = get_quest_id(df_meta, column[:-10])
             charts.append(compute_bar_graph_data(series=df[column],
                                            title=column,
-                                           survey_item_id=quest_id))
+                                           survey_item_id=quest_id,
+                                           value_counts=context.value_counts(column)))
             # charts.append(compute_pie_chart_data(series=df[column],
             #                                title=column,
             #                                survey_item_id=quest_id))
 
     # if numeric list is not empty, plot histogram, boxplot and violin plot graphs.
-    if len(numeric_variables) != 0:
+    if len(numeric_variables) != 0 and numeric_summaries:
+        for column in numeric_variables:
+            quest_id = get_quest_id(df_meta, column)
+            charts.append(compute_histogram_summary_data(data=context.numeric_values(column),
+                                                         title=column,
+                                                         survey_item_id=quest_id))
+            charts.append(compute_box_plot_summary_data(data=df[column],
+                                                        title=column,
+                                                        survey_item_id=quest_id,
+                                                        summary=context.numeric_summary(column)))
+    elif len(numeric_variables) != 0:
         for column in numeric_variables:
             quest_id = get_quest_id(df_meta, column)
             charts.append(compute_histogram_data(data=df[column],
@@ -391,18 +537,303 @@ def compute_charts_data(categorical_variables, sentiment_columns,
                                                 survey_item_id=quest_id))
 
     # if there are open_questions, plot wordcloud
-    if len(open_questions) != 0:
+    if len(open_questions) != 0 and not skip_wordcloud:
         for column in open_questions:
             # Get the quest_item_id
             quest_id = get_quest_id(df_meta, column)
-            # add wordcloud to the charts
+            # add wordcloud to the charts, reusing the extracted words if there are any
+            words = get_answer_words(df, column) if column + "_words" in df.columns else None
             charts.append(compute_wordcloud_data(data=df[column],
                                            title=column,
-                                           survey_item_id=quest_id))
+                                           survey_item_id=quest_id,
+                                           words=words))
+
+    # if the open_ended answers were clustered, plot bar graphs of the most common answers.
+    if answer_clusters:
+        for column, representatives in answer_clusters.items():
+            quest_id = get_quest_id(df_meta, column)
+            charts.append(compute_common_answers_data(representatives=representatives,
+                                                      title=column + "_common_answers",
+                                                      survey_item_id=quest_id))
+
+    # if keyword_columns list is not empty, plot bar graphs of the most common keywords.
+    if keyword_columns:
+        for column in keyword_columns:
+            # remove the '_keywords' from column name to get the original column & quest_id
+            quest_id = get_quest_id(df_meta, column[:-9])
+            charts.append(compute_bar_graph_data(series=df[column].explode().dropna(),
+                                                 title=column,
+                                                 survey_item_id=quest_id))
+
+    # if language_columns list is not empty, plot bar graphs of the detected languages.
+    if language_columns:
+        for column in language_columns:
+            # remove the '_language' from column name to get the original column & quest_id
+            quest_id = get_quest_id(df_meta, column[:-9])
+            charts.append(compute_bar_graph_data(series=df[column],
+                                                 title=column,
+                                                 survey_item_id=quest_id,
+                                                 value_counts=context.value_counts(column)))
 
     return charts
 
 
+def compute_scaling_charts_data(scaling_variables, df, df_meta, response_metadata):
+    """Function to compute the radar chart and the trend lines of the scaling questions.
+
+    Parameters
+    ----------
+    scaling_variables: list
+        This contains all the scaling questions in the survey.
+    df: dataframe
+        This is the quest survey data
+    df_meta: dataframe
+        The quest survey metadata
+    response_metadata: dataframe
+        The quest response metadata, with the submission time of each respondent
+
+    Returns
+    -------
+    summary: list
+        The mean, the distribution and the NPS-style score of each scaling question.
+    charts: list
+    """
+    created_at = response_metadata['created_at'].reindex(df.index)
+    survey_item_ids = {column: get_quest_id(df_meta, column) for column in scaling_variables}
+    return analyze_scaling_questions(df, scaling_variables, created_at=created_at,
+                                     survey_item_ids=survey_item_ids, scales=read_metadata_scales(df_meta))
+
+
+def compute_correlation_charts_data(categorized_questions, df, df_meta):
+    """Function to compute the correlation heatmaps of the numeric & scaling questions
+    and the association heatmap of the categorical questions.
+
+    Parameters
+    ----------
+    categorized_questions: dict
+        The output of 'categorize_survey_questions'.
+    df: dataframe
+        This is the quest survey data
+    df_meta: dataframe
+        The quest survey metadata
+
+    Returns
+    -------
+    charts: list
+    """
+    numeric_variables = categorized_questions.get('numeric', [])
+    scaling_variables = categorized_questions.get('scaling', [])
+    categorical_variables = categorized_questions.get('categorical', [])
+    survey_item_ids = {column: get_quest_id(df_meta, column)
+                       for column in numeric_variables + scaling_variables + categorical_variables}
+    return analyze_correlations(df, numeric_variables, scaling_variables, categorical_variables,
+                                survey_item_ids=survey_item_ids)
+
+
+def compute_temporal_charts_data(categorical_variables, sentiment_columns, df, df_meta, response_metadata,
+                                 period=None):
+    """Function to compute the hour-of-week heatmap, and the answer distributions and
+    sentiment shares per period (day, week or month).
+
+    Parameters
+    ----------
+    categorical_variables: list
+        This contains all the categorical variable in the survey.
+    sentiment_columns: list
+        This contains all the sentiments of open_ended question categories.
+    df: dataframe
+        This is the quest survey data
+    df_meta: dataframe
+        The quest survey metadata
+    response_metadata: dataframe
+        The quest response metadata, with the submission time of each respondent
+    period: str, optional
+        One of PERIOD_FORMATS. The default depends on the span of the submissions.
+
+    Returns
+    -------
+    charts: list
+    """
+    created_at = response_metadata['created_at'].reindex(df.index)
+    survey_item_ids = {column: get_quest_id(df_meta, column)
+                       for column in list(categorical_variables) + [column[:-10] for column in sentiment_columns]}
+    return analyze_trends(df, created_at, categorical_variables, sentiment_columns, period=period,
+                          survey_item_ids=survey_item_ids)
+
+
+# Section 4b: Lazy Charts
+# The plot types available for each category of survey question
+PLOT_TYPES = {'categorical': ['bar_graph', 'pie_chart'],
+              'numeric': ['histogram', 'violin_plot', 'boxplot'],
+              'open_ended': ['wordcloud', 'sentiment_bar_graph', 'language_bar_graph', 'common_answers_bar_graph']}
+
+
+def get_plot_types(category, class_count, plan=None):
+    """Function to get the plot types available for a question.
+    Like in 'compute_charts_data', a pie chart is only available for fewer than PIE_CHART_MAX_CLASSES answers,
+    and the degradations of the plan leave out the violin plots (numeric summaries) and the word clouds.
+
+    Parameters
+    ----------
+    category: str
+        One of the categories of PLOT_TYPES.
+    class_count: int
+        The number of distinct answers of the question.
+    plan: dict, optional
+        The output of 'plan_degradations'. The default is no degradation.
+
+    Returns
+    -------
+    plot_types: list
+    """
+    unavailable = set()
+    if category == 'categorical' and class_count >= PIE_CHART_MAX_CLASSES:
+        unavailable.add('pie_chart')
+    if plan is not None and plan['numeric_summaries']:
+        unavailable.add('violin_plot')
+    if plan is not None and plan['skip_wordcloud']:
+        unavailable.add('wordcloud')
+    return [plot_type for plot_type in PLOT_TYPES[category] if plot_type not in unavailable]
+
+
+def compute_chart_descriptors(categorized_questions, df_meta, context, plan=None):
+    """Function to describe the charts available for each question, without computing them.
+    The front-end requests a chart with its survey_item_id and plot_type.
+
+    Parameters
+    ----------
+    categorized_questions: dict
+        The output of 'categorize_survey_questions'.
+    df_meta: dataframe
+        The quest survey metadata
+    context: AggregationContext
+        The cache of the column aggregates of the survey data, the answers of the questions are counted with it.
+    plan: dict, optional
+        The output of 'plan_degradations'. The default is no degradation.
+
+    Returns
+    -------
+    descriptors: list
+    """
+    descriptors = []
+    for category in PLOT_TYPES:
+        for column in categorized_questions.get(category, []):
+            descriptors.append({'question': column,
+                                'category': category,
+                                'survey_item_id': get_quest_id(df_meta, column),
+                                'plot_types': get_plot_types(category, context.class_count(column), plan)})
+    return descriptors
+
+
+def compute_single_chart(df, df_meta, categorized_questions, survey_item_id, plot_type, corrected_text=None,
+                         text_df=None, context=None, text_flight=None, plan=None):
+    """Function to compute the data of a single chart on demand.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data, it is not modified.
+    df_meta: dataframe
+        The quest survey metadata
+    categorized_questions: dict
+        The output of 'categorize_survey_questions'.
+    survey_item_id: str
+        id associated with the quest survey question
+    plot_type: str
+        One of the plot types of the question, see 'get_plot_types'.
+    corrected_text: dict, optional
+        Cache of the corrected open_ended columns (with their detected language),
+        so a column is only corrected once.
+    text_df: dataframe, optional
+        The survey data the corrected text is cached for, when 'df' is only a subset
+        of its respondents (eg., a segment). The default is 'df'.
+    context: AggregationContext, optional
+        The cache of the column aggregates of df, shared by the charts of a question.
+    text_flight: SingleFlight, optional
+        The concurrent corrections of the same question are coalesced with it, so a
+        column shared between threads is still only corrected once.
+    plan: dict, optional
+        The output of 'plan_degradations', the numeric charts are then summaries. The default is no degradation.
+
+    Returns
+    -------
+    chart: dict
+    """
+    # find the question and its category
+    question, category = None, None
+    for candidate_category in PLOT_TYPES:
+        for column in categorized_questions.get(candidate_category, []):
+            if get_quest_id(df_meta, column) == str(survey_item_id):
+                question, category = column, candidate_category
+    if question is None:
+        raise ValueError(f"Unknown survey_item_id '{survey_item_id}'.")
+    if plot_type not in PLOT_TYPES[category]:
+        raise ValueError(f"Plot type '{plot_type}' is not available for a {category} question.")
+    if plot_type == 'pie_chart':
+        class_count = context.class_count(question) if context is not None else df[question].nunique()
+        if plot_type not in get_plot_types(category, class_count):
+            raise ValueError(f"Plot type 'pie_chart' is not available for a question with {class_count} answers, "
+                             f"use 'bar_graph'.")
+    if plot_type not in get_plot_types(category, 0, plan):
+        raise ValueError(f"Plot type '{plot_type}' is not available for this survey, it is over the request limits.")
+
+    if category == 'categorical':
+        series = df[question].astype('category')
+        value_counts = context.value_counts(question) if context is not None else None
+        if plot_type == 'bar_graph':
+            return compute_bar_graph_data(series=series, title=question, survey_item_id=survey_item_id,
+                                          value_counts=value_counts)
+        return compute_pie_chart_data(series=series, title=question, survey_item_id=survey_item_id,
+                                      value_counts=value_counts)
+
+    if category == 'numeric' and plan is not None and plan['numeric_summaries']:
+        if plot_type == 'histogram':
+            values = context.numeric_values(question) if context is not None else df[question]
+            return compute_histogram_summary_data(data=values, title=question, survey_item_id=survey_item_id)
+        return compute_box_plot_summary_data(data=df[question], title=question, survey_item_id=survey_item_id,
+                                             summary=context.numeric_summary(question) if context is not None else None)
+
+    if category == 'numeric':
+        builders = {'histogram': compute_histogram_data,
+                    'violin_plot': compute_violin_plot_data,
+                    'boxplot': compute_box_plot_data}
+        return builders[plot_type](data=df[question], title=question, survey_item_id=survey_item_id)
+
+    if plot_type == 'common_answers_bar_graph':
+        return compute_common_answers_data(representatives=cluster_open_answers(df, [question])[question],
+                                           title=question + "_common_answers",
+                                           survey_item_id=survey_item_id)
+
+    # open_ended questions are charted on the corrected text
+    if corrected_text is None:
+        corrected_text = {}
+    if question not in corrected_text:
+        def correct():
+            # another request may have corrected the question in the meantime
+            if question not in corrected_text:
+                source = df if text_df is None else text_df
+                text, language_columns = add_language_columns(source[[question]], [question])
+                corrected_text[question] = correct_text(text, [question])
+            return corrected_text[question]
+
+        if text_flight is None:
+            correct()
+        else:
+            text_flight.do(question, correct)
+    # reindex returns a copy with the respondents of df only
+    text = corrected_text[question].reindex(df.index)
+    if plot_type == 'wordcloud':
+        return compute_wordcloud_data(data=text[question], title=question, survey_item_id=survey_item_id)
+    if plot_type == 'language_bar_graph':
+        return compute_bar_graph_data(series=text[question + "_language"],
+                                      title=question + "_language",
+                                      survey_item_id=survey_item_id)
+    text, sentiment_columns = perform_sentiment_analysis(text, [question])
+    return compute_bar_graph_data(series=text[sentiment_columns[0]],
+                                  title=sentiment_columns[0],
+                                  survey_item_id=survey_item_id)
+
+
 # Section 5: GeoJSON Data
 def create_geojson(response_metadata, id_field, latitude_field, longitude_field):
     """
@@ -500,37 +931,346 @@ def count_invalid_responses(survey_dataframe, invalid_values=['N/A', 'Unknown'])
     return invalid_responses
 
 
-# def count_profanities(survey_dataframe, text_columns=open_ended):
-#     """Function to get the number of invalid responses in a survey.
-#     Some examples are ['N/A', 'Unknown']
-#
-#     Parameters
-#     ----------
-#     survey_dataframe, dataframe
-#         This is the survey dataframe.
-#     text_columns, list
-#         This contains the list of columns to check. The default is the open_ended question list
-#
-#     Return
-#     ------
-#        count, int
-#     """
-#     count = 0
-#     if len(text_columns) != 0:
-#         # Iterate over the specified text columns
-#         for column in text_columns:
-#             # Iterate over the rows of the DataFrame
-#             for _, row in survey_dataframe.iterrows():
-#                 text = str(row[column])
-#                 # if text is not a missing value, continue
-#                 if text == np.nan:
-#                     continue
-#                 else:
-#                     # Use the profanity-check library to predict profanity
-#                     profanity_prediction = predict([text])
-#
-#                     # If profanity is detected, increment the count
-#                     if profanity_prediction[0] == 1:
-#                         count += 1
-#
-#     return count
+def compute_quick_stats(survey_dataframe, invalid_values=['N/A', 'Unknown']):
+    """Function to compute all the quick analysis metrics in a single scan of the survey.
+    Each column is read once from its underlying numpy buffer. Object columns are
+    factorized once and everything else is computed on the integer codes,
+    so no boolean mask or masked copy of the whole DataFrame is built.
+
+    Parameters
+    ----------
+    survey_dataframe: dataframe
+        This is the survey dataframe.
+    invalid_values: list
+        This contains the invalid values. The default value is ['N/A', 'Unknown'].
+
+    Return
+    ------
+    quick_stats: dict
+        'invalid_responses', 'missing_responses' and 'completion_rate' for the whole survey,
+        'response_counts' per question and 'respondent_completeness' (a Series) per respondent.
+    """
+    n_rows, n_columns = survey_dataframe.shape
+    answered_per_respondent = np.zeros(n_rows, dtype='int64')
+    response_counts = {}
+    invalid_responses = 0
+
+    for column in survey_dataframe.columns:
+        series = survey_dataframe[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # the category codes are already there, -1 marks a missing value
+            codes = series.cat.codes.to_numpy()
+            categories = series.cat.categories
+        elif series.dtype == object:
+            codes, categories = pd.factorize(series.to_numpy())
+        else:
+            codes, categories = None, None
+
+        if codes is None:
+            values = series.to_numpy()
+            present = ~pd.isna(values)
+            invalid = int(np.isin(values[present], invalid_values).sum())
+        else:
+            present = codes >= 0
+            invalid_codes = np.flatnonzero(pd.Index(categories).isin(invalid_values))
+            invalid = 0
+            if len(invalid_codes):
+                invalid = int(np.bincount(codes[present], minlength=len(categories))[invalid_codes].sum())
+
+        answered_per_respondent += present
+        response_counts[column] = int(present.sum())
+        invalid_responses += invalid
+
+    total_cells = n_rows * n_columns
+    missing_responses = total_cells - int(answered_per_respondent.sum())
+    completion_rate = None
+    if total_cells:
+        completion_rate = round(100 - (missing_responses / total_cells * 100), 2)
+    respondent_completeness = pd.Series(answered_per_respondent / max(n_columns, 1),
+                                        index=survey_dataframe.index, name='completeness')
+
+    return {'invalid_responses': invalid_responses,
+            'missing_responses': missing_responses,
+            'completion_rate': completion_rate,
+            'response_counts': response_counts,
+            'respondent_completeness': respondent_completeness}
+
+
+def count_profanities(survey_dataframe, text_columns):
+    """Function to get the number of profanities in the open_ended responses of a survey.
+    The answers are matched against the bundled word list of 'profanity_filter'.
+
+    Parameters
+    ----------
+    survey_dataframe: dataframe
+        This is the survey dataframe.
+    text_columns: list
+        This contains the list of columns to check, usually the open_ended question list.
+
+    Return
+    ------
+    count: int
+        The number of profanities in all the columns.
+    counts_per_question: dict
+        The number of profanities in each column.
+    """
+    counts_per_question = {column: count_profanity_matches(survey_dataframe[column]) for column in text_columns}
+    count = sum(counts_per_question.values())
+    return count, counts_per_question
+
+
+# Section 7: Full Analysis Pipeline
+def compute_quick_analysis(df, response_metadata, open_questions=None):
+    """Function to compute the quick analysis shown at the top of the survey report.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data
+    response_metadata: dataframe
+        The quest response metadata
+    open_questions: list, optional
+        This contains all the open ended questions in the survey, they are checked for profanities.
+
+    Returns
+    -------
+    analysis_result: dict
+    """
+    profanity_count, profanities_per_question = count_profanities(survey_dataframe=df,
+                                                                  text_columns=open_questions or [])
+    quick_stats = compute_quick_stats(survey_dataframe=df)
+    # the average number of questions answered by a respondent
+    average_responses = round(sum(quick_stats['response_counts'].values()) / max(len(df), 1), 2)
+    average_quest_completion_time = average_response_time(response_metadata=response_metadata)
+
+    return {'number of responses': str(len(df)),
+            'average_quest_completion_time': str(average_quest_completion_time),
+            'completeness_rate': str(quick_stats['completion_rate']),
+            'average_responses': str(average_responses),
+            'invalid_responses': str(quick_stats['invalid_responses']),
+            'profanities': str(profanity_count),
+            'profanities_per_question': {column: str(count) for column, count in profanities_per_question.items()}}
+
+
+def get_default_segments(df_meta, categorized_questions):
+    """Function to get the columns the answers are broken down by, by default.
+    These are the profiling questions (eg., Gender, Age) and the respondent location.
+    Only the profiling questions that 'categorize_survey_questions' found categorical
+    (below its cardinality threshold) or numeric are used, the others (eg., names)
+    would give a segment per respondent.
+
+    Parameters
+    ----------
+    df_meta: dataframe
+        The quest survey metadata
+    categorized_questions: dict
+        The output of 'categorize_survey_questions'.
+
+    Returns
+    -------
+    segment_columns: list
+    """
+    segment_questions = set(categorized_questions.get('categorical', []) + categorized_questions.get('numeric', []))
+    profiling = df_meta.loc[df_meta['type'] == 'profiling', 'question'].tolist()
+    return [question for question in profiling if question in segment_questions] + ['country', 'region']
+
+
+def compute_segment_charts_data(categorical_variables, sentiment_columns, numeric_variables,
+                                df, df_meta, response_metadata, segment_columns=None):
+    """Function to compute the grouped bar graphs and grouped histograms of the survey.
+
+    Parameters
+    ----------
+    categorical_variables: list
+        This contains all the categorical variable in the survey.
+    sentiment_columns: list
+        This contains all the sentiments of open_ended question categories.
+    numeric_variables: list
+        This contains all the numeric variable in the survey.
+    df: dataframe
+        This is the quest survey data
+    df_meta: dataframe
+        The quest survey metadata
+    response_metadata: dataframe
+        The quest response metadata
+    segment_columns: list, optional
+        The columns to break the answers down by. The default is 'get_default_segments'.
+
+    Returns
+    -------
+    charts: list
+    """
+    if segment_columns is None:
+        segment_columns = get_default_segments(df_meta, {'categorical': categorical_variables,
+                                                         'numeric': numeric_variables})
+    segment_frame = build_segment_frame(df, response_metadata, segment_columns)
+    # the sentiment columns share the survey_item_id of their question
+    survey_item_ids = {column: get_quest_id(df_meta, column)
+                       for column in categorical_variables + numeric_variables}
+    survey_item_ids.update({column: get_quest_id(df_meta, column[:-10]) for column in sentiment_columns})
+    return compute_crosstabs(df, categorical_variables + sentiment_columns, numeric_variables,
+                             segment_frame, survey_item_ids=survey_item_ids)
+
+
+def sample_open_answers(df, open_questions, sample_size):
+    """Function to keep the open_ended answers of a random sample of respondents only, for the text steps.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data, it is not modified.
+    open_questions: list
+    sample_size: int
+        The number of respondents that keep their open_ended answers.
+
+    Returns
+    -------
+    df: dataframe
+        A new DataFrame, the open_ended answers of the other respondents are missing.
+    """
+    sampled = df.index.isin(df.sample(n=min(sample_size, len(df)), random_state=0).index)
+    df = df.copy(deep=False)
+    for column in open_questions:
+        df[column] = df[column].where(sampled)
+    return df
+
+
+def run_quest_analysis(quest_data, quest_metadata, quest_id, segment_columns=None, geo_zoom=6,
+                       limits=None, upload_bytes=None, dedup='latest', exclude_flagged=False, period=None,
+                       skip_text=False):
+    """Function to run the whole analysis pipeline on a single quest survey.
+    This is what the API and the batch runner call for every survey.
+
+    Parameters
+    ----------
+    quest_data: Pandas DataFrame
+        The raw quest survey responses.
+    quest_metadata: Pandas DataFrame
+        The raw quest survey metadata.
+    quest_id: str
+        The unique id of the quest survey.
+    segment_columns: list, optional
+        The columns to break the answers down by. The default is 'get_default_segments'.
+    geo_zoom: int
+        The map zoom level of the geography heatmap tiles.
+    limits: RequestLimits, optional
+        The limits above which the analysis is degraded. The default is no limit.
+    upload_bytes: int, optional
+        The size of the upload, checked against the limits.
+    dedup: str
+        How duplicate answers of a respondent are resolved, see 'build_respondent_index'.
+    exclude_flagged: bool
+        If True, the speeders, straight-liners and duplicate submissions are left out of the analysis.
+    period: str, optional
+        The period of the trends, one of PERIOD_FORMATS. The default depends on the span of the submissions.
+    skip_text: bool
+        If True, the text steps are skipped and the open_ended questions get no chart, eg., for a preview
+        that is over its time budget.
+
+    Returns
+    -------
+    result: dict
+        The quick analysis, the charts data and the GeoJSON data of the survey,
+        with the respondent quality and the degradations that were applied.
+    """
+    # read quest survey data and metadata
+    df, df_meta, response_meta = parse_quest_data(quest_data, quest_metadata, dedup=dedup)
+    # Categorize survey questions
+    categorized_questions = categorize_survey_questions(df, df_meta)
+
+    # Flag the low quality respondents, and leave them out before anything is computed
+    quality = score_respondents(df, response_meta, categorized_questions.get('scaling'),
+                                open_ended_columns=categorized_questions.get('open_ended'))
+    if exclude_flagged:
+        df = df.loc[~quality['flagged']]
+        response_meta = response_meta.loc[df.index]
+
+    # Perform Quick Analysis
+    analysis_result = compute_quick_analysis(df, response_meta, categorized_questions.get('open_ended'))
+
+    # Decide which steps are degraded for a survey above the limits
+    plan = plan_degradations(limits, df, upload_bytes=upload_bytes)
+    if plan['text_sample_size'] is not None:
+        # only a random sample of respondents keeps its open_ended answers for the text steps
+        df = sample_open_answers(df, categorized_questions.get('open_ended'), plan['text_sample_size'])
+    if skip_text:
+        plan['skip_text'] = True
+        plan['reasons'].append("the text steps are over the time budget")
+    open_questions = [] if skip_text else categorized_questions.get('open_ended')
+
+    # detect the language of the open_ended answers, only English answers are corrected & analyzed
+    df, language_columns = add_language_columns(df=df,
+                                                columns_to_detect=open_questions)
+    # cluster the near-duplicate open_ended answers, for the common answers charts only:
+    # near-duplicates can differ in meaning (eg., "liked" and "disliked"), so every answer
+    # keeps its own text for the text steps
+    answer_clusters = cluster_open_answers(df, open_questions)
+    # correct texts in open_ended questions
+    df = correct_text(df=df,
+                      columns_to_correct=open_questions)
+    # extract the words, sentences and keywords, every answer is parsed once for all the text steps
+    text_cache = TextCache()
+    df, keyword_columns = extract_text_features(df=df,
+                                                columns_to_extract=open_questions,
+                                                text_cache=text_cache)
+    # perform sentiment analysis, the text cache analyzes each distinct corrected answer once
+    df, sentiment_columns = perform_sentiment_analysis(df=df,
+                                                       columns_to_analyze=open_questions,
+                                                       text_cache=text_cache)
+
+    # Generate charts data based on category
+    charts = compute_charts_data(categorized_questions.get('categorical'),
+                                 sentiment_columns,
+                                 categorized_questions.get('numeric'),
+                                 open_questions,
+                                 df,
+                                 df_meta,
+                                 response_meta,
+                                 language_columns=language_columns,
+                                 keyword_columns=keyword_columns,
+                                 numeric_summaries=plan['numeric_summaries'],
+                                 skip_wordcloud=plan['skip_wordcloud'],
+                                 answer_clusters=answer_clusters
+                                 )
+
+    # Compute the radar chart and trend lines of the scaling questions
+    scaling_summary, scaling_charts = compute_scaling_charts_data(categorized_questions.get('scaling'),
+                                                                  df,
+                                                                  df_meta,
+                                                                  response_meta)
+    charts.extend(scaling_charts)
+
+    # Compute the correlations and associations across the questions
+    charts.extend(compute_correlation_charts_data(categorized_questions, df, df_meta))
+
+    # Compute the hour-of-week heatmap and the trends of the answers and sentiments
+    charts.extend(compute_temporal_charts_data(categorized_questions.get('categorical'),
+                                               sentiment_columns,
+                                               df,
+                                               df_meta,
+                                               response_meta,
+                                               period=period))
+
+    # Break the answers down by segment
+    segment_charts = compute_segment_charts_data(categorized_questions.get('categorical'),
+                                                 sentiment_columns,
+                                                 categorized_questions.get('numeric'),
+                                                 df,
+                                                 df_meta,
+                                                 response_meta,
+                                                 segment_columns=segment_columns)
+
+    # Generate GeoJSON data
+    result_geojson = create_geojson(response_meta, "response_id", "latitude", "longitude")
+    # Aggregate the respondent locations for the geography heatmap
+    geo_heatmap = compute_geo_heatmap_data(response_meta, zoom=geo_zoom)
+
+    return {'quest_id': str(quest_id),
+            'analysis_result': analysis_result,
+            'charts': charts,
+            'scaling_summary': scaling_summary,
+            'segment_charts': segment_charts,
+            'geojson': result_geojson,
+            'geo_heatmap': geo_heatmap,
+            'respondent_quality': summarize_quality(quality, excluded=exclude_flagged),
+            'degradations': describe_degradations(plan)}
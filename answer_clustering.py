@@ -0,0 +1,190 @@
+"""This script contains the near-duplicate clustering of open_ended answers.
+
+Open_ended questions get many near-identical answers (eg., "Nah", "nah." and
+"nah!!"). Every distinct answer gets a MinHash signature of its character
+trigrams, and locality-sensitive hashing (LSH) over bands of the signatures
+only compares the answers that share a band, so the clustering runs in about
+linear time. Each cluster is represented by its most frequent answer, and the
+cluster sizes give the "common answers" of a question.
+
+The clusters are only used for that chart. Near-duplicates can have opposite
+meanings (eg., "I liked it" and "I disliked it"), so the text steps (correction
+and sentiment) run on the own text of every answer.
+"""
+
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+
+# Number of hash functions of a MinHash signature
+NUM_PERMUTATIONS = 64
+# The signatures are split in this many bands of NUM_PERMUTATIONS / LSH_BANDS rows,
+# answers that agree on a whole band are compared
+LSH_BANDS = 16
+# Smallest estimated Jaccard similarity of the trigrams of two answers of a cluster
+SIMILARITY_THRESHOLD = 0.7
+SHINGLE_SIZE = 3
+
+# The hash functions are multiply-shift hashes, the high 32 bits of a * x + b (mod 2**64),
+# a fixed seed keeps the clusters the same in every worker process
+_SEED = 7
+_NORMALIZE_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_answer(text):
+    """Function to reduce an answer to its lower case letters and digits, separated by single spaces."""
+    return _NORMALIZE_PATTERN.sub(' ', str(text).lower()).strip()
+
+
+def get_shingles(text, size=SHINGLE_SIZE):
+    """Function to get the hashed character n-grams of an answer.
+    The answer is padded with a space on both sides, so short answers have shingles too.
+
+    Parameters
+    ----------
+    text: str
+    size: int
+
+    Returns
+    -------
+    shingles: list
+        The distinct 32-bit hashes of the n-grams.
+    """
+    normalized = normalize_answer(text)
+    # an answer without letters nor digits (eg., "?!") is its own single shingle
+    padded = f" {normalized} " if normalized else str(text)
+    grams = {padded[i:i + size] for i in range(max(len(padded) - size + 1, 1))}
+    return [zlib.crc32(gram.encode('utf-8')) for gram in grams]
+
+
+def _random_words(size, stream, odd=False):
+    # random 64-bit integers, always the same for a size and a stream
+    words = np.random.RandomState([_SEED, stream]).randint(0, 1 << 32, size=(size, 2)).astype('uint64')
+    words = (words[:, 0] << np.uint64(32)) | words[:, 1]
+    return words | np.uint64(1) if odd else words
+
+
+def compute_minhash_signatures(texts, num_permutations=NUM_PERMUTATIONS):
+    """Function to compute the MinHash signatures of answers.
+
+    Parameters
+    ----------
+    texts: list
+        The distinct answers.
+    num_permutations: int
+
+    Returns
+    -------
+    signatures: numpy array
+        One row of num_permutations hashes per answer.
+    """
+    shingles = [get_shingles(text) for text in texts]
+    lengths = np.array([len(hashes) for hashes in shingles])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    hashes = np.fromiter((h for answer in shingles for h in answer), dtype='uint64', count=int(lengths.sum()))
+
+    a, b = _random_words(num_permutations, 0, odd=True), _random_words(num_permutations, 1)
+
+    # one pass over all the shingles per hash function, the minimum of each answer
+    # is taken with reduceat over the answer boundaries
+    signatures = np.empty((len(texts), num_permutations), dtype='uint64')
+    for i in range(num_permutations):
+        signatures[:, i] = np.minimum.reduceat((a[i] * hashes + b[i]) >> np.uint64(32), starts)
+    return signatures
+
+
+def _find(parents, i):
+    # root of the cluster of i, with path halving
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def find_clusters(signatures, bands=LSH_BANDS, threshold=SIMILARITY_THRESHOLD):
+    """Function to cluster the answers whose signatures are similar, with LSH.
+    In every band, the answers that agree on the whole band fall in the same bucket,
+    and join the cluster of the first answer of the bucket if their estimated
+    similarity to it is above the threshold.
+
+    Parameters
+    ----------
+    signatures: numpy array
+        The output of 'compute_minhash_signatures'.
+    bands: int
+    threshold: float
+
+    Returns
+    -------
+    labels: numpy array
+        The cluster of each answer, as the position of its first answer.
+    """
+    n_answers, num_permutations = signatures.shape
+    rows = num_permutations // bands
+    parents = list(range(n_answers))
+    positions = np.arange(n_answers)
+    # the rows of a band are combined into a single 64-bit bucket key, a rare collision
+    # only adds a candidate that fails the similarity check
+    multipliers = _random_words(rows, 2, odd=True)
+    for band in range(bands):
+        keys = (signatures[:, band * rows:(band + 1) * rows] * multipliers).sum(axis=1)
+        _, first, buckets = np.unique(keys, return_index=True, return_inverse=True)
+        leaders = first[buckets]
+        candidates = positions[leaders != positions]
+        if len(candidates) == 0:
+            continue
+        similarity = (signatures[candidates] == signatures[leaders[candidates]]).mean(axis=1)
+        similar = candidates[similarity >= threshold]
+        for i, leader in zip(similar.tolist(), leaders[similar].tolist()):
+            root_i, root_leader = _find(parents, i), _find(parents, leader)
+            if root_i != root_leader:
+                parents[max(root_i, root_leader)] = min(root_i, root_leader)
+    return np.array([_find(parents, i) for i in range(n_answers)], dtype='int64')
+
+
+def cluster_answers(series, threshold=SIMILARITY_THRESHOLD):
+    """Function to replace every answer of a column with the representative of its cluster.
+    The representative is the most frequent answer of the cluster.
+
+    Parameters
+    ----------
+    series: Pandas Series
+        The answers of an open_ended question.
+    threshold: float
+        Smallest estimated similarity of two answers of a cluster.
+
+    Returns
+    -------
+    representatives: Pandas Series
+        The representative of each answer, with the index of series. Missing answers stay missing.
+    """
+    answers = series.dropna()
+    if answers.empty:
+        return pd.Series(np.nan, index=series.index, dtype=object)
+    # the distinct answers, the most frequent first, so the first answer of a cluster is its representative
+    counts = answers.value_counts(sort=True)
+    texts = counts.index.tolist()
+    # a cluster is labelled with its first answer, see 'find_clusters'
+    labels = find_clusters(compute_minhash_signatures(texts), threshold=threshold)
+    mapping = pd.Series(np.array(texts, dtype=object)[labels], index=counts.index)
+    return series.map(mapping)
+
+
+def cluster_open_answers(df, columns, threshold=SIMILARITY_THRESHOLD):
+    """Function to cluster the answers of every open_ended column, see 'cluster_answers'.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame
+    columns: list
+    threshold: float
+
+    Returns
+    -------
+    clusters: dict
+        The representatives of the answers of each column.
+    """
+    return {column: cluster_answers(df[column], threshold=threshold) for column in columns}
@@ -0,0 +1,250 @@
+"""This script contains the opt-in approximate statistics mode.
+It is meant for surveys with tens of millions of rows, which are too big to pivot in memory.
+
+The raw quest data is read in chunks and folded into a SurveySketch.
+Sketches built on different shards of the same survey can be merged,
+and serialized so the partial results can be combined somewhere else.
+"""
+
+import json
+
+import pandas as pd
+from sketches import HyperLogLog, KLLSketch, SpaceSavingSketch
+
+
+class SurveySketch:
+    """Mergeable summary of a quest survey.
+
+    The completion rate, the average completion time and the invalid response count
+    are kept as exact counters. The top values of every question, the completion time
+    quantiles and the number of distinct respondents come from sketches.
+
+    Parameters
+    ----------
+    top_k: int
+        The number of values tracked for each question.
+    quantile_k: int
+        The accuracy parameter of the quantile sketches.
+    hll_precision: int
+        The precision of the distinct respondents sketch.
+    invalid_values: list
+        The responses that are counted as invalid. The default value is ['N/A', 'Unknown'].
+    """
+
+    def __init__(self, top_k=50, quantile_k=200, hll_precision=14, invalid_values=('N/A', 'Unknown')):
+        self.top_k = top_k
+        self.quantile_k = quantile_k
+        self.invalid_values = list(invalid_values)
+        self.respondents = HyperLogLog(hll_precision)
+        self.completion_time = KLLSketch(quantile_k)
+        self.completion_time_sum = 0.0
+        self.completion_time_count = 0
+        self.answered = {}
+        self.invalid = {}
+        self.top_values = {}
+        self.numeric_values = {}
+
+    def update(self, quest_data, quest_metadata):
+        """Function to add a chunk of raw quest data to the sketch.
+
+        Parameters
+        ----------
+        quest_data: Pandas DataFrame
+            A chunk of the raw quest survey responses, one row per answer.
+        quest_metadata: Pandas DataFrame
+            The raw quest survey metadata.
+        """
+        merged_df = quest_data.merge(quest_metadata, left_on='survey_item_id', right_on='id')
+
+        self.respondents.update(merged_df['response_id'])
+
+        # the completion time is repeated on every answer of a respondent.
+        # A respondent split across two chunks is counted twice, which is fine for an estimate.
+        completion_time = pd.to_numeric(merged_df.drop_duplicates('response_id')['quest_completion_time'],
+                                        errors='coerce').dropna()
+        self.completion_time.update(completion_time)
+        self.completion_time_sum += float(completion_time.sum())
+        self.completion_time_count += len(completion_time)
+
+        for (question, question_type), answers in merged_df.groupby(['question', 'type'])['response']:
+            answers = answers.dropna()
+            self.answered[question] = self.answered.get(question, 0) + len(answers)
+            self.invalid[question] = self.invalid.get(question, 0) + int(answers.isin(self.invalid_values).sum())
+            if question_type == 'open_ended':
+                continue
+            self.top_values.setdefault(question, SpaceSavingSketch(self.top_k)).update(answers)
+            if question_type == 'profiling':
+                numbers = pd.to_numeric(answers, errors='coerce').dropna()
+                if not numbers.empty:
+                    self.numeric_values.setdefault(question, KLLSketch(self.quantile_k)).update(numbers)
+
+    def merge(self, other):
+        """Function to merge a sketch built on another shard of the survey.
+
+        Parameters
+        ----------
+        other: SurveySketch
+        """
+        self.respondents.merge(other.respondents)
+        self.completion_time.merge(other.completion_time)
+        self.completion_time_sum += other.completion_time_sum
+        self.completion_time_count += other.completion_time_count
+        for question, count in other.answered.items():
+            self.answered[question] = self.answered.get(question, 0) + count
+        for question, count in other.invalid.items():
+            self.invalid[question] = self.invalid.get(question, 0) + count
+        for question, sketch in other.top_values.items():
+            self.top_values.setdefault(question, SpaceSavingSketch(sketch.capacity)).merge(sketch)
+        for question, sketch in other.numeric_values.items():
+            self.numeric_values.setdefault(question, KLLSketch(sketch.k, sketch.c)).merge(sketch)
+
+    def summary(self):
+        """Function to get the approximate quick analysis of the survey.
+
+        Returns
+        -------
+        summary: dict
+            The approximate equivalents of 'average_response_time',
+            'calculate_completion_percentage' and 'count_invalid_responses'.
+        """
+        respondents = self.respondents.estimate()
+        total_cells = respondents * len(self.answered)
+        completion_rate = None
+        if total_cells:
+            completion_rate = round(min(100.0, sum(self.answered.values()) / total_cells * 100), 2)
+        average = None
+        if self.completion_time_count:
+            average = self.completion_time_sum / self.completion_time_count
+
+        return {'number of responses': respondents,
+                'average_quest_completion_time': average,
+                'quest_completion_time_quantiles': dict(zip(['p25', 'p50', 'p75', 'p95'],
+                                                            self.completion_time.quantiles([0.25, 0.5, 0.75, 0.95]))),
+                'completeness_rate': completion_rate,
+                'invalid_responses': sum(self.invalid.values())}
+
+    def to_dict(self):
+        return {'top_k': self.top_k,
+                'quantile_k': self.quantile_k,
+                'invalid_values': self.invalid_values,
+                'respondents': self.respondents.to_dict(),
+                'completion_time': self.completion_time.to_dict(),
+                'completion_time_sum': self.completion_time_sum,
+                'completion_time_count': self.completion_time_count,
+                'answered': self.answered,
+                'invalid': self.invalid,
+                'top_values': {q: s.to_dict() for q, s in self.top_values.items()},
+                'numeric_values': {q: s.to_dict() for q, s in self.numeric_values.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['top_k'], data['quantile_k'], invalid_values=data['invalid_values'])
+        sketch.respondents = HyperLogLog.from_dict(data['respondents'])
+        sketch.completion_time = KLLSketch.from_dict(data['completion_time'])
+        sketch.completion_time_sum = data['completion_time_sum']
+        sketch.completion_time_count = data['completion_time_count']
+        sketch.answered = dict(data['answered'])
+        sketch.invalid = dict(data['invalid'])
+        sketch.top_values = {q: SpaceSavingSketch.from_dict(s) for q, s in data['top_values'].items()}
+        sketch.numeric_values = {q: KLLSketch.from_dict(s) for q, s in data['numeric_values'].items()}
+        return sketch
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), default=str)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+
+def sketch_quest_data(quest_data_source, quest_metadata, chunksize=1_000_000, **sketch_options):
+    """Function to build a SurveySketch from a quest data CSV without loading it all in memory.
+
+    Parameters
+    ----------
+    quest_data_source: str or file-like
+        The quest survey data CSV.
+    quest_metadata: Pandas DataFrame
+        The raw quest survey metadata.
+    chunksize: int
+        The number of rows read at a time.
+    sketch_options:
+        Passed on to SurveySketch.
+
+    Returns
+    -------
+    sketch: SurveySketch
+    """
+    sketch = SurveySketch(**sketch_options)
+    for chunk in pd.read_csv(quest_data_source, chunksize=chunksize, na_values=['<NA>']):
+        sketch.update(chunk, quest_metadata)
+    return sketch
+
+
+def merge_survey_sketches(sketches):
+    """Function to combine the sketches of the shards of a survey.
+
+    Parameters
+    ----------
+    sketches: list
+        SurveySketch objects, or their serialized dictionaries.
+
+    Returns
+    -------
+    sketch: SurveySketch
+    """
+    merged = None
+    for sketch in sketches:
+        if isinstance(sketch, dict):
+            sketch = SurveySketch.from_dict(sketch)
+        if merged is None:
+            merged = sketch
+        else:
+            merged.merge(sketch)
+    return merged
+
+
+def compute_approximate_charts_data(sketch, df_meta):
+    """Function to compute bar graph data from the top values of every question.
+    The payload matches 'compute_bar_graph_data', with the count errors added.
+
+    Parameters
+    ----------
+    sketch: SurveySketch
+    df_meta: Pandas DataFrame
+        The raw quest survey metadata.
+
+    Returns
+    -------
+    charts: list
+    """
+    charts = []
+    for question, top_values in sketch.top_values.items():
+        matching_rows = df_meta.loc[df_meta['question'] == question, 'id']
+        survey_item_id = str(matching_rows.iloc[0]) if not matching_rows.empty else None
+        counts = top_values.top_k()
+        charts.append({
+            'plot_type': 'bar_graph',
+            'alternative_chart': 'horizontal_bar_graph',
+            'title': question,
+            'x_values': counts.index.tolist(),
+            'y_values': [int(count) for count in counts.tolist()],
+            'y_errors': [int(error) for error in top_values.errors.reindex(counts.index).tolist()],
+            'x_label': 'Values',
+            'y_label': 'Approximate Count',
+            'approximate': True,
+            'survey_item_id': survey_item_id
+        })
+    for question, quantiles in sketch.numeric_values.items():
+        matching_rows = df_meta.loc[df_meta['question'] == question, 'id']
+        survey_item_id = str(matching_rows.iloc[0]) if not matching_rows.empty else None
+        probabilities = [0.0, 0.25, 0.5, 0.75, 1.0]
+        charts.append({
+            'plot_type': 'boxplot',
+            'title': question,
+            'quantiles': dict(zip(['min', 'q1', 'median', 'q3', 'max'], quantiles.quantiles(probabilities))),
+            'y_label': 'Value',
+            'approximate': True,
+            'survey_item_id': survey_item_id
+        })
+    return charts
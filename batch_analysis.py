@@ -0,0 +1,259 @@
+"""This script runs the analysis engine on many quest surveys at once.
+The surveys are scheduled across a shared process pool and every result
+is streamed out (as NDJSON) as soon as its survey finishes.
+
+It can be used from the API or from the command line, eg.,
+    python batch_analysis.py --manifest surveys.ndjson --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from analysis_skeleton import run_quest_analysis
+from csv_ingest import QUEST_DATA_COLUMNS, QUEST_METADATA_COLUMNS, read_quest_csv
+from request_guardrails import RequestLimits, check_upload
+
+
+# the pool is shared by every batch in the process, so the workers are only started once
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def default_worker_count():
+    """Function to get the number of workers to use, one per core of the machine.
+
+    Returns
+    -------
+    count: int
+    """
+    return os.cpu_count() or 1
+
+
+def get_worker_pool(max_workers=None):
+    """Function to get the shared process pool, creating it on the first call.
+
+    Parameters
+    ----------
+    max_workers: int, optional
+        The number of worker processes. The default is one per core.
+
+    Returns
+    -------
+    pool: ProcessPoolExecutor
+    """
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = ProcessPoolExecutor(max_workers=max_workers or default_worker_count())
+        return _worker_pool
+
+
+def shutdown_worker_pool(pool=None):
+    """Function to stop the shared process pool, if it was started.
+    The next 'get_worker_pool' call then starts a new pool.
+
+    Parameters
+    ----------
+    pool: ProcessPoolExecutor, optional
+        Only stop the shared pool if it is still this one, eg., after it broke.
+        The default is to stop the shared pool whichever it is.
+    """
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is not None and (pool is None or _worker_pool is pool):
+            # a broken pool has no live workers left to wait for
+            _worker_pool.shutdown(wait=pool is None)
+            _worker_pool = None
+
+
+def get_source_size(source):
+    """Function to get the size of a survey file, without reading it.
+
+    Parameters
+    ----------
+    source: bytes or str
+        The raw content of the CSV file, or the path to the CSV file.
+
+    Returns
+    -------
+    size: int
+        The number of bytes.
+    """
+    return len(source) if isinstance(source, bytes) else os.path.getsize(source)
+
+
+def analyze_single_quest(job, limits=None):
+    """Function to analyze one quest survey of a batch. It runs inside a worker process.
+
+    Parameters
+    ----------
+    job: dict
+        It has the 'quest_id', 'quest_data' and 'quest_metadata' keys.
+        The data and metadata are either the CSV content (bytes) or a path.
+    limits: RequestLimits, optional
+        The limits of 'run_quest_analysis', a survey over the hard upload limit is not read.
+
+    Returns
+    -------
+    record: dict
+        The status, the timing and the analysis result (or the error) of the survey.
+    """
+    start = time.perf_counter()
+    quest_id = str(job.get('quest_id'))
+    try:
+        # check the size of the survey before parsing it, like the API does for an upload
+        upload_bytes = get_source_size(job['quest_data']) + get_source_size(job['quest_metadata'])
+        error = check_upload(limits, upload_bytes)
+        if error is not None:
+            raise ValueError(error)
+        quest_data = read_quest_csv(job['quest_data'], QUEST_DATA_COLUMNS)
+        quest_metadata = read_quest_csv(job['quest_metadata'], QUEST_METADATA_COLUMNS)
+        result = run_quest_analysis(quest_data, quest_metadata, quest_id, limits=limits, upload_bytes=upload_bytes)
+        status = 'ok'
+    except Exception as e:
+        result, status, error = None, 'error', str(e)
+
+    return {'quest_id': quest_id,
+            'status': status,
+            'elapsed_seconds': round(time.perf_counter() - start, 4),
+            'worker_pid': os.getpid(),
+            'error': error,
+            'result': result}
+
+
+def failed_job_record(job, error):
+    """Function to build the record of a survey whose worker process died, eg., it ran out of memory.
+
+    Parameters
+    ----------
+    job: dict
+        See 'analyze_single_quest'.
+    error: Exception
+
+    Returns
+    -------
+    record: dict
+        Like the records of 'analyze_single_quest'.
+    """
+    return {'quest_id': str(job.get('quest_id')),
+            'status': 'error',
+            'elapsed_seconds': None,
+            'worker_pid': None,
+            'error': f"worker process failed: {error}",
+            'result': None}
+
+
+def analyze_batch(jobs, max_workers=None, limits=None):
+    """Function to analyze many quest surveys on the shared process pool.
+    This is a generator, the records are yielded in the order the surveys finish.
+    When a worker process dies, the surveys of the broken pool get an error record
+    and the pool is replaced for the next batches.
+
+    Parameters
+    ----------
+    jobs: list
+        A list of job dictionaries. See 'analyze_single_quest'.
+    max_workers: int, optional
+        The number of worker processes, only used when the pool is first created.
+    limits: RequestLimits, optional
+        The limits applied to every survey, see 'analyze_single_quest'.
+
+    Returns
+    -------
+    records: generator of dict
+    """
+    pool = get_worker_pool(max_workers)
+    futures = {}
+    try:
+        for job in jobs:
+            futures[pool.submit(analyze_single_quest, job, limits)] = job
+    except BrokenProcessPool as e:
+        # the pool broke while the jobs were submitted, the others are not run
+        shutdown_worker_pool(pool)
+        for job in jobs[len(futures):]:
+            yield failed_job_record(job, e)
+
+    for future in as_completed(futures):
+        try:
+            yield future.result()
+        except BrokenProcessPool as e:
+            shutdown_worker_pool(pool)
+            yield failed_job_record(futures[future], e)
+
+
+def to_ndjson_line(record):
+    """Function to serialize a batch record as one line of NDJSON.
+
+    Parameters
+    ----------
+    record: dict
+
+    Returns
+    -------
+    line: str
+    """
+    return json.dumps(record, default=str) + "\n"
+
+
+def load_manifest(manifest_path):
+    """Function to read a batch manifest. Each line is a JSON object with the
+    'quest_id', 'quest_data' and 'quest_metadata' keys, the last two are paths.
+    Relative paths are resolved against the folder of the manifest.
+
+    Parameters
+    ----------
+    manifest_path: str
+
+    Returns
+    -------
+    jobs: list
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path) as manifest:
+        for line in manifest:
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            for key in ('quest_data', 'quest_metadata'):
+                job[key] = os.path.join(base_dir, job[key])
+            jobs.append(job)
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze many quest surveys in parallel.")
+    parser.add_argument('--manifest', required=True,
+                        help="NDJSON file with one {quest_id, quest_data, quest_metadata} per line.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes. The default is one per core.")
+    parser.add_argument('--output', default=None,
+                        help="File to write the NDJSON results to. The default is stdout.")
+    args = parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifest)
+    # the limits are read from the environment, like the API
+    limits = RequestLimits.from_config({})
+    output = open(args.output, 'w') if args.output else sys.stdout
+    failures = 0
+    try:
+        for record in analyze_batch(jobs, max_workers=args.workers, limits=limits):
+            if record['status'] != 'ok':
+                failures += 1
+            output.write(to_ndjson_line(record))
+            output.flush()
+    finally:
+        if args.output:
+            output.close()
+        shutdown_worker_pool()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
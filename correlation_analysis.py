@@ -0,0 +1,233 @@
+"""This script contains the correlation and association analysis across questions.
+
+The numeric and the scaling questions are encoded once into a float matrix
+(one row per respondent, one column per question). The Pearson correlation of
+every pair of questions comes from a few matrix products over that matrix, on
+the respondents that answered both questions, and the Spearman correlation is
+the same computation on the ranks of the answers.
+The association of every pair of categorical questions is measured with
+Cramer's V, from contingency tables that are all counted with a single
+np.bincount on codes that combine the pair and the two answers.
+The results are sent to the front-end as heatmap data.
+"""
+
+import numpy as np
+import pandas as pd
+
+from crosstab_analysis import CELLS_PER_CHUNK, encode_categories
+from scaling_analysis import build_score_matrix
+
+
+# Smallest number of respondents that answered both questions of a pair
+MIN_PAIR_COUNT = 3
+# Categorical questions with more answers than this are left out of Cramer's V
+CRAMERS_V_MAX_CLASSES = 30
+# Number of decimals of the heatmap values
+DECIMALS = 4
+
+
+def build_numeric_matrix(df, numeric_columns, scaling_columns):
+    """Function to encode the numeric and the scaling questions into one float matrix.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data
+    numeric_columns: list
+    scaling_columns: list
+
+    Returns
+    -------
+    values: numpy array
+        One row per respondent and one column per question, NaN for a missing answer.
+    questions: list
+        The questions, in the column order. The scaling questions not on a known scale are left out.
+    """
+    columns = [pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64') for column in numeric_columns]
+    scores, scaling_questions, _, _ = build_score_matrix(df, scaling_columns)
+    values = np.column_stack(columns + [scores]) if columns else scores
+    return values, list(numeric_columns) + scaling_questions
+
+
+def compute_pairwise_correlation(values, min_pair_count=MIN_PAIR_COUNT):
+    """Function to compute the Pearson correlation of every pair of columns of a matrix.
+    Each pair only uses the rows where both columns are present.
+
+    Parameters
+    ----------
+    values: numpy array
+        NaN for a missing value.
+    min_pair_count: int
+        The correlation of a pair with fewer rows is NaN.
+
+    Returns
+    -------
+    correlation: numpy array
+        A square matrix, NaN where the correlation is not defined (eg., a constant column).
+    """
+    present = ~np.isnan(values)
+    mask = present.astype('float64')
+    # centered first, so the sums below don't lose precision
+    column_counts = present.sum(axis=0)
+    means = np.divide(np.where(present, values, 0.0).sum(axis=0), column_counts,
+                      out=np.zeros(values.shape[1]), where=column_counts > 0)
+    centered = np.where(present, values - means, 0.0)
+
+    # the sums of every pair, on the rows where both columns are present:
+    # counts[i, j], sums[i, j] of column i, squares[i, j] of column i and the cross products
+    counts = mask.T @ mask
+    sums = centered.T @ mask
+    squares = (centered ** 2).T @ mask
+    products = centered.T @ centered
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = products - sums * sums.T / counts
+        variance = squares - sums ** 2 / counts
+        correlation = covariance / np.sqrt(variance * variance.T)
+    correlation[(counts < min_pair_count) | ~(variance > 1e-12) | ~(variance.T > 1e-12)] = np.nan
+    return np.clip(correlation, -1.0, 1.0)
+
+
+def rank_columns(values):
+    """Function to replace the values of every column with their ranks, the ties get their average rank.
+
+    Parameters
+    ----------
+    values: numpy array
+        NaN for a missing value, it stays missing.
+
+    Returns
+    -------
+    ranks: numpy array
+    """
+    return pd.DataFrame(values).rank(method='average').to_numpy(dtype='float64')
+
+
+def compute_cramers_v(codes, sizes):
+    """Function to compute Cramer's V for every pair of columns of category codes.
+
+    Parameters
+    ----------
+    codes: numpy array
+        One row per respondent and one column per question, -1 for a missing answer.
+    sizes: list
+        The number of categories of each question.
+
+    Returns
+    -------
+    cramers_v: numpy array
+        A square matrix, NaN where the association is not defined (eg., a question with a single answer).
+    """
+    n_questions = codes.shape[1]
+    sizes = np.asarray(sizes, dtype='int64')
+    cramers_v = np.full((n_questions, n_questions), np.nan)
+    first, second = np.triu_indices(n_questions, k=1)
+    if len(first) == 0:
+        return cramers_v
+
+    # the contingency tables of all the pairs, one after the other in a single array.
+    # A missing answer is counted as an extra last category, so no row is masked out
+    # of the bincount, and the cells of the missing answers are dropped afterwards
+    sizes = sizes + 1
+    table_sizes = sizes[first] * sizes[second]
+    offsets = np.concatenate([[0], np.cumsum(table_sizes)[:-1]])
+    dtype = 'int32' if table_sizes.sum() < 2 ** 31 else 'int64'
+    codes = np.where(codes < 0, sizes - 1, codes).astype(dtype)
+    pair_offsets, second_sizes = offsets.astype(dtype), sizes[second].astype(dtype)
+    observed = np.zeros(int(table_sizes.sum()), dtype='float64')
+    chunk_rows = max(1, CELLS_PER_CHUNK // len(first))
+    for start in range(0, len(codes), chunk_rows):
+        chunk = codes[start:start + chunk_rows]
+        combined = pair_offsets + chunk[:, first] * second_sizes + chunk[:, second]
+        observed += np.bincount(combined.ravel(), minlength=len(observed))
+
+    # the pair, the row and the column of every cell of the tables
+    pair = np.repeat(np.arange(len(first)), table_sizes)
+    within = np.arange(len(observed)) - offsets[pair]
+    row_codes, column_codes = within // sizes[second][pair], within % sizes[second][pair]
+    observed[(row_codes == sizes[first][pair] - 1) | (column_codes == sizes[second][pair] - 1)] = 0
+    row = np.concatenate([[0], np.cumsum(sizes[first])[:-1]])[pair] + row_codes
+    column = np.concatenate([[0], np.cumsum(sizes[second])[:-1]])[pair] + column_codes
+
+    # the chi-squared statistic of every table, from its margins
+    totals = np.bincount(pair, weights=observed, minlength=len(first))
+    row_totals = np.bincount(row, weights=observed, minlength=int(sizes[first].sum()))
+    column_totals = np.bincount(column, weights=observed, minlength=int(sizes[second].sum()))
+    expected = np.divide(row_totals[row] * column_totals[column], totals[pair],
+                         out=np.zeros(len(observed)), where=totals[pair] > 0)
+    chi_squared = np.bincount(pair, weights=np.divide((observed - expected) ** 2, expected,
+                                                      out=np.zeros(len(observed)), where=expected > 0),
+                              minlength=len(first))
+
+    # only the answers given in the pair count in the degrees of freedom
+    row_pair = np.repeat(np.arange(len(first)), sizes[first])
+    column_pair = np.repeat(np.arange(len(first)), sizes[second])
+    dof = np.minimum(np.bincount(row_pair, weights=row_totals > 0, minlength=len(first)),
+                     np.bincount(column_pair, weights=column_totals > 0, minlength=len(first))) - 1
+    defined = (dof > 0) & (totals > 0)
+    values = np.full(len(first), np.nan)
+    values[defined] = np.sqrt(chi_squared[defined] / totals[defined] / dof[defined])
+
+    cramers_v[first, second] = cramers_v[second, first] = np.clip(values, 0.0, 1.0)
+    # a question is fully associated with itself, if it has more than one answer
+    given = [np.count_nonzero(np.bincount(codes[:, i], minlength=sizes[i])[:-1]) for i in range(n_questions)]
+    cramers_v[np.diag_indices(n_questions)] = np.where(np.array(given) > 1, 1.0, np.nan)
+    return cramers_v
+
+
+def _heatmap_data(matrix, questions, method, title, value_range, survey_item_ids):
+    z_values = np.round(matrix, DECIMALS).astype(object)
+    z_values[np.isnan(matrix)] = None
+    return {
+        'plot_type': 'heatmap',
+        'title': title,
+        'method': method,
+        'x_values': questions,
+        'y_values': questions,
+        'z_values': z_values.tolist(),
+        'z_range': value_range,
+        'survey_item_ids': [survey_item_ids.get(question) for question in questions]
+    }
+
+
+def analyze_correlations(df, numeric_columns, scaling_columns, categorical_columns, survey_item_ids=None):
+    """Function to compute the correlation and the association heatmaps of the questions.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data
+    numeric_columns: list
+    scaling_columns: list
+    categorical_columns: list
+    survey_item_ids: dict, optional
+        The survey_item_id of each question.
+
+    Returns
+    -------
+    charts: list
+        The Pearson and the Spearman correlation heatmaps of the numeric and scaling questions,
+        and the Cramer's V heatmap of the categorical questions, when there are at least two questions.
+    """
+    survey_item_ids = survey_item_ids or {}
+    charts = []
+
+    values, questions = build_numeric_matrix(df, numeric_columns, scaling_columns)
+    if len(questions) > 1:
+        charts.append(_heatmap_data(compute_pairwise_correlation(values), questions, 'pearson',
+                                    'Pearson correlation between the questions', [-1, 1], survey_item_ids))
+        # the ranks are over all the answers of a question, not only those of the pair
+        charts.append(_heatmap_data(compute_pairwise_correlation(rank_columns(values)), questions, 'spearman',
+                                    'Spearman correlation between the questions', [-1, 1], survey_item_ids))
+
+    questions, codes_list, sizes = [], [], []
+    for column in categorical_columns:
+        codes, labels = encode_categories(df[column])
+        if 0 < len(labels) <= CRAMERS_V_MAX_CLASSES:
+            questions.append(column)
+            codes_list.append(codes)
+            sizes.append(len(labels))
+    if len(questions) > 1:
+        charts.append(_heatmap_data(compute_cramers_v(np.column_stack(codes_list), sizes), questions, 'cramers_v',
+                                    "Cramer's V association between the questions", [0, 1], survey_item_ids))
+    return charts
@@ -0,0 +1,247 @@
+"""This script contains the cross-tabulation engine.
+It breaks the answers of every question down by segments (eg., Gender, Age band,
+country or region) and returns grouped bar and grouped histogram data.
+
+Every column is turned into integer category codes once. The contingency tables of
+all the questions are then counted together with a single np.bincount per segment,
+on codes that combine the question, the answer and the segment.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Age bands used when a numeric age question is used as a segment
+AGE_BANDS = [0, 18, 25, 35, 45, 55, 65, np.inf]
+AGE_BAND_LABELS = ['<18', '18-24', '25-34', '35-44', '45-54', '55-64', '65+']
+# A segment is an age question if its name matches this (eg., "Age", "What is your age?", "How old are you?")
+AGE_PATTERN = re.compile(r"\bage\b|\bhow old\b", re.IGNORECASE)
+# The other numeric segments keep their values up to this many distinct values, else they are cut into quantile bins
+SEGMENT_MAX_VALUES = 10
+SEGMENT_QUANTILE_BINS = 4
+
+# number of answer cells combined in one bincount, to keep the memory bounded
+CELLS_PER_CHUNK = 2 ** 22
+
+
+def encode_categories(series):
+    """Function to turn a column into integer category codes.
+
+    Parameters
+    ----------
+    series: Pandas Series
+
+    Returns
+    -------
+    codes: numpy array
+        The code of each row, -1 for a missing value.
+    labels: list
+        The label of each code.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy().astype('int64'), series.cat.categories.tolist()
+    codes, labels = pd.factorize(series, sort=True)
+    return codes.astype('int64'), labels.tolist()
+
+
+def encode_numeric_bins(series, bins=10):
+    """Function to bin a numeric column into histogram bins, as integer codes.
+
+    Parameters
+    ----------
+    series: Pandas Series
+    bins: int or list
+        The number of bins, or the bin edges.
+
+    Returns
+    -------
+    codes: numpy array
+        The bin of each row, -1 for a missing value.
+    edges: list
+        The bin edges.
+    """
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64')
+    present = ~np.isnan(values)
+    if not present.any():
+        return np.full(len(values), -1, dtype='int64'), []
+    edges = np.histogram_bin_edges(values[present], bins=bins)
+    codes = np.full(len(values), -1, dtype='int64')
+    # the last bin includes its right edge, like np.histogram
+    codes[present] = np.clip(np.searchsorted(edges, values[present], side='right') - 1, 0, len(edges) - 2)
+    return codes, edges.tolist()
+
+
+def encode_quantile_bins(numbers, bins=SEGMENT_QUANTILE_BINS):
+    """Function to cut a numeric column into bins of about the same number of rows.
+
+    Parameters
+    ----------
+    numbers: Pandas Series
+        Numeric, NaN for a missing value.
+    bins: int
+
+    Returns
+    -------
+    binned: Pandas Series
+        Categorical, each bin is labelled with its range (eg., '12-30').
+    """
+    # repeated values can make quantiles equal, those bins are merged
+    edges = np.unique(numbers.quantile(np.linspace(0, 1, bins + 1)).to_numpy())
+    labels = [f'{low:g}-{high:g}' for low, high in zip(edges[:-1], edges[1:])]
+    return pd.cut(numbers, bins=edges, labels=labels, include_lowest=True)
+
+
+def build_segment_frame(df, response_metadata, segment_columns):
+    """Function to collect the segment columns, aligned with the rows of the survey data.
+    Segments are looked up in the survey data first (eg., Gender, Age), then in the
+    response metadata (eg., country, region). Numeric age segments are cut into age bands,
+    and the other numeric segments with many values into quantile bins.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data
+    response_metadata: dataframe
+        The quest response metadata
+    segment_columns: list
+        The names of the segment columns.
+
+    Returns
+    -------
+    segment_frame: dataframe
+        One categorical column per segment that could be aligned with the survey data.
+    """
+    segments = {}
+    for column in segment_columns:
+        if column in df.columns:
+            segment = df[column]
+        elif column in response_metadata.columns and response_metadata.index.equals(df.index):
+            segment = response_metadata[column]
+        else:
+            continue
+
+        numbers = pd.to_numeric(segment, errors='coerce')
+        if numbers.notna().sum() and numbers.notna().sum() == segment.notna().sum():
+            if AGE_PATTERN.search(str(column)):
+                segment = pd.cut(numbers, bins=AGE_BANDS, labels=AGE_BAND_LABELS, right=False)
+            elif numbers.nunique() > SEGMENT_MAX_VALUES:
+                segment = encode_quantile_bins(numbers)
+        segments[column] = segment.astype('category')
+    return pd.DataFrame(segments, index=df.index)
+
+
+def count_contingency_tables(question_codes, question_sizes, segment_codes, segment_size):
+    """Function to count the contingency tables of many questions by one segment, with a single bincount.
+
+    Parameters
+    ----------
+    question_codes: numpy array
+        One row per respondent and one column per question, -1 for a missing answer.
+    question_sizes: list
+        The number of answers of each question.
+    segment_codes: numpy array
+        The segment of each respondent, -1 for a missing segment.
+    segment_size: int
+        The number of segments.
+
+    Returns
+    -------
+    tables: list
+        One (answers x segments) table of counts per question.
+    """
+    # offset of the table of each question in the combined counts
+    table_sizes = np.asarray(question_sizes, dtype='int64') * segment_size
+    offsets = np.concatenate([[0], np.cumsum(table_sizes)[:-1]])
+    counts = np.zeros(int(table_sizes.sum()), dtype='int64')
+
+    n_rows, n_questions = question_codes.shape
+    chunk_rows = max(1, CELLS_PER_CHUNK // max(n_questions, 1))
+    for start in range(0, n_rows, chunk_rows):
+        codes = question_codes[start:start + chunk_rows]
+        segment = segment_codes[start:start + chunk_rows, None]
+        valid = (codes >= 0) & (segment >= 0)
+        combined = offsets[None, :] + codes * segment_size + segment
+        counts += np.bincount(combined[valid], minlength=len(counts))
+
+    return [counts[offset:offset + size].reshape(-1, segment_size)
+            for offset, size in zip(offsets, table_sizes)]
+
+
+def compute_crosstabs(df, categorical_questions, numeric_questions, segment_frame, survey_item_ids=None, bins=10):
+    """Function to compute the contingency table of every (question x segment) pair.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data
+    categorical_questions: list
+        Questions charted as grouped bar graphs.
+    numeric_questions: list
+        Questions charted as grouped histograms.
+    segment_frame: dataframe
+        The output of 'build_segment_frame'.
+    survey_item_ids: dict, optional
+        The survey_item_id of each question.
+    bins: int
+        The number of histogram bins of the numeric questions.
+
+    Returns
+    -------
+    charts: list
+        Grouped bar graph and grouped histogram data, one per (question x segment) pair.
+    """
+    survey_item_ids = survey_item_ids or {}
+    questions, labels, kinds = [], [], []
+    codes_list = []
+    for column in categorical_questions:
+        codes, column_labels = encode_categories(df[column])
+        questions.append(column)
+        codes_list.append(codes)
+        labels.append(column_labels)
+        kinds.append('categorical')
+    for column in numeric_questions:
+        codes, edges = encode_numeric_bins(df[column], bins=bins)
+        questions.append(column)
+        codes_list.append(codes)
+        labels.append(edges)
+        kinds.append('numeric')
+    if not questions:
+        return []
+
+    question_codes = np.column_stack(codes_list)
+    question_sizes = [len(label) if kind == 'categorical' else max(len(label) - 1, 0)
+                      for label, kind in zip(labels, kinds)]
+
+    charts = []
+    for segment in segment_frame.columns:
+        segment_codes, groups = encode_categories(segment_frame[segment])
+        if not groups:
+            continue
+        # a question is never broken down by itself
+        keep = [i for i, question in enumerate(questions) if question != segment]
+        tables = count_contingency_tables(question_codes[:, keep], [question_sizes[i] for i in keep],
+                                           segment_codes, len(groups))
+        for i, table in zip(keep, tables):
+            question = questions[i]
+            data = {
+                'title': f'{question} by {segment}',
+                'question': question,
+                'segment': segment,
+                'groups': [str(group) for group in groups],
+                'y_values': table.T.tolist(),
+                'y_label': 'Count',
+                'survey_item_id': survey_item_ids.get(question)
+            }
+            if kinds[i] == 'categorical':
+                data.update({'plot_type': 'grouped_bar_graph',
+                             'alternative_chart': 'stacked_bar_graph',
+                             'x_values': labels[i],
+                             'x_label': 'Values'})
+            else:
+                data.update({'plot_type': 'grouped_histogram',
+                             'bin_edges': labels[i],
+                             'x_label': 'Values'})
+            charts.append(data)
+    return charts
@@ -0,0 +1,127 @@
+"""This script contains the CSV reader of the quest survey uploads.
+
+The files are read with the multithreaded Arrow CSV reader, with an explicit
+type for every known quest column, so nothing is inferred and the timestamps
+are parsed once, at ingest. The Arrow table is then handed to pandas without
+consolidating its columns into blocks, so the numeric and timestamp columns
+are not copied again. Without pyarrow, or for a file Arrow can't read with
+the schema (eg., timestamps without a zone offset), pandas reads the file.
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+
+# The known columns of the uploads and their types
+QUEST_DATA_COLUMNS = {
+    'response_id': 'string',
+    'created_at': 'timestamp',
+    'response': 'string',
+    'quest_completion_time': 'float64',
+    'survey_item_id': 'float64',
+    'city': 'string',
+    'country': 'string',
+    'region': 'string',
+    'latitude': 'float64',
+    'longitude': 'float64',
+}
+QUEST_METADATA_COLUMNS = {
+    'question': 'string',
+    'type': 'string',
+    'id': 'int64',
+}
+
+# Values read as missing, '<NA>' is how pandas writes a missing value of the exports
+NULL_VALUES = ['', '<NA>', 'NA', 'N/A', 'n/a', 'NaN', 'nan', 'NULL', 'null', 'None', '#N/A']
+
+# Size of the blocks the CSV is split in, each block is parsed by its own thread
+BLOCK_SIZE = 1 << 24
+
+
+def _open_source(source):
+    # uploads (werkzeug FileStorage) are read through their stream, content as a file
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    return getattr(source, 'stream', source)
+
+
+def _arrow_types(columns):
+    types = {'string': pa.string(), 'float64': pa.float64(), 'int64': pa.int64(),
+             'timestamp': pa.timestamp('ns', tz='UTC')}
+    return {column: types[kind] for column, kind in columns.items()}
+
+
+def _name_unnamed_columns(df):
+    # the exports have an unnamed index column, pandas calls it 'Unnamed: 0'
+    df.columns = [column if column else f"Unnamed: {i}" for i, column in enumerate(df.columns)]
+    return df
+
+
+def _read_with_arrow(source, columns):
+    table = pa_csv.read_csv(source,
+                            read_options=pa_csv.ReadOptions(use_threads=True, block_size=BLOCK_SIZE),
+                            convert_options=pa_csv.ConvertOptions(column_types=_arrow_types(columns),
+                                                                  null_values=NULL_VALUES,
+                                                                  strings_can_be_null=True))
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    # Arrow gives None for a missing string, the engine expects NaN like pandas gives.
+    # fillna would turn an all-missing string column into float64, where keeps it object
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].notna(), np.nan)
+    return _name_unnamed_columns(df)
+
+
+def _read_with_pandas(source, columns):
+    dtypes = {column: (object if kind == 'string' else kind) for column, kind in columns.items()
+              if kind != 'timestamp'}
+    df = pd.read_csv(source, dtype=dtypes, na_values=NULL_VALUES, keep_default_na=False)
+    for column, kind in columns.items():
+        if kind == 'timestamp' and column in df.columns:
+            df[column] = pd.to_datetime(df[column])
+    return df
+
+
+def read_quest_csv(source, columns):
+    """Function to read a quest CSV upload with the types of its known columns.
+
+    Parameters
+    ----------
+    source: bytes, str or file-like
+        The content of the CSV file, its path, or the uploaded file.
+    columns: dict
+        The type of each known column, eg., QUEST_DATA_COLUMNS.
+        The other columns are inferred.
+
+    Returns
+    -------
+    dataframe: Pandas DataFrame
+    """
+    source = _open_source(source)
+    if pa is not None:
+        # a path is opened again by pandas, a file is rewound
+        start = None if isinstance(source, str) else source.tell()
+        try:
+            return _read_with_arrow(source, columns)
+        except pa.ArrowInvalid:
+            if start is not None:
+                source.seek(start)
+    return _read_with_pandas(source, columns)
+
+
+def read_quest_data(source):
+    """Function to read the quest survey responses, see 'read_quest_csv'."""
+    return read_quest_csv(source, QUEST_DATA_COLUMNS)
+
+
+def read_quest_metadata(source):
+    """Function to read the quest survey metadata, see 'read_quest_csv'."""
+    return read_quest_csv(source, QUEST_METADATA_COLUMNS)
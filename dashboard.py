@@ -1,42 +1,184 @@
-import dash
-import dash_core_components as dcc
-import dash_html_components as html
+"""This script contains the live dashboard of the quest surveys.
+
+The Dash app is mounted on the Flask API server, so it reads the surveys parsed
+by the lazy mode of /charts from the same store. The figures are built from the
+chart payloads of the analysis engine and kept in a bounded cache, keyed by
+survey version, segment filter and chart. The page polls the store with an
+interval: nothing is recomputed until the survey is uploaded again, and a
+segment filter only computes the charts that are not cached for it yet.
+"""
+
+import os
+
 import plotly.graph_objs as go
+from dash import Dash, Input, Output, State, dcc, html, no_update
+
+from analysis_functions import get_daily_response_count_data
+from analysis_skeleton import compute_chart_descriptors
+from flask_api import app as server, parsed_surveys
+from survey_cache import LRUCache
+
+
+# number of figures kept in memory, across all the surveys and segment filters
+server.config.setdefault('DASHBOARD_FIGURE_CACHE_SIZE', int(os.environ.get('DASHBOARD_FIGURE_CACHE_SIZE', 512)))
+# how often the page checks the store for a new version of the survey
+server.config.setdefault('DASHBOARD_REFRESH_SECONDS', int(os.environ.get('DASHBOARD_REFRESH_SECONDS', 30)))
+
+figure_cache = LRUCache(server.config['DASHBOARD_FIGURE_CACHE_SIZE'])
+
+# the chart shown for each category of question
+DASHBOARD_PLOT_TYPES = {'categorical': 'bar_graph', 'numeric': 'histogram', 'open_ended': 'sentiment_bar_graph'}
+# number of words shown for a word cloud
+TOP_WORDS = 20
+
+
+def build_figure(chart):
+    """Function to build a plotly figure from the chart data of the analysis engine.
+
+    Parameters
+    ----------
+    chart: dict
+        The chart data, with its 'plot_type'.
+
+    Returns
+    -------
+    figure: plotly Figure
+    """
+    plot_type = chart['plot_type']
+    if plot_type == 'bar_graph':
+        trace = go.Bar(x=chart['x_values'], y=chart['y_values'])
+    elif plot_type == 'pie_chart':
+        trace = go.Pie(labels=chart['labels'], values=chart['sizes'], textinfo='label+percent')
+    elif plot_type == 'histogram' and chart.get('summary'):
+        edges = chart['bin_edges']
+        trace = go.Bar(x=[(low + high) / 2 for low, high in zip(edges[:-1], edges[1:])], y=chart['counts'])
+    elif plot_type == 'histogram':
+        trace = go.Histogram(x=chart['values'])
+    elif plot_type == 'boxplot':
+        trace = go.Box(y=chart['values'], name=chart['title'])
+    elif plot_type == 'violin_plot':
+        trace = go.Violin(y=chart['values'], name=chart['title'])
+    elif plot_type == 'line_chart':
+        trace = go.Scatter(x=chart['dates'], y=chart.get('counts', chart.get('values')), mode='lines+markers')
+    elif plot_type == 'radar_chart':
+        trace = go.Scatterpolar(r=chart['values'], theta=chart['axes'], fill='toself')
+    elif plot_type == 'wordcloud':
+        # plotly has no word cloud, the most frequent words are shown as bars
+        counts = {}
+        for word in chart['text'].split():
+            counts[word] = counts.get(word, 0) + 1
+        top_words = sorted(counts, key=counts.get, reverse=True)[:TOP_WORDS]
+        trace = go.Bar(x=top_words, y=[counts[word] for word in top_words])
+    else:
+        raise ValueError(f"Plot type '{plot_type}' can't be shown on the dashboard.")
+
+    layout = go.Layout(title=chart.get('title'),
+                       xaxis={'title': chart.get('x_label')},
+                       yaxis={'title': chart.get('y_label')})
+    return go.Figure(data=[trace], layout=layout)
+
+
+def get_survey_figures(survey, segment=None, value=None):
+    """Function to get the figures of a survey, for all the respondents or a segment value.
+    Each figure is only computed when it is not in the figure cache.
 
+    Parameters
+    ----------
+    survey: ParsedSurvey
+    segment: str, optional
+        Only the respondents with this 'value' of the segment are charted.
+    value: str, optional
 
-# create dash app
-app = dash.Dash(__name__)
+    Returns
+    -------
+    figures: list
+        The (key, figure) of each chart, the key is unique within the survey.
+    """
+    if segment is None or value is None:
+        segment, value = None, None
+    prefix = (survey.quest_id, survey.version, segment, value)
 
-app.layout = html.Div(
+    def daily_responses():
+        respondents = survey.segment_respondents(segment, value)
+        return build_figure(get_daily_response_count_data(survey.response_metadata.loc[respondents]))
+
+    figures = [('daily_responses', figure_cache.get_or_compute(prefix + ('daily_responses',), daily_responses))]
+    for descriptor in compute_chart_descriptors(survey.categorized_questions, survey.df_meta, survey.aggregations,
+                                                survey.plan):
+        plot_type = DASHBOARD_PLOT_TYPES[descriptor['category']]
+        key = f"{descriptor['survey_item_id']}/{plot_type}"
+
+        def compute(survey_item_id=descriptor['survey_item_id'], plot_type=plot_type):
+            return build_figure(survey.get_chart(survey_item_id, plot_type, segment=segment, value=value))
+
+        figures.append((key, figure_cache.get_or_compute(prefix + (key,), compute)))
+    return figures
+
+
+# create dash app, on the same server as the REST API
+dash_app = Dash(__name__, server=server, url_base_pathname='/dashboard/')
+
+dash_app.layout = html.Div(
     children=[
-        html.H1("Simple Web Dashboard"),
-        dcc.Graph(
-            figure=go.Figure(
-                data=[
-                    go.Pie(
-                        labels=["Category 1", "Category 2", "Category 3"],
-                        values=[30, 40, 30],
-                        marker=dict(colors=['#ff7f0e', '#1f77b4', '#2ca02c']),
-                        textinfo='label+percent'
-                    )
-                ],
-                layout=go.Layout(title="Pie Chart")
-            )
-        ),
-        dcc.Graph(
-            figure=go.Figure(
-                data=[
-                    go.Bar(
-                        x=["Category 1", "Category 2", "Category 3"],
-                        y=[10, 20, 30],
-                        marker=dict(color='#1f77b4')
-                    )
-                ],
-                layout=go.Layout(title="Bar Graph")
-            )
-        )
+        html.H1("Quest Survey Dashboard"),
+        dcc.Input(id='quest-id', type='text', placeholder='quest_id', debounce=True),
+        dcc.Dropdown(id='segment', placeholder='Segment'),
+        dcc.Dropdown(id='segment-value', placeholder='Segment value'),
+        html.Div(id='survey-status'),
+        # version of the survey shown, the charts only refresh when it changes
+        dcc.Store(id='survey-version'),
+        dcc.Interval(id='refresh', interval=server.config['DASHBOARD_REFRESH_SECONDS'] * 1000),
+        html.Div(id='charts'),
     ]
 )
 
+
+@dash_app.callback(Output('survey-version', 'data'),
+                   Output('survey-status', 'children'),
+                   Input('refresh', 'n_intervals'),
+                   Input('quest-id', 'value'),
+                   State('survey-version', 'data'))
+def refresh_survey_version(n_intervals, quest_id, current_version):
+    survey = parsed_surveys.get(quest_id) if quest_id else None
+    version = {'quest_id': survey.quest_id, 'version': survey.version} if survey is not None else None
+    if version == current_version:
+        return no_update, no_update
+    if survey is None:
+        return None, f"Survey '{quest_id}' is not loaded, upload it to /charts with lazy=true." if quest_id else ""
+    return version, f"{len(survey.df)} respondents"
+
+
+@dash_app.callback(Output('segment', 'options'),
+                   Input('survey-version', 'data'))
+def update_segment_options(version):
+    survey = parsed_surveys.get(version['quest_id']) if version else None
+    if survey is None:
+        return []
+    return [{'label': segment, 'value': segment} for segment in survey.segment_options()]
+
+
+@dash_app.callback(Output('segment-value', 'options'),
+                   Input('segment', 'value'),
+                   Input('survey-version', 'data'))
+def update_segment_values(segment, version):
+    survey = parsed_surveys.get(version['quest_id']) if version else None
+    if survey is None or not segment:
+        return []
+    values = survey.segment_options().get(segment, [])
+    return [{'label': value, 'value': value} for value in values]
+
+
+@dash_app.callback(Output('charts', 'children'),
+                   Input('survey-version', 'data'),
+                   Input('segment', 'value'),
+                   Input('segment-value', 'value'))
+def update_charts(version, segment, value):
+    survey = parsed_surveys.get(version['quest_id']) if version else None
+    if survey is None or survey.version != version['version']:
+        return []
+    figures = get_survey_figures(survey, segment, value)
+    return [dcc.Graph(id={'type': 'chart', 'key': key}, figure=figure) for key, figure in figures]
+
+
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    server.run(debug=True)
@@ -1,68 +1,270 @@
-from flask import Flask, jsonify, request
+import os
+
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_restful import Resource, Api
 from analysis_skeleton import *
+from approximate_analysis import compute_approximate_charts_data, sketch_quest_data
+from batch_analysis import analyze_batch, to_ndjson_line
+from survey_cache import ParsedSurvey, ParsedSurveyCache
+from request_guardrails import RequestLimits
+from http_caching import compress_response, hash_parts, hash_request_inputs, matching_etag, not_modified_response
+from single_flight import SingleFlight, SingleFlightTimeout
+from csv_ingest import read_quest_data, read_quest_metadata
+from request_profiling import profiling_enabled, run_profiled
+from progressive_analysis import AnalysisCostEstimate, clamp_time_budget, progressive_analysis
 
 # create Flask app and initialize the REST API
 app = Flask(__name__)
 api = Api(app)
 
+# folder the batch endpoint is allowed to read stored survey files from
+app.config.setdefault('BATCH_STORE_DIR', os.environ.get('BATCH_STORE_DIR', 'data'))
+# number of parsed surveys kept in memory for the lazy chart requests
+app.config.setdefault('PARSED_SURVEY_CACHE_SIZE', int(os.environ.get('PARSED_SURVEY_CACHE_SIZE', 32)))
+
+parsed_surveys = ParsedSurveyCache(app.config['PARSED_SURVEY_CACHE_SIZE'])
+
+# request guardrails, see request_guardrails.RequestLimits for the available limits
+request_limits = RequestLimits.from_config(app.config)
+if request_limits.max_upload_bytes is not None:
+    # werkzeug rejects larger uploads with a 413 before they are read
+    app.config['MAX_CONTENT_LENGTH'] = request_limits.max_upload_bytes
+
+# seconds a request waits for the identical request in flight before giving up
+app.config.setdefault('SINGLE_FLIGHT_TIMEOUT', float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', 600)))
+
+in_flight = SingleFlight()
+
+# opt-in profiling of /charts, see request_profiling
+app.config.setdefault('PROFILE_DIR', os.environ.get('PROFILE_DIR', 'profiles'))
+app.config.setdefault('PROFILE_QUEST_IDS', set(filter(None, os.environ.get('PROFILE_QUEST_IDS', '').split(','))))
+app.config.setdefault('PROFILE_TOKEN', os.environ.get('PROFILE_TOKEN'))
+
+# seconds the preview of a progressive request should take
+app.config.setdefault('PROGRESSIVE_TIME_BUDGET', float(os.environ.get('PROGRESSIVE_TIME_BUDGET', 1.0)))
+# largest time budget a progressive request can ask for with its 'time_budget' field
+app.config.setdefault('PROGRESSIVE_MAX_TIME_BUDGET', float(os.environ.get('PROGRESSIVE_MAX_TIME_BUDGET', 30.0)))
+
+# seconds per answer of the analyses of this worker, it sizes the progressive previews
+analysis_costs = AnalysisCostEstimate()
+
+# responses smaller than this are sent uncompressed
+app.config.setdefault('COMPRESSION_MIN_BYTES', int(os.environ.get('COMPRESSION_MIN_BYTES', 1024)))
+app.config.setdefault('COMPRESSION_LEVEL', int(os.environ.get('COMPRESSION_LEVEL', 6)))
+
+
+@app.after_request
+def compress(response):
+    return compress_response(response, request.accept_encodings,
+                             min_bytes=app.config['COMPRESSION_MIN_BYTES'],
+                             level=app.config['COMPRESSION_LEVEL'])
+
+
+def form_flag(name):
+    """Function to read a true/false option sent with the form."""
+    return request.form.get(name, "false").lower() in ("1", "true", "yes")
+
 
 class ChartResource(Resource):
     def post(self):
-        # Access the uploaded files
+        # the same files and options always give the same result, so a client
+        # that has it already gets a 304 before anything is parsed
+        etag = hash_request_inputs(request.files, request.form, request.path)
+        matched = matching_etag(request, etag)
+        if matched and form_flag("lazy"):
+            # in lazy mode the survey must still be in the store for the single chart requests
+            survey = parsed_surveys.get(request.form.get("quest_id"))
+            matched = matched if survey is not None and survey.etag == etag else None
+        if matched:
+            return not_modified_response(matched)
+
         # quest_data, quest_metadata and survey_id are the key names from the client
-        quest_data = pd.read_csv(request.files.get("quest_data"))
-        quest_metadata = pd.read_csv(request.files.get("quest_metadata"))
         quest_id = request.form.get("quest_id")
+        # map zoom level of the geography heatmap tiles
+        zoom = request.form.get("zoom", "6")
+        invalid_zoom = {'message': f"Invalid zoom '{zoom}', use an integer from {MIN_ZOOM} to {MAX_ZOOM}."}, 400
+        try:
+            geo_zoom = int(zoom)
+        except ValueError:
+            return invalid_zoom
+        if not MIN_ZOOM <= geo_zoom <= MAX_ZOOM:
+            return invalid_zoom
+        # how duplicate answers of a respondent are resolved: first, last or latest
+        dedup = request.form.get("dedup", "latest")
+        if dedup not in DEDUP_POLICIES:
+            return {'message': f"Unknown dedup policy '{dedup}', use one of {DEDUP_POLICIES}."}, 400
+        # period of the trends: day, week or month, the default depends on the span of the submissions
+        period = request.form.get("period")
+        if period is not None and period not in PERIOD_FORMATS:
+            return {'message': f"Unknown period '{period}', use one of {list(PERIOD_FORMATS)}."}, 400
+
+        # progressive mode, a preview on a sample of the respondents is streamed before the exact result
+        if form_flag("progressive"):
+            # seconds the preview should take, up to PROGRESSIVE_MAX_TIME_BUDGET
+            time_budget = request.form.get("time_budget", app.config['PROGRESSIVE_TIME_BUDGET'])
+            try:
+                time_budget = clamp_time_budget(time_budget, app.config['PROGRESSIVE_MAX_TIME_BUDGET'])
+            except ValueError:
+                return {'message': f"Invalid time_budget '{time_budget}', use a positive number of seconds."}, 400
+            quest_metadata = read_quest_metadata(request.files.get("quest_metadata"))
+            quest_data = read_quest_data(request.files.get("quest_data"))
+            records = progressive_analysis(quest_data, quest_metadata, quest_id,
+                                           time_budget=time_budget,
+                                           cost_estimate=analysis_costs,
+                                           **self.analysis_options(geo_zoom, dedup))
+            return Response(stream_with_context(to_ndjson_line(record) for record in records),
+                            mimetype='application/x-ndjson')
+
+        def analyze():
+            return self.analyze(quest_id, geo_zoom, dedup, etag)
+
+        profile_path = None
+        if profiling_enabled(app.config, request.headers, quest_id):
+            # a profiled request runs its own computation, it is never coalesced
+            result, profile_path = run_profiled(analyze, app.config['PROFILE_DIR'], quest_id)
+            coalesced = False
+        else:
+            # identical requests in flight wait for the first one and share its result
+            try:
+                result, coalesced = in_flight.do((str(quest_id), etag), analyze,
+                                                 timeout=app.config['SINGLE_FLIGHT_TIMEOUT'])
+            except SingleFlightTimeout as e:
+                return {'message': str(e)}, 503, {'Retry-After': '30'}
+
+        response = jsonify(result)
+        response.set_etag(etag)
+        response.headers['X-Coalesced'] = 'true' if coalesced else 'false'
+        if profile_path is not None:
+            response.headers['X-Profile-Path'] = profile_path
+        return response
+
+    def analyze(self, quest_id, geo_zoom, dedup, etag):
+        # Access the uploaded files
+        quest_metadata = read_quest_metadata(request.files.get("quest_metadata"))
+
+        # approximate mode for huge surveys, the data is folded into sketches chunk by chunk
+        if form_flag("approximate"):
+            sketch = sketch_quest_data(request.files.get("quest_data"), quest_metadata)
+            return {'quest_id': str(quest_id),
+                    'approximate': True,
+                    'analysis_result': sketch.summary(),
+                    'charts': compute_approximate_charts_data(sketch, quest_metadata),
+                    'sketch': sketch.to_dict()}
+
+        quest_data = read_quest_data(request.files.get("quest_data"))
+
+        # lazy mode, the question charts are computed later with SingleChartResource
+        if form_flag("lazy"):
+            survey = ParsedSurvey.from_quest_data(quest_id, quest_data, quest_metadata, dedup=dedup,
+                                                  exclude_flagged=form_flag("exclude_flagged"),
+                                                  limits=request_limits, upload_bytes=request.content_length)
+            survey.etag = etag
+            parsed_surveys.put(survey)
+            return survey.lazy_result(geo_zoom=geo_zoom)
 
-        # read quest survey data and metadata
-        df, df_meta, response_meta = parse_quest_data(quest_data, quest_metadata)
         # Generate storage path based on survey id
         storage_path = create_storage_path(str(quest_id))
-        # Categorize survey questions
-        categorized_questions = categorize_survey_questions(df, df_meta)
-
-        # Perform Quick Analysis
-        # profanity_count = count_profanities(survey_dataframe=df,
-        #                                     text_columns=categorized_questions.get('open_ended'))
-        invalid_response_count = count_invalid_responses(survey_dataframe=df)
-        completion_rate = calculate_completion_percentage(survey_dataframe=df)
-        average_quest_completion_time = average_response_time(response_metadata=response_meta)
-
-        # correct texts in open_ended questions
-        df = correct_text(df=df,
-                          columns_to_correct=categorized_questions.get('open_ended'))
-        # perform sentiment analysis
-        df, sentiment_columns = perform_sentiment_analysis(df=df,
-                                                           columns_to_analyze=categorized_questions.get('open_ended'))
-
-        # Generate charts data based on category
-        charts = compute_charts_data(categorized_questions.get('categorical'),
-                                     sentiment_columns,
-                                     categorized_questions.get('numeric'),
-                                     categorized_questions.get('open_ended'),
-                                     df,
-                                     df_meta,
-                                     response_meta
-                                    )
-
-        # Generate GeoJSON data
-        result_geojson = create_geojson(response_meta, "response_id", "latitude", "longitude")
-
-        # send the image files
-        return jsonify({'quest_id': str(quest_id),
-                        'analysis_result': {'number of responses': str(len(df)),
-                                            'average_quest_completion_time': str(average_quest_completion_time),
-                                            'completeness_rate': str(completion_rate),
-                                            'average_responses': "",
-                                            'invalid_responses': str(invalid_response_count),
-                                            'profanities': "Unknown"},
-                        'charts': charts,
-                        'geojson': result_geojson})
+
+        # run the analysis engine on the survey
+        return run_quest_analysis(quest_data, quest_metadata, quest_id, **self.analysis_options(geo_zoom, dedup))
+
+    def analysis_options(self, geo_zoom, dedup):
+        # optional comma separated list of columns to break the answers down by
+        segments = request.form.get("segments")
+        segment_columns = [segment.strip() for segment in segments.split(",")] if segments else None
+        return {'segment_columns': segment_columns,
+                'geo_zoom': geo_zoom,
+                'limits': request_limits,
+                'upload_bytes': request.content_length,
+                'dedup': dedup,
+                'exclude_flagged': form_flag("exclude_flagged"),
+                'period': request.form.get("period")}
+
+
+class StatsResource(Resource):
+    def get(self):
+        # counters of this worker process
+        return {'single_flight': in_flight.stats(),
+                'parsed_surveys': len(parsed_surveys)}
+
+
+class SingleChartResource(Resource):
+    def get(self, quest_id, survey_item_id, plot_type):
+        # the survey must have been posted to /charts in lazy mode first
+        survey = parsed_surveys.get(quest_id)
+        if survey is None:
+            return {'message': f"Survey '{quest_id}' is not loaded, post it to /charts with lazy=true."}, 404
+        etag = hash_parts(survey.etag or survey.version, survey_item_id, plot_type)
+        matched = matching_etag(request, etag)
+        if matched:
+            return not_modified_response(matched)
+        try:
+            chart = survey.get_chart(survey_item_id, plot_type)
+        except ValueError as e:
+            return {'message': str(e)}, 404
+        response = jsonify(chart)
+        response.set_etag(etag)
+        return response
+
+
+def resolve_store_reference(reference):
+    """Function to turn a store reference into a path inside the batch store folder.
+    References that point outside of the store are rejected.
+
+    Parameters
+    ----------
+    reference: str
+        The path of the survey file, relative to the batch store folder.
+
+    Returns
+    -------
+    path: str
+    """
+    store_dir = os.path.abspath(app.config['BATCH_STORE_DIR'])
+    path = os.path.abspath(os.path.join(store_dir, reference))
+    if os.path.commonpath([store_dir, path]) != store_dir:
+        raise ValueError(f"Store reference '{reference}' is outside of the batch store.")
+    return path
+
+
+class BatchChartResource(Resource):
+    def post(self):
+        # The surveys are either a JSON list of store references:
+        #   {"surveys": [{"quest_id": .., "quest_data": "x.csv", "quest_metadata": "y.csv"}]}
+        # or a multipart upload with the quest_ids and the
+        # quest_data_<quest_id> & quest_metadata_<quest_id> files.
+        jobs = []
+        if request.is_json:
+            for survey in request.get_json().get('surveys', []):
+                try:
+                    jobs.append({'quest_id': survey['quest_id'],
+                                 'quest_data': resolve_store_reference(survey['quest_data']),
+                                 'quest_metadata': resolve_store_reference(survey['quest_metadata'])})
+                except (KeyError, ValueError) as e:
+                    return {'message': f"Invalid survey reference: {e}"}, 400
+        else:
+            for quest_id in request.form.getlist('quest_ids'):
+                quest_data = request.files.get(f"quest_data_{quest_id}")
+                quest_metadata = request.files.get(f"quest_metadata_{quest_id}")
+                if quest_data is None or quest_metadata is None:
+                    return {'message': f"Missing files for quest_id '{quest_id}'."}, 400
+                jobs.append({'quest_id': quest_id,
+                             'quest_data': quest_data.read(),
+                             'quest_metadata': quest_metadata.read()})
+
+        if not jobs:
+            return {'message': "No surveys to analyze."}, 400
+
+        # stream every result as soon as its survey is done
+        records = (to_ndjson_line(record) for record in analyze_batch(jobs, limits=request_limits))
+        return Response(stream_with_context(records), mimetype='application/x-ndjson')
 
 
 # add ChartResource to the API
 api.add_resource(ChartResource, '/charts')
+api.add_resource(BatchChartResource, '/charts/batch')
+api.add_resource(StatsResource, '/charts/stats')
+api.add_resource(SingleChartResource, '/charts/<quest_id>/<survey_item_id>/<plot_type>')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,177 @@
+"""This script contains the HTTP caching and compression of the API responses.
+
+A /charts response is identified by a strong ETag, the hash of the uploaded
+files and the form fields, so a client that posts the same survey again with
+If-None-Match gets a 304 before anything is parsed. The ETags are salted with
+the version of the engine (the hash of its sources and the APP_VERSION
+environment variable), so a deploy invalidates them. Large responses are
+compressed with brotli (when it is installed and accepted by the client) or gzip.
+"""
+
+import glob
+import gzip
+import hashlib
+import os
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# size of the blocks the uploaded files are hashed in
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def get_engine_version():
+    """Function to get the version of the analysis engine, for the ETags.
+    It is the hash of the sources of the engine and of the APP_VERSION environment variable,
+    so it changes with the code and with the deploys that only change the configuration.
+
+    Returns
+    -------
+    version: str
+    """
+    digest = hashlib.sha256(os.environ.get('APP_VERSION', '').encode())
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+        with open(path, 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+# computed once, the sources don't change while the process runs
+ENGINE_VERSION = get_engine_version()
+
+
+def hash_request_inputs(files, form, *parts):
+    """Function to hash the inputs of a request, the uploaded files are read block by block.
+    The files are rewound, so they can still be read by the request. The hash is salted with ENGINE_VERSION.
+
+    Parameters
+    ----------
+    files: werkzeug MultiDict
+        The uploaded files.
+    form: werkzeug MultiDict
+        The form fields.
+    parts: str
+        Anything else the response depends on (eg., the path).
+
+    Returns
+    -------
+    digest: str
+    """
+    digest = hashlib.sha256(f"{ENGINE_VERSION}\0".encode())
+    for part in parts:
+        digest.update(f"{part}\0".encode())
+    for name in sorted(form):
+        for value in form.getlist(name):
+            digest.update(f"{name}={value}\0".encode())
+    for name in sorted(files):
+        for storage in files.getlist(name):
+            digest.update(f"{name}\0".encode())
+            stream = storage.stream
+            stream.seek(0)
+            chunk = stream.read(HASH_CHUNK_SIZE)
+            while chunk:
+                digest.update(chunk)
+                chunk = stream.read(HASH_CHUNK_SIZE)
+            stream.seek(0)
+    return digest.hexdigest()
+
+
+def hash_parts(*parts):
+    """Function to hash a few values into an ETag, eg., the survey and the chart of a request."""
+    return hashlib.sha256('\0'.join(str(part) for part in (ENGINE_VERSION,) + parts).encode()).hexdigest()
+
+
+def matching_etag(request, etag):
+    """Function to check the If-None-Match header of a request against an ETag.
+    A compressed response has the ETag with the encoding appended ('<etag>-gzip'),
+    it is the same resource, so it matches too.
+
+    Parameters
+    ----------
+    request: flask Request
+    etag: str
+
+    Returns
+    -------
+    tag: str or None
+        The tag of the header that matched, None if none did.
+    """
+    if request.if_none_match.star_tag:
+        return etag
+    for tag in request.if_none_match.as_set():
+        if tag == etag or tag.rsplit('-', 1)[0] == etag:
+            return tag
+    return None
+
+
+def not_modified_response(etag):
+    """Function to build the 304 response of an ETag."""
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def choose_encoding(accept_encodings):
+    """Function to choose the content encoding of a response, brotli first.
+
+    Parameters
+    ----------
+    accept_encodings: werkzeug MIMEAccept
+        The Accept-Encoding header of the request.
+
+    Returns
+    -------
+    encoding: str or None
+    """
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, accept_encodings, min_bytes=1024, level=6):
+    """Function to compress the body of a response, when it is large enough.
+    Streamed responses (eg., the NDJSON of /charts/batch) and files are sent as they are.
+
+    Parameters
+    ----------
+    response: flask Response
+    accept_encodings: werkzeug MIMEAccept
+        The Accept-Encoding header of the request.
+    min_bytes: int
+        Smaller bodies are not worth compressing.
+    level: int
+        The gzip compression level, brotli uses its matching quality.
+
+    Returns
+    -------
+    response: flask Response
+    """
+    if (not 200 <= response.status_code < 300 or response.status_code == 204 or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < min_bytes:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=min(level, 11)))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=level))
+    response.headers['Content-Encoding'] = encoding
+
+    # a strong ETag is per representation, so the compressed body gets its own
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
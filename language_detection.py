@@ -0,0 +1,202 @@
+"""This script contains a lightweight, offline language detector for open_ended answers.
+
+Each language has a character trigram profile built from a short sample text.
+An answer is scored against every profile with smoothed log-probabilities,
+and the result is cached per distinct text, so repeated answers are only
+detected once. Answers that are not English skip the English-only steps
+(text correction and sentiment analysis).
+"""
+
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+# Language of the answers that go through text correction and sentiment analysis
+ENGLISH = 'en'
+# Label of the answers that are too short to tell, they are treated as English
+UNDETERMINED = 'und'
+# Answers with fewer letters than this are undetermined
+MIN_LETTERS = 12
+# Most answers are in English, so another language must beat English by this
+# average log-probability per trigram. It keeps short English answers in English.
+ENGLISH_MARGIN = 0.15
+
+SAMPLE_TEXTS = {
+    'en': """The session was very good and the speakers were clear. I think the organisers should
+        give more time for questions at the end. What I enjoyed the most was the panel with the
+        founders, they shared how they started their business and what they would do differently.
+        Our team would like to attend again next year. The drinks were nice but the room was too
+        hot and it was hard to hear the people at the back. Thank you for the invitation, it was
+        worth the trip and I learnt a lot about managing money, hiring people and building a brand.
+        We have been buying the new fruit juice every week because it is fresh and not too sweet.""",
+    'fr': """La session était très bonne et les intervenants étaient clairs. Je pense que les
+        organisateurs devraient laisser plus de temps pour les questions à la fin. Ce que j'ai le
+        plus aimé, c'est la table ronde avec les fondateurs, ils ont expliqué comment ils ont lancé
+        leur entreprise et ce qu'ils feraient autrement. Notre équipe aimerait revenir l'année
+        prochaine. Les boissons étaient bonnes mais la salle était trop chaude et on entendait mal
+        au fond. Merci pour l'invitation, cela valait le déplacement et j'ai beaucoup appris sur la
+        gestion de l'argent, le recrutement et la création d'une marque. Nous achetons le nouveau jus
+        de fruits chaque semaine parce qu'il est frais et pas trop sucré.""",
+    'es': """La sesión fue muy buena y los ponentes fueron claros. Creo que los organizadores
+        deberían dejar más tiempo para las preguntas al final. Lo que más me gustó fue el panel con
+        los fundadores, contaron cómo empezaron su negocio y qué harían de otra manera. A nuestro
+        equipo le gustaría volver el año que viene. Las bebidas estaban bien pero la sala hacía
+        demasiado calor y era difícil oír a la gente del fondo. Gracias por la invitación, valió la
+        pena el viaje y aprendí mucho sobre cómo gestionar el dinero, contratar personas y crear una
+        marca. Compramos el nuevo zumo de frutas cada semana porque es fresco y no demasiado dulce.""",
+    'pt': """A sessão foi muito boa e os palestrantes foram claros. Acho que os organizadores
+        deveriam deixar mais tempo para as perguntas no final. O que eu mais gostei foi o painel com
+        os fundadores, eles contaram como começaram o negócio e o que fariam de outra forma. A nossa
+        equipe gostaria de voltar no próximo ano. As bebidas estavam boas mas a sala estava quente
+        demais e era difícil ouvir as pessoas do fundo. Obrigado pelo convite, valeu a pena a viagem
+        e aprendi muito sobre gestão de dinheiro, contratação de pessoas e criação de uma marca. Nós
+        compramos o novo suco de frutas toda semana porque é fresco e não é muito doce.""",
+    'de': """Die Veranstaltung war sehr gut und die Sprecher waren klar. Ich finde, die Organisatoren
+        sollten am Ende mehr Zeit für Fragen lassen. Am besten hat mir die Diskussion mit den Gründern
+        gefallen, sie haben erzählt, wie sie ihr Unternehmen gestartet haben und was sie anders machen
+        würden. Unser Team möchte nächstes Jahr wieder teilnehmen. Die Getränke waren gut, aber der
+        Raum war zu warm und hinten konnte man die Leute schlecht hören. Danke für die Einladung, die
+        Reise hat sich gelohnt und ich habe viel über Geld, die Einstellung von Mitarbeitern und den
+        Aufbau einer Marke gelernt. Wir kaufen den neuen Fruchtsaft jede Woche, weil er frisch und
+        nicht zu süß ist.""",
+    'it': """La sessione è stata molto buona e i relatori sono stati chiari. Penso che gli
+        organizzatori dovrebbero lasciare più tempo per le domande alla fine. Quello che mi è piaciuto
+        di più è stato il panel con i fondatori, hanno raccontato come hanno avviato la loro azienda e
+        cosa farebbero diversamente. Il nostro gruppo vorrebbe tornare il prossimo anno. Le bevande
+        erano buone ma la sala era troppo calda ed era difficile sentire le persone in fondo. Grazie
+        per l'invito, il viaggio ne è valsa la pena e ho imparato molto sulla gestione del denaro,
+        sulle assunzioni e sulla creazione di un marchio. Compriamo il nuovo succo di frutta ogni
+        settimana perché è fresco e non troppo dolce.""",
+    'nl': """De sessie was erg goed en de sprekers waren duidelijk. Ik vind dat de organisatoren aan
+        het einde meer tijd voor vragen moeten geven. Wat ik het leukst vond was het panel met de
+        oprichters, ze vertelden hoe ze hun bedrijf zijn begonnen en wat ze anders zouden doen. Ons
+        team wil volgend jaar graag weer komen. De drankjes waren lekker maar de zaal was te warm en
+        achterin kon je de mensen slecht horen. Bedankt voor de uitnodiging, de reis was het waard en
+        ik heb veel geleerd over geld beheren, mensen aannemen en een merk opbouwen. We kopen elke
+        week het nieuwe vruchtensap omdat het vers is en niet te zoet.""",
+}
+
+
+def _trigrams(text):
+    # lower case letters only, each word padded with spaces so word starts and ends count
+    words = re.findall(r"[^\W\d_]+", text.lower())
+    grams = []
+    for word in words:
+        padded = f" {word} "
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _build_profiles():
+    profiles = {}
+    for language, sample in SAMPLE_TEXTS.items():
+        counts = Counter(_trigrams(sample))
+        total = sum(counts.values())
+        # add-one smoothing, unseen trigrams get the probability of a single occurrence
+        vocabulary = len(counts) + 1
+        profiles[language] = ({gram: math.log((count + 1) / (total + vocabulary)) for gram, count in counts.items()},
+                              math.log(1 / (total + vocabulary)))
+    return profiles
+
+
+PROFILES = _build_profiles()
+
+
+@lru_cache(maxsize=100_000)
+def detect_language(text):
+    """Function to detect the language of an answer.
+
+    Parameters
+    ----------
+    text: str
+        The answer.
+
+    Returns
+    -------
+    language: str
+        The ISO 639-1 code of the language, or 'und' if the answer is too short to tell.
+    """
+    letters = sum(character.isalpha() for character in text)
+    if letters < MIN_LETTERS:
+        return UNDETERMINED
+    grams = Counter(_trigrams(text))
+    scores = {}
+    for language, (log_probabilities, unseen) in PROFILES.items():
+        scores[language] = sum(count * log_probabilities.get(gram, unseen) for gram, count in grams.items())
+    best = max(scores, key=scores.get)
+    if best != ENGLISH and (scores[best] - scores[ENGLISH]) / sum(grams.values()) < ENGLISH_MARGIN:
+        return ENGLISH
+    return best
+
+
+def detect_languages(series):
+    """Function to detect the language of every answer of an open_ended question.
+    Each distinct answer is only detected once.
+
+    Parameters
+    ----------
+    series: Pandas Series
+        The answers.
+
+    Returns
+    -------
+    languages: Pandas Series
+        The language of each answer, missing for a missing or empty answer.
+    """
+    codes, answers = pd.factorize(series)
+    languages = [detect_language(str(answer)) if str(answer).strip() else None for answer in answers]
+    # code -1 (missing) picks the None at the end
+    return pd.Series(np.array(languages + [None], dtype=object)[codes], index=series.index)
+
+
+def add_language_columns(df, columns_to_detect):
+    """Function to add the detected language of the answers as new columns.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame
+        This is the dataframe with the quest survey responses.
+    columns_to_detect: list
+        List of open_ended column names.
+
+    Returns
+    -------
+    df: Pandas DataFrame
+        A new DataFrame with a '<column>_language' column for each open_ended column.
+    language_columns: list
+        This is a list of the language columns for plotting
+    """
+    df = df.copy(deep=False)
+    language_columns = []
+    for column in columns_to_detect:
+        new_column = column + "_language"
+        language_columns.append(new_column)
+        df[new_column] = detect_languages(df[column])
+    return df, language_columns
+
+
+def english_answers(df, column):
+    """Function to select the answers of a column that should go through the English-only steps.
+    An answer is selected if it is not missing nor empty, and if its detected language
+    (in the '<column>_language' column, when there is one) is English or undetermined.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame
+    column: str
+
+    Returns
+    -------
+    mask: Pandas Series of bool
+    """
+    answers = df[column]
+    mask = answers.notna() & (answers.astype(str).str.strip() != '')
+    language_column = column + "_language"
+    if language_column in df.columns:
+        mask &= df[language_column].isin([ENGLISH, UNDETERMINED])
+    return mask
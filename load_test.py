@@ -0,0 +1,179 @@
+"""This script load tests the /charts endpoint and reports the latency percentiles and the throughput.
+
+Without --url the requests go through the Flask test client, in process:
+    python load_test.py --requests 100 --concurrency 4
+With --url they go to a running server:
+    python load_test.py --url http://localhost:5000 --requests 500 --concurrency 16 --field lazy=true
+
+Identical requests in flight are coalesced by the server (see single_flight), so
+every request gets its own quest_id by default and is computed on its own.
+With --same-quest-id the requests are identical, to measure the coalescing.
+The summary reports how many responses were coalesced.
+"""
+
+import argparse
+import io
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def make_sender(url, quest_data, quest_metadata, fields, unique_quest_ids=True):
+    """Function to make the function that posts one survey to /charts.
+    Each thread gets its own HTTP session (or test client).
+
+    Parameters
+    ----------
+    url: str or None
+        The base url of the server, None to use the Flask test client.
+    quest_data: bytes
+        The quest survey responses file.
+    quest_metadata: bytes
+        The quest survey metadata file.
+    fields: dict
+        The form fields (eg., quest_id, lazy).
+    unique_quest_ids: bool
+        If True, the number of the request is appended to the quest_id, so the
+        requests differ and the server doesn't coalesce them.
+
+    Returns
+    -------
+    send: function
+        Posts the survey with the number of the request, and returns the status
+        code and whether the server coalesced the request.
+    """
+    local = threading.local()
+
+    def request_fields(number):
+        if not unique_quest_ids:
+            return dict(fields)
+        return dict(fields, quest_id=f"{fields.get('quest_id', '')}-{number}")
+
+    if url:
+        import requests
+
+        def send(number):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            files = {'quest_data': ('quest_data.csv', quest_data),
+                     'quest_metadata': ('quest_metadata.csv', quest_metadata)}
+            response = local.session.post(url.rstrip('/') + '/charts', data=request_fields(number), files=files)
+            return response.status_code, response.headers.get('X-Coalesced') == 'true'
+        return send
+
+    from flask_api import app
+
+    def send(number):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        data = dict(request_fields(number),
+                    quest_data=(io.BytesIO(quest_data), 'quest_data.csv'),
+                    quest_metadata=(io.BytesIO(quest_metadata), 'quest_metadata.csv'))
+        response = local.client.post('/charts', data=data, content_type='multipart/form-data')
+        return response.status_code, response.headers.get('X-Coalesced') == 'true'
+    return send
+
+
+def run_load_test(send, n_requests, concurrency):
+    """Function to send the requests from a pool of threads.
+
+    Parameters
+    ----------
+    send: function
+        Sends the request of a number, and returns its status code and whether it was coalesced.
+    n_requests: int
+    concurrency: int
+        The number of requests in flight at the same time.
+
+    Returns
+    -------
+    latencies: list
+        The latency of each request, in seconds.
+    statuses: list
+        The status code of each request, None when the request failed.
+    coalesced: list
+        Whether the server coalesced each request with an identical one in flight.
+    elapsed: float
+        The wall time of the whole test, in seconds.
+    """
+    def timed_send(number):
+        start = time.perf_counter()
+        try:
+            status, coalesced = send(number)
+        except Exception:
+            status, coalesced = None, False
+        return time.perf_counter() - start, status, coalesced
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_send, range(n_requests)))
+    elapsed = time.perf_counter() - start
+    latencies, statuses, coalesced = (list(values) for values in zip(*results)) if results else ([], [], [])
+    return latencies, statuses, coalesced, elapsed
+
+
+def summarize(latencies, statuses, coalesced, elapsed):
+    """Function to compute the latency percentiles and the throughput of a test.
+    The coalesced requests waited for the computation of another request, so their
+    latencies don't measure a computation of their own.
+
+    Returns
+    -------
+    summary: dict
+        The latencies are in milliseconds and the throughput in requests per second.
+    """
+    latencies = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (None, None, None)
+    return {'requests': len(latencies),
+            'errors': sum(status is None or status >= 400 for status in statuses),
+            'coalesced': int(sum(coalesced)),
+            'elapsed_seconds': round(elapsed, 3),
+            'throughput': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'mean_ms': round(float(latencies.mean()), 2) if len(latencies) else None,
+            'p50_ms': None if p50 is None else round(float(p50), 2),
+            'p95_ms': None if p95 is None else round(float(p95), 2),
+            'p99_ms': None if p99 is None else round(float(p99), 2),
+            'max_ms': round(float(latencies.max()), 2) if len(latencies) else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the /charts endpoint.")
+    parser.add_argument('--url', default=None,
+                        help="Base url of the server. The default is the Flask test client, in process.")
+    parser.add_argument('--quest-data', default='data/response_id.csv')
+    parser.add_argument('--quest-metadata', default='data/csv_quest_meta_data.csv')
+    parser.add_argument('--quest-id', default='load_test',
+                        help="The quest_id of the requests, the number of each request is appended to it.")
+    parser.add_argument('--same-quest-id', action='store_true',
+                        help="Send the same quest_id with every request, so identical requests are coalesced.")
+    parser.add_argument('--field', action='append', default=[],
+                        help="Extra form field as name=value (eg., lazy=true), can be repeated.")
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=2,
+                        help="Requests sent before the test, they are not measured.")
+    args = parser.parse_args(argv)
+
+    with open(args.quest_data, 'rb') as f:
+        quest_data = f.read()
+    with open(args.quest_metadata, 'rb') as f:
+        quest_metadata = f.read()
+    fields = dict(field.split('=', 1) for field in args.field)
+    fields.setdefault('quest_id', args.quest_id)
+
+    send = make_sender(args.url, quest_data, quest_metadata, fields, unique_quest_ids=not args.same_quest_id)
+    # the warmup requests are numbered after the measured ones, so they don't share a quest_id
+    for number in range(args.warmup):
+        send(args.requests + number)
+    latencies, statuses, coalesced, elapsed = run_load_test(send, args.requests, args.concurrency)
+    summary = summarize(latencies, statuses, coalesced, elapsed)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
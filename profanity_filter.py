@@ -0,0 +1,64 @@
+"""This script contains the profanity matcher used to count profanities in open_ended answers.
+The bundled word list is compiled once into a single regular expression,
+which is then run on every distinct answer of a column.
+"""
+
+import re
+
+
+# Bundled word list. Common suffixes (eg., -s, -ing, -ed) are matched by the pattern.
+PROFANITY_WORDS = [
+    'arse', 'arsehole', 'ass', 'asshole', 'bastard', 'bitch', 'bloody', 'bollocks', 'bugger', 'bullshit',
+    'crap', 'cunt', 'damn', 'dick', 'dickhead', 'dumbass', 'fuck', 'fucker', 'fucking', 'goddamn',
+    'jackass', 'motherfucker', 'piss', 'pissed', 'prick', 'shit', 'shitty', 'slut', 'twat', 'wanker',
+    'whore', 'wtf',
+]
+
+# Suffixes allowed after a word of the list
+PROFANITY_SUFFIXES = ['s', 'es', 'ed', 'er', 'ers', 'ing', 'y']
+
+
+def compile_profanity_pattern(words=PROFANITY_WORDS, suffixes=PROFANITY_SUFFIXES):
+    """Function to compile a word list into a single case insensitive regular expression.
+    The longest words come first, so the alternation always matches a whole word.
+
+    Parameters
+    ----------
+    words: list
+        The profanities.
+    suffixes: list
+        The suffixes allowed after a word.
+
+    Returns
+    -------
+    pattern: compiled regular expression
+    """
+    alternation = '|'.join(re.escape(word) for word in sorted(set(words), key=len, reverse=True))
+    suffix = '|'.join(re.escape(ending) for ending in sorted(set(suffixes), key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternation})(?:{suffix})?\b", re.IGNORECASE)
+
+
+PROFANITY_PATTERN = compile_profanity_pattern()
+
+
+def count_profanity_matches(series, pattern=PROFANITY_PATTERN):
+    """Function to count the profanities in the answers of a column.
+    The pattern is run once per distinct answer, and the counts are weighted by
+    the number of times each answer was given.
+
+    Parameters
+    ----------
+    series: Pandas Series
+        The answers.
+    pattern: compiled regular expression, optional
+        The default is the pattern of the bundled word list.
+
+    Returns
+    -------
+    count: int
+    """
+    answers = series.dropna().astype(str).value_counts()
+    if answers.empty:
+        return 0
+    matches = answers.index.to_series().str.count(pattern)
+    return int((matches.to_numpy() * answers.to_numpy()).sum())
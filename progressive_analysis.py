@@ -0,0 +1,395 @@
+"""This script contains the progressive mode of the /charts endpoint.
+
+The whole analysis of a big survey takes minutes, mostly in the text steps.
+In progressive mode the endpoint first runs the analysis on a stratified random
+sample of the respondents, sized to fit a time budget, and sends that preview
+with every count scaled to the whole survey and given its sampling error. The
+payloads that are not counts (eg., the raw values of a boxplot, the word
+clouds or the GeoJSON points) stay those of the sample, and are marked as
+such. The exact result of the whole survey follows in the same response. Both
+are records of an NDJSON stream, like the batch endpoint.
+
+The time budget sizes the sample, from the seconds per answer of the exact
+analyses the process already ran, so the previews get closer to the budget over
+time. When even the smallest sample is estimated over the budget, the text steps
+(the slowest ones) of the preview are skipped.
+
+The counts of respondents (eg., the answers of a question) are scaled by the
+share of the respondents in the sample, and the counts of answers (eg., the
+invalid answers or the profanities) by the share of the answers in the sample.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis_skeleton import get_respondent_keys, run_quest_analysis
+
+
+# Seconds the preview should take
+PREVIEW_TIME_BUDGET = 1.0
+# Largest time budget a request can ask for
+MAX_PREVIEW_TIME_BUDGET = 30.0
+# Smallest number of respondents of a preview, below that the errors are too large to be useful
+PREVIEW_MIN_RESPONDENTS = 100
+# Column of the quest data the respondents are stratified by
+STRATA_COLUMN = 'country'
+# Seconds per answer (row of the quest data) assumed before any exact analysis ran
+DEFAULT_SECONDS_PER_ANSWER = 0.0005
+# z-score of the 95% error bars
+ERROR_Z = 1.96
+# The charts of counts get error bars: the field of their counts and the field of the errors.
+# A chart without its count field (eg., a histogram of raw values) stays that of the sample
+COUNT_FIELDS = {'bar_graph': ('y_values', 'y_errors'),
+                'pie_chart': ('sizes', 'size_errors'),
+                'horizontal_bar_chart': ('user_count', 'user_count_errors'),
+                'line_chart': ('counts', 'count_errors'),
+                'histogram': ('counts', 'count_errors'),
+                'grouped_bar_graph': ('y_values', 'y_errors'),
+                'grouped_histogram': ('y_values', 'y_errors'),
+                'stacked_bar_graph': ('counts', 'count_errors'),
+                'heatmap': ('z_values', 'z_errors'),
+                'geo_heatmap': ('counts', 'count_errors')}
+# Other fields of the charts of counts that are counts too, they are scaled without error bars
+TOTAL_FIELDS = {'heatmap': ['z_range'],
+                'geo_heatmap': ['total_points']}
+# The counts of respondents of the quick analysis and of the respondent quality
+ANALYSIS_COUNT_FIELDS = ['number of responses']
+# The counts of answers of the quick analysis, they are scaled by the share of the answers in the sample
+ANSWER_COUNT_FIELDS = ['invalid_responses', 'profanities', 'profanities_per_question']
+QUALITY_COUNT_FIELDS = ['respondents', 'speeders', 'straight_liners', 'duplicates', 'flagged', 'excluded']
+# The counts of the summary of every scaling question, and the field of their errors
+SCALING_COUNT_FIELDS = {'responses': 'response_errors', 'counts': 'count_errors'}
+# The payloads of the result that are always those of the sample
+SAMPLE_ONLY_PAYLOADS = ['geojson']
+
+
+class AnalysisCostEstimate:
+    """Running estimate of the seconds the analysis takes per answer, shared by the requests of a process.
+
+    Parameters
+    ----------
+    seconds_per_answer: float
+        The estimate before any analysis was observed.
+    smoothing: float
+        The weight of a new observation in the moving average.
+    """
+
+    def __init__(self, seconds_per_answer=DEFAULT_SECONDS_PER_ANSWER, smoothing=0.3):
+        self.seconds_per_answer = seconds_per_answer
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def observe(self, answers, seconds):
+        """Function to update the estimate with the duration of an exact analysis.
+
+        Parameters
+        ----------
+        answers: int
+            The number of rows of the quest data.
+        seconds: float
+        """
+        if answers <= 0:
+            return
+        with self._lock:
+            self.seconds_per_answer += self.smoothing * (seconds / answers - self.seconds_per_answer)
+
+    def sample_size(self, answers, respondents, time_budget):
+        """Function to get the number of respondents whose analysis fits the time budget.
+
+        Parameters
+        ----------
+        answers: int
+            The number of rows of the quest data.
+        respondents: int
+        time_budget: float
+            In seconds.
+
+        Returns
+        -------
+        sample_size: int
+        """
+        answers_per_respondent = answers / max(respondents, 1)
+        affordable = time_budget / (self.seconds_per_answer * max(answers_per_respondent, 1.0))
+        return int(min(max(affordable, PREVIEW_MIN_RESPONDENTS), respondents))
+
+    def seconds(self, answers):
+        """Function to estimate the seconds the analysis of a number of answers takes.
+
+        Parameters
+        ----------
+        answers: int
+            The number of rows of the quest data.
+
+        Returns
+        -------
+        seconds: float
+        """
+        return answers * self.seconds_per_answer
+
+
+def clamp_time_budget(time_budget, max_time_budget=MAX_PREVIEW_TIME_BUDGET):
+    """Function to read the time budget of a request.
+
+    Parameters
+    ----------
+    time_budget: str or float
+    max_time_budget: float
+        Larger budgets are lowered to it.
+
+    Returns
+    -------
+    time_budget: float
+
+    Raises
+    ------
+    ValueError
+        When the time budget is not a positive number of seconds.
+    """
+    time_budget = float(time_budget)
+    if not time_budget > 0:
+        raise ValueError(f"time budget of {time_budget} seconds is not positive")
+    return min(time_budget, max_time_budget)
+
+
+def sample_respondents(quest_data, sample_size, strata_column=STRATA_COLUMN, random_state=0):
+    """Function to draw a stratified random sample of the respondents of a survey.
+    Every stratum (eg., country) keeps its share of the respondents, with at least one respondent.
+    The respondents are those of the analysis, see 'get_respondent_keys'.
+
+    Parameters
+    ----------
+    quest_data: Pandas DataFrame
+        The raw quest survey responses, one row per answer.
+    sample_size: int
+        The number of respondents to draw.
+    strata_column: str
+        The column the respondents are stratified by. A random sample is drawn without it.
+    random_state: int
+
+    Returns
+    -------
+    sample: Pandas DataFrame
+        The answers of the sampled respondents.
+    """
+    # the respondent code of every answer, and the first answer of every respondent.
+    # The answers without a key are one respondent, like in the analysis
+    codes = pd.factorize(get_respondent_keys(quest_data), use_na_sentinel=False)[0]
+    first = ~pd.Series(codes).duplicated().to_numpy()
+    n_respondents = int(first.sum())
+    if strata_column in quest_data.columns:
+        strata = pd.factorize(quest_data[strata_column].to_numpy()[first])[0]
+    else:
+        strata = np.zeros(n_respondents, dtype='int64')
+    # missing strata are a stratum of their own
+    strata = np.where(strata < 0, strata.max() + 1, strata)
+
+    # each respondent gets a random rank within its stratum, and is kept if the rank is under the quota
+    random_keys = np.random.RandomState(random_state).random_sample(n_respondents)
+    ranks = pd.Series(random_keys).groupby(strata).rank(method='first').to_numpy() - 1
+    sizes = np.bincount(strata)
+    quotas = np.maximum(np.round(sizes * sample_size / n_respondents), 1)
+    # the codes are numbered in the order of the first answers, so the respondent of code i is sampled[i]
+    sampled = ranks < quotas[strata]
+    return quest_data[sampled[codes]]
+
+
+def scale_counts(counts, population, sample_size, z=ERROR_Z):
+    """Function to scale counts of a sample to the whole survey, with their errors.
+    The error is the one of a simple random sample, with the finite population correction.
+    The error of a stratified sample with proportional allocation is at most that.
+    The population and the sample are in the unit of the counts: respondents or answers.
+
+    Parameters
+    ----------
+    counts: int or list
+        A count, or a (nested) list of counts.
+    population: int
+        The number of respondents (or answers) of the survey.
+    sample_size: int
+        The number of respondents (or answers) of the sample.
+    z: float
+        The z-score of the errors.
+
+    Returns
+    -------
+    scaled: int or list
+        The counts scaled to the survey, with the shape of counts.
+    errors: float or list
+    """
+    counts = np.asarray(counts, dtype='float64')
+    correction = np.sqrt((population - sample_size) / max(population - 1, 1))
+    shares = np.clip(counts / sample_size, 0.0, 1.0)
+    errors = z * population * np.sqrt(shares * (1 - shares) / sample_size) * correction
+    return np.round(counts * population / sample_size).astype('int64').tolist(), np.round(errors, 2).tolist()
+
+
+def add_sampling_errors(charts, respondents, sample_size, z=ERROR_Z):
+    """Function to scale the counts of the preview charts to the whole survey, with their error bars.
+    The charts that are not counts get 'sample_only', their values are those of the sample.
+
+    Parameters
+    ----------
+    charts: list
+        The charts computed on the sample, they are updated.
+    respondents: int
+        The number of respondents of the survey.
+    sample_size: int
+        The number of respondents of the sample.
+    z: float
+        The z-score of the error bars.
+
+    Returns
+    -------
+    charts: list
+    """
+    if sample_size <= 0:
+        return charts
+    for chart in charts:
+        plot_type = chart.get('plot_type')
+        count_field, error_field = COUNT_FIELDS.get(plot_type, (None, None))
+        # the correlation heatmaps carry their 'method', their values are statistics, not counts
+        if count_field not in chart or chart.get('method'):
+            chart['sample_only'] = True
+            continue
+        chart[count_field], chart[error_field] = scale_counts(chart[count_field], respondents, sample_size, z)
+        for field in TOTAL_FIELDS.get(plot_type, []):
+            chart[field] = scale_counts(chart[field], respondents, sample_size, z)[0]
+    return charts
+
+
+def add_result_sampling_errors(result, respondents, sample_size, answers=None, sample_answers=None, z=ERROR_Z):
+    """Function to scale every count of a preview result to the whole survey, with their errors.
+    The charts are scaled with 'add_sampling_errors'. The counts of the quick analysis and of
+    the respondent quality get their errors in 'sampling_errors', and the result lists the
+    payloads that stay those of the sample in 'sample_only'. The counts of answers are scaled
+    with the numbers of answers, the others with the numbers of respondents.
+
+    Parameters
+    ----------
+    result: dict
+        The output of 'run_quest_analysis' on the sample, it is updated.
+    respondents: int
+        The number of respondents of the survey.
+    sample_size: int
+        The number of respondents of the sample.
+    answers: int, optional
+        The number of answers (rows of the quest data) of the survey. The default is the respondents.
+    sample_answers: int, optional
+        The number of answers of the sample. The default is the sample_size.
+    z: float
+        The z-score of the errors.
+
+    Returns
+    -------
+    result: dict
+    """
+    if sample_size <= 0:
+        return result
+    add_sampling_errors(result['charts'], respondents, sample_size, z)
+    add_sampling_errors(result['segment_charts'], respondents, sample_size, z)
+    add_sampling_errors([result['geo_heatmap']], respondents, sample_size, z)
+
+    # the quick analysis sends its counts as strings
+    analysis_result = result['analysis_result']
+    answers = respondents if answers is None else answers
+    sample_answers = sample_size if sample_answers is None else sample_answers
+    errors = {}
+    for field in ANALYSIS_COUNT_FIELDS + ANSWER_COUNT_FIELDS:
+        population, sample = (answers, sample_answers) if field in ANSWER_COUNT_FIELDS else (respondents, sample_size)
+        if isinstance(analysis_result.get(field), dict):
+            scaled = {key: scale_counts(int(count), population, sample, z)
+                      for key, count in analysis_result[field].items()}
+            analysis_result[field] = {key: str(count) for key, (count, _) in scaled.items()}
+            errors[field] = {key: str(error) for key, (_, error) in scaled.items()}
+        elif field in analysis_result:
+            count, error = scale_counts(int(analysis_result[field]), population, sample, z)
+            analysis_result[field], errors[field] = str(count), str(error)
+    analysis_result['sampling_errors'] = errors
+
+    quality = result['respondent_quality']
+    errors = {}
+    for field in QUALITY_COUNT_FIELDS:
+        quality[field], errors[field] = scale_counts(quality[field], respondents, sample_size, z)
+    quality['sampling_errors'] = errors
+
+    for summary in result['scaling_summary']:
+        for count_field, error_field in SCALING_COUNT_FIELDS.items():
+            summary[count_field], summary[error_field] = scale_counts(summary[count_field], respondents,
+                                                                      sample_size, z)
+    result['sample_only'] = [payload for payload in SAMPLE_ONLY_PAYLOADS if payload in result]
+    return result
+
+
+def progressive_analysis(quest_data, quest_metadata, quest_id, time_budget=PREVIEW_TIME_BUDGET,
+                         cost_estimate=None, **options):
+    """Function to run the analysis of a survey on a sample first, then on all the respondents.
+    This is a generator, the preview record is yielded first (unless the whole survey fits the
+    time budget) and the exact record last. The time budget sizes the sample, and the text steps
+    of the preview are skipped when the sample is still estimated over it.
+
+    Parameters
+    ----------
+    quest_data: Pandas DataFrame
+        The raw quest survey responses.
+    quest_metadata: Pandas DataFrame
+        The raw quest survey metadata.
+    quest_id: str
+        The unique id of the quest survey.
+    time_budget: float
+        The seconds the preview should take, see 'clamp_time_budget'.
+    cost_estimate: AnalysisCostEstimate, optional
+        The estimate the sample is sized with, updated with the exact analysis.
+    options:
+        The other arguments of 'run_quest_analysis'.
+
+    Returns
+    -------
+    records: generator of dict
+        The 'stage' ('preview' or 'exact'), the status, the timing and the analysis
+        result (or the error). The preview also has its 'sample_size' and 'respondents', whether its
+        text steps were skipped, and its counts are scaled to the whole survey, see 'add_result_sampling_errors'.
+    """
+    quest_id = str(quest_id)
+    cost_estimate = cost_estimate or AnalysisCostEstimate()
+    respondents = int(get_respondent_keys(quest_data).nunique(dropna=False))
+    sample_size = cost_estimate.sample_size(len(quest_data), respondents, time_budget)
+
+    if sample_size < respondents:
+        start = time.perf_counter()
+        # the smallest sample can still be over the budget, its text steps (the slowest) are then skipped
+        skip_text = cost_estimate.seconds(sample_size * len(quest_data) / max(respondents, 1)) > time_budget
+        try:
+            sample = sample_respondents(quest_data, sample_size)
+            sample_size = int(get_respondent_keys(sample).nunique(dropna=False))
+            result = run_quest_analysis(sample, quest_metadata, quest_id, skip_text=skip_text, **options)
+            add_result_sampling_errors(result, respondents, sample_size,
+                                       answers=len(quest_data), sample_answers=len(sample))
+            status, error = 'ok', None
+        except Exception as e:
+            result, status, error = None, 'error', str(e)
+        yield {'quest_id': quest_id,
+               'stage': 'preview',
+               'status': status,
+               'sample_size': sample_size,
+               'respondents': respondents,
+               'text_skipped': skip_text,
+               'elapsed_seconds': round(time.perf_counter() - start, 4),
+               'error': error,
+               'result': result}
+
+    start = time.perf_counter()
+    try:
+        result = run_quest_analysis(quest_data, quest_metadata, quest_id, **options)
+        status, error = 'ok', None
+        cost_estimate.observe(len(quest_data), time.perf_counter() - start)
+    except Exception as e:
+        result, status, error = None, 'error', str(e)
+    yield {'quest_id': quest_id,
+           'stage': 'exact',
+           'status': status,
+           'elapsed_seconds': round(time.perf_counter() - start, 4),
+           'error': error,
+           'result': result}
@@ -0,0 +1,183 @@
+"""This script contains the request guardrails of the /charts endpoint.
+
+Uploads above the hard size limit are rejected. Surveys above the soft limits
+(upload bytes, rows, questions or estimated memory) are still analyzed, with an
+adaptive plan that degrades the most expensive steps. The memory is estimated
+from the size of the upload, before it is parsed. The same plan is applied to the
+full, the progressive, the lazy and the batch analyses:
+- the open_ended answers are sampled before text correction,
+- the numeric charts are sent as summaries instead of raw values,
+- the word clouds are skipped.
+"""
+
+import os
+
+
+# A CSV upload read into a frame is about this many times its size
+UPLOAD_EXPANSION_FACTOR = 3
+# The parsed survey, the merged frame and the text columns are about this many times the raw data
+MEMORY_OVERHEAD_FACTOR = 4
+
+
+class RequestLimits:
+    """The configurable limits of a request. A limit of None is never exceeded.
+
+    Parameters
+    ----------
+    max_upload_bytes: int
+        Hard limit, larger uploads are rejected.
+    degrade_upload_bytes: int
+        Soft limit on the upload size.
+    degrade_rows: int
+        Soft limit on the number of respondents.
+    degrade_questions: int
+        Soft limit on the number of questions.
+    degrade_memory_bytes: int
+        Soft limit on the estimated memory of the analysis.
+    text_sample_size: int
+        The number of respondents whose open_ended answers are kept when sampling.
+    """
+
+    def __init__(self, max_upload_bytes=None, degrade_upload_bytes=None, degrade_rows=None,
+                 degrade_questions=None, degrade_memory_bytes=None, text_sample_size=5000):
+        self.max_upload_bytes = max_upload_bytes
+        self.degrade_upload_bytes = degrade_upload_bytes
+        self.degrade_rows = degrade_rows
+        self.degrade_questions = degrade_questions
+        self.degrade_memory_bytes = degrade_memory_bytes
+        self.text_sample_size = text_sample_size
+
+    @classmethod
+    def from_config(cls, config):
+        """Function to read the limits from the Flask config, falling back on environment variables.
+
+        Parameters
+        ----------
+        config: dict
+
+        Returns
+        -------
+        limits: RequestLimits
+        """
+        def read(name, default=None):
+            value = config.get(name, os.environ.get(name, default))
+            return int(value) if value is not None else None
+
+        return cls(max_upload_bytes=read('MAX_UPLOAD_BYTES'),
+                   degrade_upload_bytes=read('DEGRADE_UPLOAD_BYTES'),
+                   degrade_rows=read('DEGRADE_ROWS'),
+                   degrade_questions=read('DEGRADE_QUESTIONS'),
+                   degrade_memory_bytes=read('DEGRADE_MEMORY_BYTES'),
+                   text_sample_size=read('DEGRADE_TEXT_SAMPLE_SIZE', 5000))
+
+
+def exceeds(value, limit):
+    """Function to check a value against a limit, None is no limit."""
+    return limit is not None and value is not None and value > limit
+
+
+def estimate_memory(upload_bytes):
+    """Function to estimate the memory needed to analyze a survey, from the size of its upload.
+
+    Parameters
+    ----------
+    upload_bytes: int, optional
+        The size of the upload.
+
+    Returns
+    -------
+    memory_bytes: int
+        None when the size of the upload is unknown.
+    """
+    if upload_bytes is None:
+        return None
+    return int(upload_bytes) * UPLOAD_EXPANSION_FACTOR * MEMORY_OVERHEAD_FACTOR
+
+
+def check_upload(limits, upload_bytes):
+    """Function to check the size of an upload against the hard limit, before it is parsed.
+
+    Parameters
+    ----------
+    limits: RequestLimits
+    upload_bytes: int, optional
+
+    Returns
+    -------
+    error: str
+        None when the upload is accepted.
+    """
+    if limits is not None and exceeds(upload_bytes, limits.max_upload_bytes):
+        return f"upload of {upload_bytes} bytes is over the limit of {limits.max_upload_bytes}"
+    return None
+
+
+def plan_degradations(limits, df, upload_bytes=None):
+    """Function to decide which steps of the analysis are degraded.
+
+    Parameters
+    ----------
+    limits: RequestLimits
+    df: Pandas DataFrame
+        The parsed survey data, one row per respondent and one column per question.
+    upload_bytes: int, optional
+        The size of the upload.
+
+    Returns
+    -------
+    plan: dict
+        'text_sample_size' (None when the text is not sampled), 'numeric_summaries'
+        and 'skip_wordcloud', with the 'reasons' the limits were exceeded. 'skip_text'
+        is always False, it is set by the analysis of a preview over its time budget.
+    """
+    plan = {'text_sample_size': None, 'numeric_summaries': False, 'skip_wordcloud': False, 'skip_text': False,
+            'reasons': []}
+    if limits is None:
+        return plan
+
+    memory_bytes = estimate_memory(upload_bytes)
+    too_big = exceeds(upload_bytes, limits.degrade_upload_bytes)
+    too_many_rows = exceeds(len(df), limits.degrade_rows)
+    too_many_questions = exceeds(df.shape[1], limits.degrade_questions)
+    too_much_memory = exceeds(memory_bytes, limits.degrade_memory_bytes)
+
+    if too_big:
+        plan['reasons'].append(f"upload of {upload_bytes} bytes is over {limits.degrade_upload_bytes}")
+    if too_many_rows:
+        plan['reasons'].append(f"{len(df)} respondents is over {limits.degrade_rows}")
+    if too_many_questions:
+        plan['reasons'].append(f"{df.shape[1]} questions is over {limits.degrade_questions}")
+    if too_much_memory:
+        plan['reasons'].append(f"estimated memory of {memory_bytes} bytes is over {limits.degrade_memory_bytes}")
+
+    if (too_big or too_many_rows or too_much_memory) and len(df) > limits.text_sample_size:
+        plan['text_sample_size'] = limits.text_sample_size
+    if too_big or too_many_rows or too_many_questions or too_much_memory:
+        plan['numeric_summaries'] = True
+    if too_many_questions or too_much_memory:
+        plan['skip_wordcloud'] = True
+    return plan
+
+
+def describe_degradations(plan):
+    """Function to list the degradations of a plan, for the response.
+
+    Parameters
+    ----------
+    plan: dict
+        The output of 'plan_degradations'.
+
+    Returns
+    -------
+    degradations: dict
+    """
+    applied = []
+    if plan['text_sample_size'] is not None:
+        applied.append(f"open_ended answers sampled to {plan['text_sample_size']} respondents")
+    if plan['numeric_summaries']:
+        applied.append("numeric charts sent as summaries")
+    if plan['skip_wordcloud']:
+        applied.append("word clouds skipped")
+    if plan['skip_text']:
+        applied.append("text steps skipped")
+    return {'applied': applied, 'reasons': plan['reasons']}
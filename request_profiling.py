@@ -0,0 +1,98 @@
+"""This script contains the opt-in profiling of the /charts requests.
+
+A request is profiled when its quest_id is in the PROFILE_QUEST_IDS allowlist,
+or when it sends the X-Profile header with the PROFILE_TOKEN of the server.
+It then runs under cProfile and the stats are saved to
+<PROFILE_DIR>/<quest_id>/<time>-<pid>.pstats, eg., to open with
+    python -m pstats profiles/<quest_id>/<file>.pstats
+Other requests only pay for the allowlist and header lookups.
+"""
+
+import cProfile
+import os
+import re
+import threading
+import time
+
+
+# Header that turns the profiling on, its value must be the PROFILE_TOKEN of the server
+PROFILE_HEADER = 'X-Profile'
+
+# cProfile can't profile two requests at the same time, a request that
+# comes while another one is profiled runs without the profiler
+_profiler_lock = threading.Lock()
+
+
+def profiling_enabled(config, headers, quest_id):
+    """Function to check if a request should be profiled.
+
+    Parameters
+    ----------
+    config: dict
+        The Flask config, with the 'PROFILE_QUEST_IDS' allowlist and the 'PROFILE_TOKEN'.
+    headers: dict
+        The request headers.
+    quest_id: str
+
+    Returns
+    -------
+    enabled: bool
+    """
+    if quest_id is not None and str(quest_id) in config.get('PROFILE_QUEST_IDS', ()):
+        return True
+    token = config.get('PROFILE_TOKEN')
+    return bool(token) and headers.get(PROFILE_HEADER) == token
+
+
+def get_profile_path(directory, quest_id):
+    """Function to create the file path of a new profile of a quest survey.
+    The quest_id is reduced to safe characters, so the path stays inside the directory.
+
+    Parameters
+    ----------
+    directory: str
+    quest_id: str
+
+    Returns
+    -------
+    path: str
+    """
+    folder = re.sub(r'[^A-Za-z0-9_.-]', '_', str(quest_id)).strip('.') or '_'
+    os.makedirs(os.path.join(directory, folder), exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{threading.get_ident()}.pstats"
+    return os.path.join(directory, folder, name)
+
+
+def run_profiled(compute, directory, quest_id):
+    """Function to run a computation under cProfile and save its stats.
+    The stats are saved even if the computation fails.
+
+    Parameters
+    ----------
+    compute: function
+        Computes the result, without arguments.
+    directory: str
+        The folder the profiles are saved to.
+    quest_id: str
+
+    Returns
+    -------
+    result:
+        The result of the computation.
+    path: str or None
+        The path of the saved profile, None if another request was being profiled.
+    """
+    if not _profiler_lock.acquire(blocking=False):
+        return compute(), None
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            result = compute()
+        finally:
+            profiler.disable()
+            path = get_profile_path(directory, quest_id)
+            profiler.dump_stats(path)
+    finally:
+        _profiler_lock.release()
+    return result, path
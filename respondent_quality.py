@@ -0,0 +1,149 @@
+"""This script contains the quality scoring of the respondents of a quest survey.
+
+Every respondent is checked for three patterns of low quality answers:
+- speeders finished the survey much faster than the median respondent,
+- straight-liners gave the same score to all the scaling questions,
+- duplicates submitted exactly the same answers as an earlier respondent, with
+  something that two genuine respondents are unlikely to share: the same
+  open_ended text, answers to many questions, the same location, or a
+  submission shortly after the earlier one. Identical answers alone are
+  common in short multiple choice surveys.
+All the checks are vectorized over the wide frame (one row per respondent),
+so flagged respondents can be excluded before any chart is computed.
+"""
+
+import numpy as np
+import pandas as pd
+
+from scaling_analysis import build_score_matrix
+
+
+# A speeder took less than this share of the median completion time
+SPEEDER_RATIO = 0.4
+# Straight-lining is only checked for respondents with at least this many scaling answers
+STRAIGHTLINE_MIN_QUESTIONS = 3
+# Largest variance of the (0 to 1) scaling scores of a straight-liner, 0 is the same score everywhere
+STRAIGHTLINE_MAX_VARIANCE = 0.0
+# Identical answers to at least this many questions are a duplicate, even without other evidence
+DUPLICATE_MIN_ANSWERS = 10
+# Identical answers submitted within this many seconds of each other are a duplicate
+DUPLICATE_TIME_WINDOW = 60
+# Response metadata columns that place a respondent, identical answers from the same place are a duplicate
+LOCATION_COLUMNS = ['latitude', 'longitude']
+
+
+def score_respondents(df, response_metadata, scaling_columns, open_ended_columns=None, speeder_ratio=SPEEDER_RATIO,
+                      straightline_min_questions=STRAIGHTLINE_MIN_QUESTIONS,
+                      straightline_max_variance=STRAIGHTLINE_MAX_VARIANCE,
+                      duplicate_min_answers=DUPLICATE_MIN_ANSWERS, duplicate_time_window=DUPLICATE_TIME_WINDOW):
+    """Function to flag the speeders, the straight-liners and the duplicate submissions.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data
+    response_metadata: dataframe
+        The quest response metadata, with the 'quest_completion_time', the 'created_at'
+        and the location of each respondent.
+    scaling_columns: list
+        The scaling questions.
+    open_ended_columns: list, optional
+        The open_ended questions, identical text answers are a duplicate.
+    speeder_ratio: float
+    straightline_min_questions: int
+    straightline_max_variance: float
+    duplicate_min_answers: int
+    duplicate_time_window: float
+        In seconds.
+
+    Returns
+    -------
+    quality: dataframe
+        One row per respondent, with the 'completion_time_ratio' (to the median), the
+        'score_variance' of the scaling answers, the 'speeder', 'straight_liner' and
+        'duplicate' flags, and 'flagged' if any of them is set.
+    """
+    n_rows = len(df)
+
+    # speeders, relative to the median completion time
+    if 'quest_completion_time' in response_metadata.columns:
+        times = pd.to_numeric(response_metadata['quest_completion_time'], errors='coerce')
+        times = times.reindex(df.index).to_numpy(dtype='float64')
+    else:
+        times = np.full(n_rows, np.nan)
+    timed = ~np.isnan(times)
+    median = np.median(times[timed]) if timed.any() else np.nan
+    time_ratio = times / median if median > 0 else np.full(n_rows, np.nan)
+    speeder = timed & (time_ratio < speeder_ratio)
+
+    # straight-liners, the variance of each row of the scaling scores stretched to 0-1
+    scores, questions, scale_min, scale_max = build_score_matrix(df, scaling_columns)
+    normalized = (scores - scale_min) / np.maximum(scale_max - scale_min, 1.0)
+    answered = ~np.isnan(normalized)
+    counts = answered.sum(axis=1)
+    filled = np.where(answered, normalized, 0.0)
+    means = np.divide(filled.sum(axis=1), counts, out=np.zeros(n_rows), where=counts > 0)
+    squares = np.where(answered, (normalized - means[:, None]) ** 2, 0.0).sum(axis=1)
+    variance = np.divide(squares, counts, out=np.full(n_rows, np.nan), where=counts > 0)
+    straight_liner = (counts >= straightline_min_questions) & (variance <= straightline_max_variance)
+
+    # duplicate submissions, the same hashed answers as an earlier respondent ...
+    hashes = pd.util.hash_pandas_object(df, index=False).reset_index(drop=True)
+    answer_counts = df.notna().to_numpy().sum(axis=1)
+    same_answers = hashes.duplicated(keep='first').to_numpy() & (answer_counts > 0)
+
+    # ... with identical open_ended text, or many identical answers
+    open_ended_columns = [column for column in (open_ended_columns or []) if column in df.columns]
+    has_text = np.zeros(n_rows, dtype=bool)
+    for column in open_ended_columns:
+        has_text |= (df[column].notna() & (df[column].astype(str).str.strip() != '')).to_numpy()
+    evidence = has_text | (answer_counts >= duplicate_min_answers)
+
+    # ... or from the same location as another respondent with the same answers
+    metadata = response_metadata.reindex(df.index).reset_index(drop=True)
+    location_columns = [column for column in LOCATION_COLUMNS if column in metadata.columns]
+    if location_columns:
+        located = metadata[location_columns].notna().all(axis=1).to_numpy()
+        keys = pd.concat([hashes.rename('answers'), metadata[location_columns]], axis=1)
+        evidence |= located & keys.duplicated(keep=False).to_numpy()
+
+    # ... or submitted shortly before or after another respondent with the same answers
+    if 'created_at' in metadata.columns:
+        submitted = pd.to_datetime(metadata['created_at'], errors='coerce', utc=True)
+        order = submitted.sort_values(kind='stable').index
+        groups = submitted[order].groupby(hashes[order].to_numpy())
+        for periods in (1, -1):
+            gaps = groups.diff(periods).dt.total_seconds().abs()
+            evidence |= (gaps.reindex(hashes.index) <= duplicate_time_window).to_numpy()
+
+    duplicate = same_answers & evidence
+
+    return pd.DataFrame({'completion_time_ratio': time_ratio,
+                         'score_variance': variance,
+                         'speeder': speeder,
+                         'straight_liner': straight_liner,
+                         'duplicate': duplicate,
+                         'flagged': speeder | straight_liner | duplicate},
+                        index=df.index)
+
+
+def summarize_quality(quality, excluded=False):
+    """Function to count the flagged respondents, for the response.
+
+    Parameters
+    ----------
+    quality: dataframe
+        The output of 'score_respondents'.
+    excluded: bool
+        If the flagged respondents were left out of the analysis.
+
+    Returns
+    -------
+    summary: dict
+    """
+    return {'respondents': int(len(quality)),
+            'speeders': int(quality['speeder'].sum()),
+            'straight_liners': int(quality['straight_liner'].sum()),
+            'duplicates': int(quality['duplicate'].sum()),
+            'flagged': int(quality['flagged'].sum()),
+            'excluded': int(quality['flagged'].sum()) if excluded else 0}
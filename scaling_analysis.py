@@ -0,0 +1,265 @@
+"""This script contains the analysis of scaling questions.
+Every scaling question is mapped to ordinal scores once, then the means,
+distributions and NPS-style scores of all of them are computed together
+on a single score matrix (one row per respondent, one column per question).
+The results are sent to the front-end as radar chart and line chart data.
+
+The bounds of a numeric scale are the ones the question defines (in the metadata
+or in its text, eg., "On a scale from 1-6"), not the range of the answers, so a
+question everyone answered 5 to on a 1-5 scale scores at the top of its scale.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Known answer scales, from the lowest to the highest score. Matched without case.
+ORDINAL_SCALES = [
+    ['very poor', 'poor', 'fair', 'good', 'very good', 'excellent'],
+    ['strongly disagree', 'disagree', 'neutral', 'agree', 'strongly agree'],
+    ['very dissatisfied', 'dissatisfied', 'neutral', 'satisfied', 'very satisfied'],
+    ['very unlikely', 'unlikely', 'neutral', 'likely', 'very likely'],
+    ['never', 'rarely', 'sometimes', 'often', 'always'],
+    ['no', 'maybe', 'yes'],
+]
+
+# Range written in the text of a question, eg., "On a scale from 1-6" or "from 0 to 10"
+SCALE_TEXT_PATTERN = re.compile(r"\b(\d{1,2})\s*(?:-|–|to)\s*(\d{1,2})\b")
+# Wording of a Net Promoter Score question, answered on a 0-10 scale
+NPS_PATTERN = re.compile(r"\blikely\b.*\brecommend", re.IGNORECASE)
+NPS_SCALE = (0.0, 10.0)
+# Common numeric scales, the smallest one that holds all the answers is used when the question defines none
+STANDARD_SCALES = [(1.0, 5.0), (1.0, 7.0), (1.0, 10.0), (0.0, 10.0)]
+# Most scores in the distribution of a question, a wider scale (eg., from an outlier answer) has no distribution
+MAX_SCALE_LEVELS = 101
+
+
+def read_metadata_scales(df_meta):
+    """Function to read the scale of the questions that define one in the metadata,
+    with the optional 'scale_min' and 'scale_max' columns.
+
+    Parameters
+    ----------
+    df_meta: dataframe
+        The quest survey metadata
+
+    Returns
+    -------
+    scales: dict
+        The lowest and the highest score of each question.
+    """
+    if not {'scale_min', 'scale_max'}.issubset(df_meta.columns):
+        return {}
+    bounds = df_meta[['question', 'scale_min', 'scale_max']].copy()
+    bounds[['scale_min', 'scale_max']] = bounds[['scale_min', 'scale_max']].apply(pd.to_numeric, errors='coerce')
+    bounds = bounds.dropna()
+    return {row.question: (float(row.scale_min), float(row.scale_max))
+            for row in bounds.itertuples(index=False) if row.scale_max > row.scale_min}
+
+
+def resolve_numeric_scale(question, low, high, scale=None):
+    """Function to find the bounds of the numeric scale of a question.
+    The scale given (eg., from the metadata) comes first, then the range written in the question,
+    then 0-10 for an NPS question, then the smallest of STANDARD_SCALES. A scale is only used if
+    all the answers are on it. The range of the answers is the last resort.
+
+    Parameters
+    ----------
+    question: str
+        The text of the question.
+    low, high: float
+        The lowest and the highest answer.
+    scale: tuple, optional
+        The lowest and the highest score of the question, when it is known.
+
+    Returns
+    -------
+    scale: tuple
+    """
+    candidates = [scale] if scale is not None else []
+    match = SCALE_TEXT_PATTERN.search(str(question))
+    if match and int(match.group(1)) < int(match.group(2)):
+        candidates.append((float(match.group(1)), float(match.group(2))))
+    if NPS_PATTERN.search(str(question)):
+        candidates.append(NPS_SCALE)
+    candidates.extend(STANDARD_SCALES)
+    for scale_min, scale_max in candidates:
+        if scale_min <= low and high <= scale_max:
+            return float(scale_min), float(scale_max)
+    return low, high
+
+
+def encode_ordinal(series, scale=None):
+    """Function to map the answers of a scaling question to ordinal scores.
+    Numeric answers are used as they are, on the scale of the question, see 'resolve_numeric_scale'.
+    Text answers are matched with ORDINAL_SCALES.
+
+    Parameters
+    ----------
+    series: Pandas Series
+        The answers of the scaling question, named with the question.
+    scale: tuple, optional
+        The lowest and the highest score of a numeric question, when it is known.
+
+    Returns
+    -------
+    scores: numpy array or None
+        The score of each answer, NaN for a missing answer.
+        None if the answers are not on a known scale.
+    scale: tuple
+        The lowest and the highest score of the scale.
+    """
+    answers = series.dropna()
+    numbers = pd.to_numeric(answers, errors='coerce')
+    if len(answers) and numbers.notna().all():
+        scores = pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64')
+        return scores, resolve_numeric_scale(series.name, float(numbers.min()), float(numbers.max()), scale)
+
+    # the distinct answers are matched once, then every row is looked up by its code
+    codes, labels = pd.factorize(series)
+    normalized = [str(label).strip().lower() for label in labels]
+    for scale in ORDINAL_SCALES:
+        if all(label in scale for label in normalized):
+            label_scores = np.array([scale.index(label) + 1 for label in normalized] + [np.nan], dtype='float64')
+            # code -1 (missing) picks the NaN at the end
+            return label_scores[codes], (1.0, float(len(scale)))
+    return None, None
+
+
+def build_score_matrix(df, scaling_columns, scales=None):
+    """Function to encode all the scaling questions into one score matrix.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data
+    scaling_columns: list
+        The scaling questions.
+    scales: dict, optional
+        The known scale of the numeric questions, see 'read_metadata_scales'.
+
+    Returns
+    -------
+    scores: numpy array
+        One row per respondent and one column per encoded question.
+    questions: list
+        The questions that could be encoded, in the column order.
+    scale_min, scale_max: numpy array
+        The lowest and the highest score of each question.
+    """
+    scales = scales or {}
+    columns, questions, scale_min, scale_max = [], [], [], []
+    for column in scaling_columns:
+        scores, scale = encode_ordinal(df[column], scales.get(column))
+        if scores is None:
+            continue
+        columns.append(scores)
+        questions.append(column)
+        scale_min.append(scale[0])
+        scale_max.append(scale[1])
+    if not columns:
+        return np.empty((len(df), 0)), [], np.empty(0), np.empty(0)
+    return np.column_stack(columns), questions, np.array(scale_min), np.array(scale_max)
+
+
+def analyze_scaling_questions(df, scaling_columns, created_at=None, survey_item_ids=None, scales=None):
+    """Function to compute the statistics and the charts data of all the scaling questions.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data
+    scaling_columns: list
+        The scaling questions.
+    created_at: Pandas Series, optional
+        The submission time of each row of the survey data, for the trend lines.
+    survey_item_ids: dict, optional
+        The survey_item_id of each question.
+    scales: dict, optional
+        The known scale of the numeric questions, see 'read_metadata_scales'.
+
+    Returns
+    -------
+    summary: list
+        The mean, the distribution and the NPS-style score of each question.
+    charts: list
+        A radar chart of the mean scores and a line chart of the mean score per day for each question.
+    """
+    survey_item_ids = survey_item_ids or {}
+    scores, questions, scale_min, scale_max = build_score_matrix(df, scaling_columns, scales=scales)
+    if not questions:
+        return [], []
+
+    answered = ~np.isnan(scores)
+    counts = answered.sum(axis=0)
+    totals = np.where(answered, scores, 0.0).sum(axis=0)
+    means = np.divide(totals, counts, out=np.full(len(questions), np.nan), where=counts > 0)
+    # a scale with a single score (only left when the answers define it) has no NPS nor normalized mean
+    span = scale_max - scale_min
+    scaled = span > 0
+    span = np.where(scaled, span, 1.0)
+    normalized_means = np.where(scaled, (means - scale_min) / span, np.nan)
+
+    # NPS-style score, the scale is stretched to 0-10: promoters are 9-10 and detractors 0-6
+    stretched = (scores - scale_min) / span * 10
+    promoters = (stretched >= 9).sum(axis=0)
+    detractors = (answered & (stretched <= 6)).sum(axis=0)
+    nps = np.divide((promoters - detractors) * 100.0, counts,
+                    out=np.full(len(questions), np.nan), where=(counts > 0) & scaled)
+
+    # distribution of the integer scores of all the questions in one bincount,
+    # the questions with more than MAX_SCALE_LEVELS scores get an empty distribution
+    levels = scale_max - scale_min + 1
+    levels = np.where(levels <= MAX_SCALE_LEVELS, levels, 0).astype('int64')
+    offsets = np.concatenate([[0], np.cumsum(levels)[:-1]])
+    level_codes = np.rint(np.where(answered, scores - scale_min, -1)).astype('int64')
+    in_scale = answered & (level_codes >= 0) & (level_codes < levels)
+    distribution = np.bincount((level_codes + offsets)[in_scale], minlength=int(levels.sum()))
+
+    summary = []
+    for i, question in enumerate(questions):
+        level_counts = distribution[offsets[i]:offsets[i] + levels[i]]
+        summary.append({'question': question,
+                        'survey_item_id': survey_item_ids.get(question),
+                        'scale': [float(scale_min[i]), float(scale_max[i])],
+                        'responses': int(counts[i]),
+                        'mean': None if np.isnan(means[i]) else round(float(means[i]), 4),
+                        'nps': None if np.isnan(nps[i]) else round(float(nps[i]), 2),
+                        'scores': (scale_min[i] + np.arange(levels[i])).tolist(),
+                        'counts': level_counts.tolist()})
+
+    charts = [{
+        'plot_type': 'radar_chart',
+        'alternative_chart': 'horizontal_bar_graph',
+        'title': 'Average Score of the Scaling Questions',
+        'axes': questions,
+        'values': [None if np.isnan(mean) else round(float(mean), 4) for mean in means],
+        'normalized_values': [None if np.isnan(mean) else round(float(mean), 4) for mean in normalized_means],
+        'survey_item_ids': [survey_item_ids.get(question) for question in questions]
+    }]
+
+    if created_at is not None:
+        # mean score per day of every question, from one weighted bincount over (day, question) codes
+        dates = pd.to_datetime(pd.Series(created_at).reset_index(drop=True)).dt.strftime('%Y-%m-%d')
+        day_codes, days = pd.factorize(dates, sort=True)
+        n_questions = len(questions)
+        cells = (day_codes[:, None] * n_questions + np.arange(n_questions)[None, :])
+        valid = answered & (day_codes[:, None] >= 0)
+        day_totals = np.bincount(cells[valid], weights=scores[valid], minlength=len(days) * n_questions)
+        day_counts = np.bincount(cells[valid], minlength=len(days) * n_questions)
+        day_means = np.divide(day_totals, day_counts, out=np.full(len(day_totals), np.nan), where=day_counts > 0)
+        day_means = day_means.reshape(len(days), n_questions)
+        for i, question in enumerate(questions):
+            charts.append({
+                'plot_type': 'line_chart',
+                'title': f'Average Score Over Time: {question}',
+                'x_label': 'Date',
+                'y_label': 'Average Score',
+                'dates': days.tolist(),
+                'values': [None if np.isnan(mean) else round(float(mean), 4) for mean in day_means[:, i]],
+                'survey_item_id': survey_item_ids.get(question)
+            })
+
+    return summary, charts
@@ -0,0 +1,91 @@
+"""This script contains the single-flight coalescing of identical requests.
+
+Concurrent requests with the same key (eg., the quest_id and the hash of the
+upload) wait on the one computation already in flight and share its result,
+or its error, instead of each running the whole pipeline. The coalescing is
+per process, so each worker of the server has its own in-flight calls.
+"""
+
+import threading
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a coalesced request waited longer than its timeout."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Registry of the computations in flight, by key."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {'computed': 0, 'coalesced': 0, 'errors': 0, 'timeouts': 0}
+
+    def do(self, key, compute, timeout=None):
+        """Function to run a computation, or wait for the identical one already in flight.
+
+        Parameters
+        ----------
+        key: hashable
+            The computations with the same key have the same result.
+        compute: function
+            Computes the result, without arguments.
+        timeout: float, optional
+            The number of seconds a coalesced request waits. The default is no limit.
+            The computation itself is never interrupted.
+
+        Returns
+        -------
+        result:
+            The result of the computation. An error of the computation is raised in every request.
+        coalesced: bool
+            True if the result was computed for another request.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters['computed'] += 1
+            else:
+                self._counters['coalesced'] += 1
+
+        if leader:
+            try:
+                call.result = compute()
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self._counters['errors'] += 1
+                raise
+            finally:
+                # later requests start a new computation, the waiting ones get this one
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result, False
+
+        if not call.done.wait(timeout):
+            with self._lock:
+                self._counters['timeouts'] += 1
+            raise SingleFlightTimeout(f"The identical request in flight did not finish within {timeout} seconds.")
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def stats(self):
+        """Function to get the counters and the number of computations in flight.
+
+        Returns
+        -------
+        stats: dict
+        """
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._calls))
@@ -0,0 +1,297 @@
+"""This script contains mergeable sketches for the approximate statistics mode.
+
+SpaceSavingSketch - the top-k categories of a question.
+KLLSketch - the quantiles of a numeric column.
+HyperLogLog - the number of distinct respondents.
+
+Every sketch can be updated with a chunk of data, merged with a sketch built
+on another shard, and serialized with 'to_dict' / 'from_dict'.
+"""
+
+import base64
+import random
+
+import numpy as np
+import pandas as pd
+
+
+class SpaceSavingSketch:
+    """Sketch to keep the approximate counts of the most frequent values.
+    The counts are over-estimates, the error of each count is kept with it.
+
+    Parameters
+    ----------
+    capacity: int
+        The number of values tracked by the sketch.
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='float64')
+        self.errors = pd.Series(dtype='float64')
+        # upper bound of the count of any value that is not tracked
+        self.floor = 0.0
+        self.total = 0
+
+    def update(self, values):
+        """Function to add a chunk of values to the sketch.
+
+        Parameters
+        ----------
+        values: Pandas Series
+            The values to count. Missing values are ignored.
+        """
+        chunk_counts = values.value_counts(dropna=True).astype('float64')
+        chunk = SpaceSavingSketch(self.capacity)
+        chunk.counts = chunk_counts
+        chunk.errors = pd.Series(0.0, index=chunk_counts.index)
+        chunk.total = int(chunk_counts.sum())
+        chunk._trim()
+        self.merge(chunk)
+
+    def merge(self, other):
+        """Function to merge the counts of another sketch into this one.
+
+        Parameters
+        ----------
+        other: SpaceSavingSketch
+        """
+        keys = self.counts.index.union(other.counts.index)
+        self.counts = (self.counts.reindex(keys).fillna(self.floor)
+                       + other.counts.reindex(keys).fillna(other.floor))
+        self.errors = (self.errors.reindex(keys).fillna(self.floor)
+                       + other.errors.reindex(keys).fillna(other.floor))
+        self.floor = self.floor + other.floor
+        self.total += other.total
+        self._trim()
+
+    def _trim(self):
+        # keep only the values with the highest counts
+        if len(self.counts) > self.capacity:
+            self.counts = self.counts.sort_values(ascending=False, kind='stable')
+            self.floor = max(self.floor, float(self.counts.iloc[self.capacity]))
+            self.counts = self.counts.iloc[:self.capacity]
+            self.errors = self.errors.reindex(self.counts.index)
+
+    def top_k(self, k=None):
+        """Function to get the most frequent values.
+
+        Parameters
+        ----------
+        k: int, optional
+            The number of values to return. The default is all the tracked values.
+
+        Returns
+        -------
+        top_values: Pandas Series
+            The approximate counts, sorted from the most frequent value.
+        """
+        top_values = self.counts.sort_values(ascending=False, kind='stable')
+        return top_values if k is None else top_values.iloc[:k]
+
+    def to_dict(self):
+        return {'capacity': self.capacity,
+                'floor': self.floor,
+                'total': self.total,
+                'items': [[item, float(self.counts[item]), float(self.errors[item])]
+                          for item in self.counts.index.tolist()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['capacity'])
+        items = [row[0] for row in data['items']]
+        sketch.counts = pd.Series([row[1] for row in data['items']], index=items, dtype='float64')
+        sketch.errors = pd.Series([row[2] for row in data['items']], index=items, dtype='float64')
+        sketch.floor = data['floor']
+        sketch.total = data['total']
+        return sketch
+
+
+class KLLSketch:
+    """Sketch to estimate the quantiles of a numeric column (Karnin, Lang & Liberty).
+    Each level keeps sorted samples, an item on level h stands for 2**h values.
+
+    Parameters
+    ----------
+    k: int
+        The capacity of the top level. The rank error is roughly 1.7 / k.
+    c: float
+        The ratio between the capacity of a level and the one above.
+    """
+
+    def __init__(self, k=200, c=2.0 / 3.0):
+        self.k = k
+        self.c = c
+        self.count = 0
+        self.levels = []
+        self.max_size = 0
+        self._grow()
+
+    def _grow(self):
+        self.levels.append(np.empty(0, dtype='float64'))
+        self.max_size = sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _capacity(self, height):
+        depth = len(self.levels) - height - 1
+        return int(np.ceil(self.c ** depth * self.k)) + 1
+
+    def _size(self):
+        return sum(len(level) for level in self.levels)
+
+    def _compress(self):
+        for height in range(len(self.levels)):
+            if len(self.levels[height]) >= self._capacity(height):
+                if height + 1 >= len(self.levels):
+                    self._grow()
+                level = np.sort(self.levels[height])
+                # keep the last item of an odd level, promote every other item of the rest
+                odd = len(level) % 2
+                promoted = level[random.randint(0, 1):len(level) - odd:2]
+                self.levels[height] = level[len(level) - odd:]
+                self.levels[height + 1] = np.concatenate([self.levels[height + 1], promoted])
+                if self._size() < self.max_size:
+                    break
+
+    def update(self, values):
+        """Function to add a chunk of values to the sketch.
+
+        Parameters
+        ----------
+        values: Pandas Series or numpy array
+            The values to add. Missing values are ignored.
+        """
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        while self._size() >= self.max_size:
+            self._compress()
+
+    def merge(self, other):
+        """Function to merge the samples of another sketch into this one.
+
+        Parameters
+        ----------
+        other: KLLSketch
+        """
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for height, level in enumerate(other.levels):
+            self.levels[height] = np.concatenate([self.levels[height], level])
+        self.count += other.count
+        while self._size() >= self.max_size:
+            self._compress()
+
+    def quantiles(self, probabilities):
+        """Function to estimate quantiles.
+
+        Parameters
+        ----------
+        probabilities: list
+            The quantiles to estimate, eg., [0.25, 0.5, 0.75].
+
+        Returns
+        -------
+        quantiles: list
+            The estimated value of each quantile, None if the sketch is empty.
+        """
+        values = np.concatenate(self.levels)
+        if len(values) == 0:
+            return [None for _ in probabilities]
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(probabilities) * cumulative[-1])
+        positions = np.minimum(positions, len(values) - 1)
+        return values[order][positions].tolist()
+
+    def to_dict(self):
+        return {'k': self.k,
+                'c': self.c,
+                'count': self.count,
+                'levels': [level.tolist() for level in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['k'], data['c'])
+        for _ in range(len(data['levels']) - 1):
+            sketch._grow()
+        sketch.levels = [np.asarray(level, dtype='float64') for level in data['levels']]
+        sketch.count = data['count']
+        return sketch
+
+
+class HyperLogLog:
+    """Sketch to estimate the number of distinct values (Flajolet et al.).
+
+    Parameters
+    ----------
+    precision: int
+        The number of bits used to pick a register. The relative error is
+        roughly 1.04 / sqrt(2 ** precision), about 0.8% for the default.
+    """
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype='uint8')
+
+    def update(self, values):
+        """Function to add a chunk of values to the sketch.
+
+        Parameters
+        ----------
+        values: Pandas Series
+            The values to count. Missing values are ignored.
+        """
+        values = pd.Series(values).dropna()
+        if values.empty:
+            return
+        hashes = pd.util.hash_array(values.astype(str).to_numpy(dtype=object))
+        index = (hashes >> np.uint64(64 - self.precision)).astype('int64')
+        remainder = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        # the position of the first set bit of the remainder, counted from the left
+        bit_length = np.zeros(len(remainder), dtype='int64')
+        for shift in (32, 16, 8, 4, 2, 1):
+            above = remainder >= np.uint64(1 << shift)
+            bit_length[above] += shift
+            remainder = np.where(above, remainder >> np.uint64(shift), remainder)
+        bit_length += (remainder > 0)
+        rank = (64 - self.precision) - bit_length + 1
+        np.maximum.at(self.registers, index, rank.astype('uint8'))
+
+    def merge(self, other):
+        """Function to merge the registers of another sketch into this one.
+
+        Parameters
+        ----------
+        other: HyperLogLog
+        """
+        if other.precision != self.precision:
+            raise ValueError("Only sketches with the same precision can be merged.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        """Function to estimate the number of distinct values.
+
+        Returns
+        -------
+        estimate: int
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype('float64')))
+        empty = int(np.count_nonzero(self.registers == 0))
+        # use linear counting for small cardinalities
+        if raw <= 2.5 * m and empty:
+            return int(round(m * np.log(m / empty)))
+        return int(round(raw))
+
+    def to_dict(self):
+        return {'precision': self.precision,
+                'registers': base64.b64encode(self.registers.tobytes()).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['precision'])
+        sketch.registers = np.frombuffer(base64.b64decode(data['registers']), dtype='uint8').copy()
+        return sketch
@@ -0,0 +1,276 @@
+"""This script contains the store of parsed quest surveys.
+A parsed survey is kept in memory after the first request, so single charts
+can be computed on demand without parsing the survey again.
+"""
+
+import itertools
+import threading
+from collections import OrderedDict
+
+from analysis_skeleton import (compute_chart_descriptors, compute_geo_heatmap_data, compute_quick_analysis,
+                               compute_scaling_charts_data, compute_single_chart, compute_summary_charts_data,
+                               create_geojson, categorize_survey_questions, get_default_segments, parse_quest_data,
+                               sample_open_answers)
+from aggregation_context import AggregationContext
+from crosstab_analysis import build_segment_frame
+from request_guardrails import describe_degradations, plan_degradations
+from respondent_quality import score_respondents, summarize_quality
+from single_flight import SingleFlight
+
+
+# every parsed survey gets a new version, so a re-uploaded quest is told apart from the previous one
+_versions = itertools.count(1)
+
+
+class ParsedSurvey:
+    """A parsed quest survey and the charts already computed for it.
+
+    Parameters
+    ----------
+    quest_id: str
+        The unique id of the quest survey.
+    df: dataframe
+        This is the quest survey data
+    df_meta: dataframe
+        The quest survey metadata
+    response_metadata: dataframe
+        The quest response metadata
+    categorized_questions: dict
+        The output of 'categorize_survey_questions'.
+    respondent_quality: dict, optional
+        The output of 'summarize_quality'.
+    plan: dict, optional
+        The output of 'plan_degradations', applied to every chart. The default is no degradation.
+    """
+
+    def __init__(self, quest_id, df, df_meta, response_metadata, categorized_questions, respondent_quality=None,
+                 plan=None):
+        self.quest_id = str(quest_id)
+        self.df = df
+        self.df_meta = df_meta
+        self.response_metadata = response_metadata
+        self.categorized_questions = categorized_questions
+        self.respondent_quality = respondent_quality
+        self.plan = plan if plan is not None else plan_degradations(None, df)
+        self.version = next(_versions)
+        # strong ETag of the upload the survey was parsed from, set by the API
+        self.etag = None
+        self.charts = {}
+        self.corrected_text = {}
+        # the bar graph and the pie chart of a question share its counts
+        self.aggregations = AggregationContext(df)
+        self._segment_frame = None
+        # the concurrent requests of the same chart, or of the corrected text of the same
+        # question, share one computation. The other charts are computed at the same time
+        self.chart_flight = SingleFlight()
+        self.text_flight = SingleFlight()
+
+    @classmethod
+    def from_quest_data(cls, quest_id, quest_data, quest_metadata, dedup='latest', exclude_flagged=False,
+                        limits=None, upload_bytes=None):
+        """Function to parse and categorize the raw quest survey.
+        The survey is degraded like in 'run_quest_analysis' when it is over the limits.
+
+        Parameters
+        ----------
+        quest_id: str
+        quest_data: Pandas DataFrame
+            The raw quest survey responses.
+        quest_metadata: Pandas DataFrame
+            The raw quest survey metadata.
+        dedup: str
+            How duplicate answers of a respondent are resolved.
+        exclude_flagged: bool
+            If True, the speeders, straight-liners and duplicate submissions are left out.
+        limits: RequestLimits, optional
+            The limits above which the analysis is degraded. The default is no limit.
+        upload_bytes: int, optional
+            The size of the upload, checked against the limits.
+
+        Returns
+        -------
+        survey: ParsedSurvey
+        """
+        df, df_meta, response_meta = parse_quest_data(quest_data, quest_metadata, dedup=dedup)
+        categorized_questions = categorize_survey_questions(df, df_meta)
+        quality = score_respondents(df, response_meta, categorized_questions.get('scaling'),
+                                    open_ended_columns=categorized_questions.get('open_ended'))
+        if exclude_flagged:
+            df = df.loc[~quality['flagged']]
+            response_meta = response_meta.loc[df.index]
+        plan = plan_degradations(limits, df, upload_bytes=upload_bytes)
+        if plan['text_sample_size'] is not None:
+            df = sample_open_answers(df, categorized_questions.get('open_ended'), plan['text_sample_size'])
+        return cls(quest_id, df, df_meta, response_meta, categorized_questions,
+                   respondent_quality=summarize_quality(quality, excluded=exclude_flagged), plan=plan)
+
+    def lazy_result(self, geo_zoom=6):
+        """Function to compute the initial response of the lazy mode.
+        It has the quick analysis, the survey level charts and a descriptor
+        for every question chart that can be requested later.
+
+        Parameters
+        ----------
+        geo_zoom: int
+            The map zoom level of the geography heatmap tiles.
+
+        Returns
+        -------
+        result: dict
+        """
+        summary_charts = compute_summary_charts_data(self.df, self.response_metadata)
+        # the scaling charts are computed for all the questions at once, so they are not lazy
+        scaling_summary, scaling_charts = compute_scaling_charts_data(self.categorized_questions.get('scaling'),
+                                                                      self.df, self.df_meta, self.response_metadata)
+        return {'quest_id': self.quest_id,
+                'lazy': True,
+                'analysis_result': compute_quick_analysis(self.df, self.response_metadata,
+                                                          self.categorized_questions.get('open_ended')),
+                'charts': summary_charts + scaling_charts,
+                'scaling_summary': scaling_summary,
+                'chart_descriptors': compute_chart_descriptors(self.categorized_questions, self.df_meta,
+                                                               self.aggregations, self.plan),
+                'respondent_quality': self.respondent_quality,
+                'geojson': create_geojson(self.response_metadata, "response_id", "latitude", "longitude"),
+                'geo_heatmap': compute_geo_heatmap_data(self.response_metadata, zoom=geo_zoom),
+                'degradations': describe_degradations(self.plan)}
+
+    @property
+    def segment_frame(self):
+        """The default segments of every respondent, see 'build_segment_frame'."""
+        if self._segment_frame is None:
+            self._segment_frame = build_segment_frame(self.df, self.response_metadata,
+                                                      get_default_segments(self.df_meta,
+                                                                           self.categorized_questions))
+        return self._segment_frame
+
+    def segment_options(self):
+        """Function to list the values of each default segment.
+
+        Returns
+        -------
+        options: dict
+            The sorted values of each segment, by segment name.
+        """
+        return {column: sorted(str(value) for value in self.segment_frame[column].dropna().unique())
+                for column in self.segment_frame.columns}
+
+    def segment_respondents(self, segment=None, value=None):
+        """Function to get the respondents of a segment value, all the respondents without a segment.
+
+        Parameters
+        ----------
+        segment: str, optional
+            One of the default segments (eg., Gender, country).
+        value: str, optional
+
+        Returns
+        -------
+        respondents: Pandas Index
+        """
+        if segment is None or value is None:
+            return self.df.index
+        if segment not in self.segment_frame.columns:
+            raise ValueError(f"Unknown segment '{segment}'.")
+        column = self.segment_frame[segment]
+        return column.index[column.astype(str) == str(value)]
+
+    def get_chart(self, survey_item_id, plot_type, segment=None, value=None):
+        """Function to get a single chart, computing it on the first request only.
+
+        Parameters
+        ----------
+        survey_item_id: str
+            id associated with the quest survey question
+        plot_type: str
+        segment: str, optional
+            Only the respondents with this 'value' of the segment are charted.
+        value: str, optional
+
+        Returns
+        -------
+        chart: dict
+        """
+        if segment is None or value is None:
+            segment, value = None, None
+        key = (str(survey_item_id), plot_type, segment, value)
+        chart = self.charts.get(key)
+        if chart is not None:
+            return chart
+
+        def compute():
+            # the chart may have been stored since the lookup above
+            if key in self.charts:
+                return self.charts[key]
+            if segment is None:
+                df, context = self.df, self.aggregations
+            else:
+                df, context = self.df.loc[self.segment_respondents(segment, value)], None
+            self.charts[key] = compute_single_chart(df, self.df_meta, self.categorized_questions,
+                                                    survey_item_id, plot_type, corrected_text=self.corrected_text,
+                                                    text_df=self.df, context=context, text_flight=self.text_flight,
+                                                    plan=self.plan)
+            return self.charts[key]
+
+        return self.chart_flight.do(key, compute)[0]
+
+
+class LRUCache:
+    """Bounded thread-safe cache, the least recently used entry is evicted first.
+
+    Parameters
+    ----------
+    max_entries: int
+        The number of entries kept in memory.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Function to get an entry, None if it is not in the cache."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """Function to add an entry, replacing the previous entry of the same key."""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Function to get an entry, computing it with 'compute()' when it is not in the cache."""
+        entry = self.get(key)
+        if entry is None:
+            entry = compute()
+            self.set(key, entry)
+        return entry
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class ParsedSurveyCache(LRUCache):
+    """Bounded store of parsed surveys, the least recently used survey is evicted first.
+
+    Parameters
+    ----------
+    max_entries: int
+        The number of surveys kept in memory.
+    """
+
+    def get(self, quest_id):
+        """Function to get a parsed survey, None if it is not in the store."""
+        return super().get(str(quest_id))
+
+    def put(self, survey):
+        """Function to add a parsed survey, replacing the previous version of the same quest."""
+        self.set(survey.quest_id, survey)
@@ -0,0 +1,171 @@
+"""This script contains the time-sliced analysis of a survey, on the submission time of the respondents.
+
+The submission times are turned into integer codes once: an hour-of-week code
+for the response heatmap, and a period code (day, week or month) for the
+trends. The answer distributions of all the categorical questions and the
+sentiment shares of all the open_ended questions per period are then counted
+together with the single bincount of the cross-tabulation engine, on codes
+that combine the question, the answer and the period.
+"""
+
+import numpy as np
+import pandas as pd
+
+from crosstab_analysis import count_contingency_tables, encode_categories
+
+
+# Format of the label of each period, a week is labelled with its Monday
+PERIOD_FORMATS = {'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m'}
+# The longest span (in days) of the submissions charted per day, then per week, longer spans are per month
+PERIOD_SPANS = [('day', 62), ('week', 366)]
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def to_utc(created_at):
+    """Function to parse the submission times, in UTC. Times without a zone are taken as UTC.
+
+    Parameters
+    ----------
+    created_at: Pandas Series
+
+    Returns
+    -------
+    created_at: Pandas Series of datetime
+    """
+    created_at = pd.to_datetime(created_at, errors='coerce', utc=True)
+    return created_at.dt.tz_localize(None)
+
+
+def choose_period(created_at):
+    """Function to choose the period of the trends from the span of the submission times.
+
+    Parameters
+    ----------
+    created_at: Pandas Series of datetime
+
+    Returns
+    -------
+    period: str
+        'day', 'week' or 'month'.
+    """
+    span = created_at.max() - created_at.min()
+    span_days = 0 if pd.isna(span) else span.days
+    for period, max_days in PERIOD_SPANS:
+        if span_days <= max_days:
+            return period
+    return 'month'
+
+
+def encode_periods(created_at, period):
+    """Function to turn the submission times into integer period codes.
+
+    Parameters
+    ----------
+    created_at: Pandas Series of datetime
+    period: str
+        'day', 'week' or 'month'.
+
+    Returns
+    -------
+    codes: numpy array
+        The period of each row, -1 for a missing time.
+    labels: list
+        The label of each code, in time order.
+    """
+    starts = created_at.dt.normalize()
+    if period == 'week':
+        starts = starts - pd.to_timedelta(starts.dt.dayofweek, unit='D')
+    codes, labels = pd.factorize(starts.dt.strftime(PERIOD_FORMATS[period]), sort=True)
+    return codes.astype('int64'), labels.tolist()
+
+
+def compute_hour_of_week_data(created_at):
+    """Function to count the responses of every hour of the week, for a heatmap.
+
+    Parameters
+    ----------
+    created_at: Pandas Series of datetime
+        In UTC, see 'to_utc'.
+
+    Returns
+    -------
+    data: dict
+    """
+    created_at = created_at.dropna()
+    codes = created_at.dt.dayofweek.to_numpy() * 24 + created_at.dt.hour.to_numpy()
+    counts = np.bincount(codes, minlength=7 * 24).reshape(7, 24)
+    return {
+        'plot_type': 'heatmap',
+        'title': 'Responses by Hour of the Week',
+        'x_label': 'Hour (UTC)',
+        'y_label': 'Day',
+        'x_values': list(range(24)),
+        'y_values': WEEKDAYS,
+        'z_values': counts.tolist(),
+        'z_range': [0, int(counts.max()) if len(created_at) else 0]
+    }
+
+
+def analyze_trends(df, created_at, categorical_columns, sentiment_columns, period=None, survey_item_ids=None):
+    """Function to compute the temporal charts of a survey.
+
+    Parameters
+    ----------
+    df: dataframe
+        This is the quest survey data, with the sentiment columns.
+    created_at: Pandas Series
+        The submission time of each row of the survey data.
+    categorical_columns: list
+    sentiment_columns: list
+        The '<question>_sentiment' columns of the open_ended questions.
+    period: str, optional
+        'day', 'week' or 'month'. The default depends on the span of the submissions, see 'choose_period'.
+    survey_item_ids: dict, optional
+        The survey_item_id of each question.
+
+    Returns
+    -------
+    charts: list
+        The hour-of-week heatmap, the answer distribution per period of each categorical
+        question and the sentiment share per period of each open_ended question.
+    """
+    survey_item_ids = survey_item_ids or {}
+    created_at = to_utc(pd.Series(created_at).reset_index(drop=True))
+    if created_at.isna().all():
+        return []
+    charts = [compute_hour_of_week_data(created_at)]
+
+    period = period or choose_period(created_at)
+    period_codes, periods = encode_periods(created_at, period)
+
+    # every question is encoded once, and all the (answer x period) tables are counted together
+    questions = [column for column in list(categorical_columns) + list(sentiment_columns) if column in df.columns]
+    if not questions:
+        return charts
+    encoded = [encode_categories(df[column]) for column in questions]
+    tables = count_contingency_tables(np.column_stack([codes for codes, _ in encoded]),
+                                      [len(labels) for _, labels in encoded],
+                                      period_codes, len(periods))
+
+    for question, (_, labels), table in zip(questions, encoded, tables):
+        period_totals = table.sum(axis=0)
+        shares = np.divide(table, period_totals, out=np.zeros(table.shape), where=period_totals > 0)
+        if question in sentiment_columns:
+            # remove the '_sentiment' from column name to get the original question
+            source, title = question[:-10], f'Sentiment Share Over Time: {question[:-10]}'
+        else:
+            source, title = question, f'Answers Over Time: {question}'
+        charts.append({
+            'plot_type': 'stacked_bar_graph',
+            'alternative_chart': 'line_chart',
+            'title': title,
+            'period': period,
+            'x_label': period.capitalize(),
+            'y_label': 'Share of Responses',
+            'x_values': periods,
+            'groups': [str(label) for label in labels],
+            'y_values': np.round(shares, 4).tolist(),
+            'counts': table.tolist(),
+            'survey_item_id': survey_item_ids.get(source)
+        })
+    return charts
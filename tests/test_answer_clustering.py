@@ -0,0 +1,66 @@
+"""Tests of the near-duplicate clustering of open_ended answers, and of the text steps that must not use it."""
+
+import pandas as pd
+
+from analysis_skeleton import correct_text, perform_sentiment_analysis, run_quest_analysis
+from answer_clustering import cluster_answers, cluster_open_answers
+
+
+COLUMN = 'What do you think about our new line of fruit juices?'
+# near-duplicate answers of opposite meanings, that LSH can put in the same cluster
+OPPOSITES = [('I really liked the new fruit juice', 'I really disliked the new fruit juice'),
+             ('I would recommend it', 'I would not recommend it')]
+
+
+def test_identical_answers_after_normalization_share_a_cluster():
+    series = pd.Series(['Nah', 'nah.', 'nah!!', 'Nah', None, 'The juice was far too sweet for me'])
+    representatives = cluster_answers(series)
+    assert representatives.iloc[:4].tolist() == ['Nah'] * 4
+    assert pd.isna(representatives.iloc[4])
+    assert representatives.iloc[5] == 'The juice was far too sweet for me'
+
+
+def test_representative_is_a_given_answer():
+    series = pd.Series(['good juice', 'Good juice!', 'good juice', 'bad service', 'Bad service.'])
+    representatives = cluster_answers(series)
+    assert set(representatives) <= set(series)
+    assert representatives.value_counts().max() <= len(series)
+
+
+def test_correction_keeps_the_text_of_every_answer():
+    answers = [text for pair in OPPOSITES for text in pair] * 5
+    df = pd.DataFrame({COLUMN: answers})
+    corrected = correct_text(df, [COLUMN])
+    for answer, correction in zip(answers, corrected[COLUMN]):
+        assert ('disliked' in answer) == ('disliked' in correction)
+        assert (' not ' in answer) == (' not ' in correction)
+
+
+def test_sentiment_of_opposite_answers_is_not_shared():
+    df = pd.DataFrame({COLUMN: ['I really liked the new fruit juice', 'I really hated the new fruit juice'] * 10})
+    clusters = cluster_open_answers(df, [COLUMN])
+    result, sentiment_columns = perform_sentiment_analysis(correct_text(df, [COLUMN]), [COLUMN])
+    sentiments = result[sentiment_columns[0]]
+    # whatever the clusters are, the two answers keep their own sentiment
+    assert clusters[COLUMN].notna().all()
+    assert sentiments.iloc[0] != sentiments.iloc[1]
+    assert sentiments.iloc[0::2].nunique() == 1 and sentiments.iloc[1::2].nunique() == 1
+
+
+def test_analysis_charts_the_own_text_of_every_answer():
+    answers = [text for pair in OPPOSITES for text in pair] * 5
+    quest_data = pd.DataFrame({'response_id': [f'respondent-{i}' for i in range(len(answers))],
+                               'created_at': '2023-07-27 00:53:03+00:00',
+                               'response': answers,
+                               'quest_completion_time': 30.0,
+                               'survey_item_id': 2.0,
+                               'city': 'London', 'country': 'UK', 'region': 'East',
+                               'latitude': 51.5, 'longitude': -0.1})
+    quest_metadata = pd.DataFrame({'question': [COLUMN], 'type': ['open_ended'], 'id': [2]})
+    result = run_quest_analysis(quest_data, quest_metadata, 'opposites')
+    charts = {chart['title']: chart for chart in result['charts']}
+    # the word cloud is made of the corrected answers
+    words = charts[COLUMN]['text'].split()
+    assert 'disliked' in words and 'not' in words
+    # the common answers chart still groups the near-duplicates
+    assert charts[COLUMN + '_common_answers']['plot_type'] == 'bar_graph'
@@ -0,0 +1,36 @@
+"""Tests that the batch analysis recovers from a broken process pool."""
+
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import batch_analysis
+from batch_analysis import analyze_batch, get_worker_pool, shutdown_worker_pool
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+JOB = {'quest_id': 'batch',
+       'quest_data': os.path.join(DATA_DIR, 'response_id.csv'),
+       'quest_metadata': os.path.join(DATA_DIR, 'csv_quest_meta_data.csv')}
+
+
+@pytest.fixture
+def worker_pool():
+    yield get_worker_pool(1)
+    shutdown_worker_pool()
+
+
+def test_broken_pool_is_replaced(worker_pool):
+    # a worker process dies, eg., it was killed for using too much memory
+    with pytest.raises(BrokenProcessPool):
+        worker_pool.submit(os._exit, 1).result(timeout=30)
+
+    records = list(analyze_batch([JOB, dict(JOB, quest_id='other')]))
+    assert [record['quest_id'] for record in records] == ['batch', 'other']
+    assert all(record['status'] == 'error' and 'worker process failed' in record['error'] for record in records)
+    assert batch_analysis._worker_pool is None
+
+    records = list(analyze_batch([JOB]))
+    assert [record['status'] for record in records] == ['ok']
+    assert get_worker_pool() is not worker_pool
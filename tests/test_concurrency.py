@@ -0,0 +1,131 @@
+"""Tests that the engine functions can share one parsed survey between threads.
+
+Every function runs from many threads on the same parsed frame: the frame must
+be left unchanged, and every thread must get the result of a single-threaded run.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+import analysis_skeleton
+from analysis_skeleton import (categorize_survey_questions, compute_charts_data, correct_text, get_quest_id,
+                               parse_quest_data, perform_sentiment_analysis, run_quest_analysis)
+from survey_cache import ParsedSurvey
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+THREADS = 8
+RUNS = 16
+
+
+@pytest.fixture(scope='module')
+def quest_data():
+    return pd.read_csv(os.path.join(DATA_DIR, 'response_id.csv'))
+
+
+@pytest.fixture(scope='module')
+def quest_metadata():
+    return pd.read_csv(os.path.join(DATA_DIR, 'csv_quest_meta_data.csv'))
+
+
+@pytest.fixture(scope='module')
+def parsed(quest_data, quest_metadata):
+    df, df_meta, response_meta = parse_quest_data(quest_data, quest_metadata)
+    return df, df_meta, response_meta, categorize_survey_questions(df, df_meta)
+
+
+def to_json(result):
+    # the results are compared the way they are sent, as JSON
+    if isinstance(result, pd.DataFrame):
+        result = result.to_dict(orient='split')
+    return json.dumps(result, default=str, sort_keys=True)
+
+
+def run_concurrently(work):
+    with ThreadPoolExecutor(THREADS) as executor:
+        return list(executor.map(lambda _: to_json(work()), range(RUNS)))
+
+
+def assert_unchanged(frame, snapshot):
+    assert list(frame.columns) == list(snapshot.columns)
+    assert frame.dtypes.equals(snapshot.dtypes)
+    pd.testing.assert_frame_equal(frame, snapshot)
+
+
+def test_text_steps_share_the_frame(parsed):
+    df, _, _, categorized_questions = parsed
+    open_questions = categorized_questions['open_ended']
+    snapshot = df.copy(deep=True)
+
+    expected = to_json(correct_text(df, open_questions))
+    assert run_concurrently(lambda: correct_text(df, open_questions)) == [expected] * RUNS
+    assert_unchanged(df, snapshot)
+
+    expected = to_json(perform_sentiment_analysis(df, open_questions)[0])
+    assert run_concurrently(lambda: perform_sentiment_analysis(df, open_questions)[0]) == [expected] * RUNS
+    assert_unchanged(df, snapshot)
+
+
+def test_charts_share_the_frame(parsed):
+    df, df_meta, response_meta, categorized_questions = parsed
+    open_questions = categorized_questions['open_ended']
+    df_sentiment, sentiment_columns = perform_sentiment_analysis(df, open_questions)
+    snapshots = [frame.copy(deep=True) for frame in (df_sentiment, df_meta, response_meta)]
+
+    def work():
+        return compute_charts_data(categorized_questions['categorical'], sentiment_columns,
+                                   categorized_questions['numeric'], open_questions,
+                                   df_sentiment, df_meta, response_meta)
+
+    expected = to_json(work())
+    assert run_concurrently(work) == [expected] * RUNS
+    for frame, snapshot in zip((df_sentiment, df_meta, response_meta), snapshots):
+        assert_unchanged(frame, snapshot)
+
+
+def test_analysis_shares_the_upload(quest_data, quest_metadata):
+    snapshots = [frame.copy(deep=True) for frame in (quest_data, quest_metadata)]
+
+    def work():
+        return run_quest_analysis(quest_data, quest_metadata, 'quest')
+
+    expected = to_json(work())
+    assert run_concurrently(work) == [expected] * RUNS
+    for frame, snapshot in zip((quest_data, quest_metadata), snapshots):
+        assert_unchanged(frame, snapshot)
+
+
+def test_lazy_charts_are_not_serialized(quest_data, quest_metadata, monkeypatch):
+    survey = ParsedSurvey.from_quest_data('lazy', quest_data, quest_metadata)
+    open_item = get_quest_id(survey.df_meta, survey.categorized_questions['open_ended'][0])
+    categorical_item = get_quest_id(survey.df_meta, survey.categorized_questions['categorical'][0])
+
+    # a slow correction, that counts how many times it runs
+    started, release, calls = threading.Event(), threading.Event(), []
+
+    def slow_correct_text(df, columns):
+        calls.append(columns)
+        started.set()
+        release.wait(10)
+        return correct_text(df, columns)
+
+    monkeypatch.setattr(analysis_skeleton, 'correct_text', slow_correct_text)
+    with ThreadPoolExecutor(3) as executor:
+        text_charts = [executor.submit(survey.get_chart, open_item, plot_type)
+                       for plot_type in ('wordcloud', 'sentiment_bar_graph')]
+        assert started.wait(10)
+        # the chart of another question doesn't wait for the correction
+        start = time.perf_counter()
+        bar_chart = executor.submit(survey.get_chart, categorical_item, 'bar_graph').result(timeout=5)
+        assert time.perf_counter() - start < 5 and not release.is_set()
+        release.set()
+        assert [chart.result(timeout=30)['plot_type'] for chart in text_charts] == ['wordcloud', 'bar_graph']
+    assert bar_chart['plot_type'] == 'bar_graph'
+    # the two charts of the open_ended question shared one correction
+    assert len(calls) == 1
@@ -0,0 +1,279 @@
+"""Tests that compare the vectorized kernels with straightforward pandas references, on small frames."""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis_skeleton import compute_quick_stats, parse_quest_data
+from answer_clustering import cluster_answers, get_shingles
+from correlation_analysis import compute_cramers_v
+from crosstab_analysis import compute_crosstabs, encode_categories
+from respondent_quality import score_respondents
+from scaling_analysis import analyze_scaling_questions
+from sketches import HyperLogLog, KLLSketch, SpaceSavingSketch
+from temporal_analysis import compute_hour_of_week_data, encode_periods
+
+
+@pytest.fixture
+def rng():
+    return np.random.RandomState(42)
+
+
+def random_answers(rng, labels, size, missing=0.1):
+    answers = pd.Series(rng.choice(labels, size=size), dtype=object)
+    return answers.mask(rng.random_sample(size) < missing)
+
+
+# sketches (approximate statistics)
+
+def test_space_saving_counts_match_value_counts(rng):
+    values = random_answers(rng, list('abcdefgh'), 500)
+    sketch = SpaceSavingSketch(capacity=20)
+    for chunk in np.array_split(values, 5):
+        sketch.update(chunk)
+    assert sketch.top_k().to_dict() == values.value_counts().astype('float64').to_dict()
+
+
+def test_space_saving_bounds_the_true_counts(rng):
+    values = pd.Series(rng.zipf(1.5, size=2000).astype(str))
+    shards = [SpaceSavingSketch(capacity=10) for _ in range(4)]
+    for shard, chunk in zip(shards, np.array_split(values, 4)):
+        shard.update(chunk)
+    sketch = shards[0]
+    for shard in shards[1:]:
+        sketch.merge(shard)
+    true_counts = values.value_counts()
+    for value, count in sketch.top_k().items():
+        assert count - sketch.errors[value] <= true_counts.get(value, 0) <= count
+    assert sketch.total == len(values)
+
+
+def test_kll_quantiles_are_exact_below_capacity(rng):
+    values = rng.normal(size=150)
+    sketch = KLLSketch(k=200)
+    sketch.update(values)
+    probabilities = [0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0]
+    assert sketch.quantiles(probabilities) == np.quantile(values, probabilities, method='inverted_cdf').tolist()
+
+
+def test_kll_quantiles_are_within_the_rank_error(rng):
+    values = rng.exponential(size=20000)
+    shards = [KLLSketch(k=200) for _ in range(4)]
+    for shard, chunk in zip(shards, np.array_split(values, 4)):
+        shard.update(chunk)
+    sketch = shards[0]
+    for shard in shards[1:]:
+        sketch.merge(shard)
+    probabilities = [0.1, 0.25, 0.5, 0.75, 0.9]
+    ranks = pd.Series(values).rank(pct=True)
+    for probability, quantile in zip(probabilities, sketch.quantiles(probabilities)):
+        assert abs(ranks[values == quantile].iloc[0] - probability) < 0.02
+
+
+def test_hyperloglog_estimates_the_distinct_values(rng):
+    values = pd.Series(rng.randint(0, 3000, size=10000)).astype(str)
+    first, second = HyperLogLog(), HyperLogLog()
+    first.update(values.iloc[:5000])
+    second.update(values.iloc[5000:])
+    first.merge(second)
+    union = HyperLogLog()
+    union.update(values)
+    assert np.array_equal(first.registers, union.registers)
+    assert abs(first.estimate() - values.nunique()) <= 0.03 * values.nunique()
+
+
+# quick stats
+
+def test_quick_stats_match_pandas(rng):
+    df = pd.DataFrame({'text': random_answers(rng, ['N/A', 'Unknown', 'yes', 'no'], 200, missing=0.2),
+                       'category': random_answers(rng, ['Unknown', 'a', 'b'], 200).astype('category'),
+                       'number': pd.Series(rng.randint(0, 5, size=200), dtype='float64').mask(
+                           rng.random_sample(200) < 0.3)})
+    quick_stats = compute_quick_stats(df)
+
+    invalid = sum(int(df[column].astype(object).isin(['N/A', 'Unknown']).sum()) for column in df.columns)
+    assert quick_stats['invalid_responses'] == invalid
+    assert quick_stats['missing_responses'] == int(df.isna().sum().sum())
+    assert quick_stats['response_counts'] == df.notna().sum().to_dict()
+    assert quick_stats['completion_rate'] == round(100 * df.notna().to_numpy().mean(), 2)
+    pd.testing.assert_series_equal(quick_stats['respondent_completeness'], df.notna().mean(axis=1),
+                                   check_names=False)
+
+
+# crosstabs and Cramer's V
+
+def test_crosstabs_match_pd_crosstab(rng):
+    df = pd.DataFrame({'drink': random_answers(rng, ['juice', 'soda', 'water'], 300),
+                       'size': random_answers(rng, ['small', 'large'], 300)})
+    segments = pd.DataFrame({'country': random_answers(rng, ['UK', 'FR', 'DE'], 300).astype('category')})
+    charts = compute_crosstabs(df, ['drink', 'size'], [], segments)
+
+    for chart in charts:
+        expected = pd.crosstab(segments['country'], df[chart['question']])
+        expected = expected.reindex(index=chart['groups'], columns=chart['x_values'], fill_value=0)
+        assert chart['y_values'] == expected.to_numpy().tolist()
+
+
+def reference_cramers_v(first, second):
+    table = pd.crosstab(first, second).to_numpy(dtype='float64')
+    total = table.sum()
+    expected = table.sum(axis=1, keepdims=True) * table.sum(axis=0, keepdims=True) / total
+    chi_squared = ((table - expected) ** 2 / expected).sum()
+    dof = min(table.shape) - 1
+    return np.sqrt(chi_squared / total / dof) if dof > 0 else np.nan
+
+
+def test_cramers_v_matches_the_chi_squared_of_pd_crosstab(rng):
+    df = pd.DataFrame({'drink': random_answers(rng, ['juice', 'soda', 'water'], 300),
+                       'size': random_answers(rng, ['small', 'large'], 300),
+                       'store': random_answers(rng, ['shop', 'online', 'market', 'station'], 300)})
+    # an answer that depends on another one
+    df['size'] = df['size'].where(df['drink'] != 'water', 'large')
+    encoded = [encode_categories(df[column]) for column in df.columns]
+    cramers_v = compute_cramers_v(np.column_stack([codes for codes, _ in encoded]),
+                                  [len(labels) for _, labels in encoded])
+
+    for i, j in itertools.combinations(range(df.shape[1]), 2):
+        expected = reference_cramers_v(df.iloc[:, i], df.iloc[:, j])
+        assert cramers_v[i, j] == pytest.approx(expected)
+        assert cramers_v[j, i] == pytest.approx(expected)
+    assert np.diag(cramers_v).tolist() == [1.0, 1.0, 1.0]
+
+
+# scaling and NPS
+
+def test_scaling_summary_matches_pandas(rng):
+    nps_question = 'How likely are you to recommend us to a friend?'
+    agree_question = 'The juice tastes good'
+    agree_scale = ['strongly disagree', 'disagree', 'neutral', 'agree', 'strongly agree']
+    df = pd.DataFrame({nps_question: pd.Series(rng.randint(0, 11, size=200), dtype='float64').mask(
+                           rng.random_sample(200) < 0.1),
+                       agree_question: random_answers(rng, agree_scale, 200)})
+    summary = {item['question']: item for item in analyze_scaling_questions(df, [nps_question, agree_question])[0]}
+
+    scores = df[nps_question].dropna()
+    nps = summary[nps_question]
+    assert nps['scale'] == [0.0, 10.0]
+    assert nps['responses'] == len(scores)
+    assert nps['mean'] == round(scores.mean(), 4)
+    assert nps['nps'] == round(((scores >= 9).mean() - (scores <= 6).mean()) * 100, 2)
+    assert nps['counts'] == scores.value_counts().reindex(range(11), fill_value=0).tolist()
+
+    scores = df[agree_question].dropna().map({label: agree_scale.index(label) + 1 for label in agree_scale})
+    agree = summary[agree_question]
+    assert agree['scale'] == [1.0, 5.0]
+    assert agree['mean'] == round(scores.mean(), 4)
+    # stretched to 0-10, a 5 is a promoter and 1 to 3 are detractors
+    assert agree['nps'] == round(((scores == 5).mean() - (scores <= 3).mean()) * 100, 2)
+    assert agree['counts'] == scores.value_counts().reindex(range(1, 6), fill_value=0).tolist()
+
+
+# dedup policies
+
+QUESTIONS = pd.DataFrame({'question': ['Q1', 'Q2'], 'type': ['multiple_choice', 'multiple_choice'], 'id': [1, 2]})
+
+
+def reference_dedup(quest_data, dedup):
+    # the kept answer of every (respondent, question), one group at a time
+    merged = quest_data.merge(QUESTIONS, left_on='survey_item_id', right_on='id')
+    merged['created_at'] = pd.to_datetime(merged['created_at'])
+    kept = {}
+    for (response_id, question), group in merged.groupby(['response_id', 'question']):
+        if dedup == 'latest':
+            group = group[group['created_at'] == group['created_at'].max()]
+        kept[(response_id, question)] = group['response'].iloc[0 if dedup == 'first' else -1]
+    return kept
+
+
+@pytest.mark.parametrize('dedup', ['first', 'last', 'latest'])
+def test_dedup_policies_match_pandas(rng, dedup):
+    size = 60
+    quest_data = pd.DataFrame({'response_id': rng.choice(['a', 'b', 'c', 'd', 'e'], size=size),
+                               # few distinct times, so some duplicates are submitted at the same time
+                               'created_at': pd.Timestamp('2023-07-27') + pd.to_timedelta(
+                                   rng.randint(0, 5, size=size), unit='min'),
+                               'response': [f'answer {i}' for i in range(size)],
+                               'quest_completion_time': 30.0,
+                               'survey_item_id': rng.choice([1, 2], size=size),
+                               'city': 'London', 'country': 'UK', 'region': 'East',
+                               'latitude': 51.5, 'longitude': -0.1})
+    df, _, response_metadata = parse_quest_data(quest_data, QUESTIONS, dedup=dedup)
+
+    answers = df.set_index(response_metadata['response_id']).stack()
+    assert answers.to_dict() == reference_dedup(quest_data, dedup)
+
+
+# respondent quality flags
+
+def test_quality_flags_match_pandas(rng):
+    size = 120
+    scaling = ['Q1', 'Q2', 'Q3', 'Q4']
+    df = pd.DataFrame({question: pd.Series(rng.randint(1, 6, size=size), dtype='float64') for question in scaling})
+    # straight-liners, and rows with too few scaling answers to be checked
+    df.iloc[::7] = 3.0
+    df.iloc[1::11, 1:] = np.nan
+    df['Comment'] = pd.Series(rng.choice(['great', 'too sweet', None], size=size), dtype=object)
+    # copies of earlier rows, the ones with a comment are duplicates
+    df.iloc[100:] = df.iloc[:20].to_numpy()
+    response_metadata = pd.DataFrame({'quest_completion_time': rng.uniform(10, 100, size=size),
+                                      'created_at': pd.Timestamp('2023-07-27') + pd.to_timedelta(
+                                          np.arange(size) * 3600, unit='s')},
+                                     index=df.index)
+    quality = score_respondents(df, response_metadata, scaling, open_ended_columns=['Comment'])
+
+    times = response_metadata['quest_completion_time']
+    speeder = times / times.median() < 0.4
+    scores = df[scaling]
+    straight_liner = (scores.notna().sum(axis=1) >= 3) & (scores.nunique(axis=1) == 1)
+    duplicate = df.duplicated(keep='first') & df['Comment'].notna()
+    assert speeder.any() and straight_liner.any() and duplicate.any()
+    assert quality['speeder'].tolist() == speeder.tolist()
+    assert quality['straight_liner'].tolist() == straight_liner.tolist()
+    assert quality['duplicate'].tolist() == duplicate.tolist()
+    assert quality['flagged'].tolist() == (speeder | straight_liner | duplicate).tolist()
+
+
+# clustering
+
+def jaccard(first, second):
+    first, second = set(get_shingles(first)), set(get_shingles(second))
+    return len(first & second) / len(first | second)
+
+
+def test_clusters_match_the_jaccard_similarity():
+    answers = pd.Series(['The juice was far too sweet', 'the juice was far too sweet!', 'The juice was far too sweet.',
+                         'Delivery took two weeks', 'delivery took two weeks!!', 'I love the new mango flavour',
+                         'I love the new mango flavour :)', 'Nah', 'nah.', 'The bottle leaks', 'Great value'])
+    representatives = cluster_answers(answers)
+
+    for first, second in itertools.combinations(range(len(answers)), 2):
+        similarity = jaccard(answers[first], answers[second])
+        # the answers are either near-identical or unrelated, far from the threshold of the estimate
+        assert similarity >= 0.9 or similarity <= 0.3
+        assert (representatives[first] == representatives[second]) == (similarity >= 0.9)
+
+
+# temporal codes
+
+@pytest.mark.parametrize('period, frequency', [('day', 'D'), ('week', 'W-SUN'), ('month', 'M')])
+def test_period_codes_match_pandas_periods(rng, period, frequency):
+    created_at = pd.Series(pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.randint(0, 200 * 24, size=300), unit='h'))
+    codes, labels = encode_periods(created_at, period)
+
+    starts = created_at.dt.to_period(frequency).dt.start_time
+    expected = starts.dt.strftime('%Y-%m' if period == 'month' else '%Y-%m-%d')
+    assert np.array(labels)[codes].tolist() == expected.tolist()
+    assert labels == sorted(expected.unique())
+
+
+def test_hour_of_week_counts_match_groupby(rng):
+    created_at = pd.Series(pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.randint(0, 30 * 24 * 60, size=500),
+                                                                        unit='min'))
+    z_values = np.array(compute_hour_of_week_data(created_at)['z_values'])
+
+    expected = created_at.groupby([created_at.dt.dayofweek, created_at.dt.hour]).size()
+    for (day, hour), count in expected.items():
+        assert z_values[day, hour] == count
+    assert z_values.sum() == len(created_at)
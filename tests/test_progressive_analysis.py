@@ -0,0 +1,74 @@
+"""Tests of the time budget and of the sampling errors of the progressive previews."""
+
+import os
+
+import pandas as pd
+import pytest
+
+from progressive_analysis import (AnalysisCostEstimate, QUALITY_COUNT_FIELDS, add_result_sampling_errors,
+                                  clamp_time_budget, progressive_analysis)
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+COPIES = 30
+
+
+@pytest.fixture(scope='module')
+def quest_data():
+    # copies of the survey with new respondents, so a preview samples some of them
+    quest_data = pd.read_csv(os.path.join(DATA_DIR, 'response_id.csv'))
+    return pd.concat([quest_data.assign(response_id=quest_data['response_id'] + f"-{copy}")
+                      for copy in range(COPIES)], ignore_index=True)
+
+
+@pytest.fixture(scope='module')
+def quest_metadata():
+    return pd.read_csv(os.path.join(DATA_DIR, 'csv_quest_meta_data.csv'))
+
+
+def preview(quest_data, quest_metadata, seconds_per_answer, time_budget):
+    records = progressive_analysis(quest_data, quest_metadata, 'quest', time_budget=time_budget,
+                                   cost_estimate=AnalysisCostEstimate(seconds_per_answer))
+    record = next(records)
+    assert record['stage'] == 'preview' and record['status'] == 'ok'
+    return record
+
+
+def test_text_steps_are_skipped_over_the_budget(quest_data, quest_metadata):
+    record = preview(quest_data, quest_metadata, seconds_per_answer=1.0, time_budget=0.001)
+    assert record['sample_size'] < record['respondents']
+    assert record['text_skipped']
+    assert "text steps skipped" in record['result']['degradations']['applied']
+    assert not any(chart['plot_type'] == 'wordcloud' for chart in record['result']['charts'])
+
+
+def test_text_steps_fit_the_budget(quest_data, quest_metadata):
+    record = preview(quest_data, quest_metadata, seconds_per_answer=1e-6, time_budget=0.0015)
+    assert record['sample_size'] < record['respondents']
+    assert not record['text_skipped']
+    assert any(chart['plot_type'] == 'wordcloud' for chart in record['result']['charts'])
+
+
+@pytest.mark.parametrize('time_budget, expected', [('2.5', 2.5), (1000, 30.0)])
+def test_time_budget_is_clamped(time_budget, expected):
+    assert clamp_time_budget(time_budget, max_time_budget=30.0) == expected
+
+
+@pytest.mark.parametrize('time_budget', ['0', '-1', 'nan', 'soon'])
+def test_invalid_time_budget(time_budget):
+    with pytest.raises(ValueError):
+        clamp_time_budget(time_budget)
+
+
+def test_answer_counts_are_scaled_by_answers():
+    # 150 invalid answers out of the 500 answers of 50 sampled respondents
+    result = {'charts': [], 'segment_charts': [], 'geo_heatmap': {}, 'scaling_summary': [],
+              'analysis_result': {'number of responses': '50', 'invalid_responses': '150'},
+              'respondent_quality': {field: 0 for field in QUALITY_COUNT_FIELDS}}
+    add_result_sampling_errors(result, respondents=200, sample_size=50, answers=2000, sample_answers=500)
+
+    analysis_result = result['analysis_result']
+    assert analysis_result['number of responses'] == '200'
+    assert analysis_result['invalid_responses'] == '600'
+    assert float(analysis_result['sampling_errors']['number of responses']) == 0.0
+    assert float(analysis_result['sampling_errors']['invalid_responses']) > 0.0
@@ -0,0 +1,60 @@
+"""Tests that the lazy and the batch analyses apply the same request limits as the full analysis."""
+
+import os
+
+import pandas as pd
+import pytest
+
+from analysis_skeleton import get_quest_id
+from batch_analysis import analyze_single_quest
+from request_guardrails import RequestLimits
+from survey_cache import ParsedSurvey
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+QUEST_DATA = os.path.join(DATA_DIR, 'response_id.csv')
+QUEST_METADATA = os.path.join(DATA_DIR, 'csv_quest_meta_data.csv')
+
+
+@pytest.fixture(scope='module')
+def quest_data():
+    return pd.read_csv(QUEST_DATA)
+
+
+@pytest.fixture(scope='module')
+def quest_metadata():
+    return pd.read_csv(QUEST_METADATA)
+
+
+def test_lazy_survey_is_degraded(quest_data, quest_metadata):
+    limits = RequestLimits(degrade_questions=1, text_sample_size=2)
+    survey = ParsedSurvey.from_quest_data('lazy', quest_data, quest_metadata, limits=limits, upload_bytes=100)
+    result = survey.lazy_result()
+
+    assert result['degradations']['applied'] == ["numeric charts sent as summaries", "word clouds skipped"]
+    plot_types = [plot_type for descriptor in result['chart_descriptors'] for plot_type in descriptor['plot_types']]
+    assert 'violin_plot' not in plot_types and 'wordcloud' not in plot_types
+
+    open_item = get_quest_id(survey.df_meta, survey.categorized_questions['open_ended'][0])
+    with pytest.raises(ValueError):
+        survey.get_chart(open_item, 'wordcloud')
+
+
+def test_lazy_survey_samples_the_text(quest_data, quest_metadata):
+    limits = RequestLimits(degrade_rows=2, text_sample_size=2)
+    survey = ParsedSurvey.from_quest_data('lazy', quest_data, quest_metadata, limits=limits)
+
+    for column in survey.categorized_questions['open_ended']:
+        assert survey.df[column].notna().sum() <= 2
+
+
+def test_batch_survey_is_checked_before_parsing():
+    job = {'quest_id': 'batch', 'quest_data': QUEST_DATA, 'quest_metadata': QUEST_METADATA}
+    upload_bytes = os.path.getsize(QUEST_DATA) + os.path.getsize(QUEST_METADATA)
+
+    record = analyze_single_quest(job, RequestLimits(max_upload_bytes=upload_bytes - 1))
+    assert record['status'] == 'error' and 'over the limit' in record['error']
+
+    record = analyze_single_quest(job, RequestLimits(degrade_upload_bytes=upload_bytes - 1))
+    assert record['status'] == 'ok'
+    assert "numeric charts sent as summaries" in record['result']['degradations']['applied']
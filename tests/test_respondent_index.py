@@ -0,0 +1,77 @@
+"""Tests of the respondent index, the dedup policies and the respondent counts built on it."""
+
+import pandas as pd
+import pytest
+
+from analysis_skeleton import compute_summary_charts_data, parse_quest_data
+from progressive_analysis import sample_respondents
+
+
+QUESTION = 'Finally, how often do you buy drinks?'
+OTHER_QUESTION = 'Where do you buy drinks?'
+QUEST_METADATA = pd.DataFrame({'question': [QUESTION, OTHER_QUESTION],
+                               'type': ['multiple_choice', 'multiple_choice'], 'id': [4, 5]})
+
+
+def make_quest_data(rows, survey_item_ids=None):
+    # rows of (response_id, created_at, response, city), the answers of QUESTION by default
+    return pd.DataFrame({'response_id': [row[0] for row in rows],
+                         'created_at': [row[1] for row in rows],
+                         'response': [row[2] for row in rows],
+                         'quest_completion_time': 30.0,
+                         'survey_item_id': survey_item_ids or 4.0,
+                         'city': [row[3] for row in rows],
+                         'country': 'UK', 'region': 'East',
+                         'latitude': 51.5, 'longitude': -0.1})
+
+
+# respondent 'a' answered QUESTION twice: in London, then (later in time, but first in the file) in Leeds,
+# and OTHER_QUESTION once in London
+DUPLICATES = make_quest_data([('a', '2023-07-27 10:05:00', 'Once a month', 'Leeds'),
+                              ('a', '2023-07-27 10:00:00', 'Once a week', 'London'),
+                              ('a', '2023-07-27 10:00:00', 'Supermarket', 'London'),
+                              ('b', '2023-07-27 11:00:00', 'Once a week', 'London')],
+                             survey_item_ids=[4.0, 4.0, 5.0, 4.0])
+
+
+@pytest.mark.parametrize('dedup, response, city', [('first', 'Once a month', 'Leeds'),
+                                                    ('last', 'Once a week', 'London'),
+                                                    ('latest', 'Once a month', 'Leeds')])
+def test_metadata_comes_from_the_kept_answer(dedup, response, city):
+    df, _, response_metadata = parse_quest_data(DUPLICATES, QUEST_METADATA, dedup=dedup)
+    respondent = response_metadata.index[response_metadata['response_id'] == 'a'][0]
+    assert df.loc[respondent, QUESTION] == response
+    assert response_metadata.loc[respondent, 'city'] == city
+    assert response_metadata.index.equals(df.index)
+
+
+def test_unknown_dedup_policy_is_rejected():
+    with pytest.raises(ValueError):
+        parse_quest_data(DUPLICATES, QUEST_METADATA, dedup='random')
+
+
+def test_respondents_without_response_id_are_counted_apart():
+    quest_data = make_quest_data([(None, '2023-07-27 10:00:00', 'Once a week', 'London'),
+                                  (None, '2023-07-27 10:01:00', 'Once a week', 'London'),
+                                  (None, '2023-07-27 10:02:00', 'Once a month', 'Leeds'),
+                                  (None, '2023-07-27 10:03:00', 'Once a month', 'Leeds')])
+    df, _, response_metadata = parse_quest_data(quest_data, QUEST_METADATA)
+    assert len(df) == 4
+    charts = compute_summary_charts_data(df, response_metadata)
+    city_chart = [chart for chart in charts if 'city' in chart][0]
+    assert dict(zip(city_chart['city'], city_chart['user_count'])) == {'London': 2, 'Leeds': 2}
+
+
+def test_sample_keeps_whole_respondents_without_response_id():
+    rows = []
+    for i in range(40):
+        # half of the respondents have no response_id, each answers two questions
+        response_id = f'r{i}' if i % 2 else None
+        created_at = f'2023-07-27 10:{i:02d}:00'
+        rows += [(response_id, created_at, 'Once a week', 'London'), (response_id, created_at, 'Once a month', 'London')]
+    quest_data = make_quest_data(rows)
+    sample = sample_respondents(quest_data, 10)
+    keys = sample['response_id'].fillna(sample['created_at'])
+    assert keys.nunique() == 10
+    assert (keys.value_counts() == 2).all()
+    assert sample['response_id'].isna().any()
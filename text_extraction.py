@@ -0,0 +1,158 @@
+"""This script contains the word, sentence and keyword extraction of open_ended answers.
+
+Every distinct answer is parsed once into a ParsedText, kept in a per-request
+TextCache. The same cache is used to build the word, sentence and keyword
+columns, the word cloud text and the sentiment of the answers, so an answer
+is never parsed twice in a request.
+"""
+
+import math
+import re
+from collections import Counter
+
+import pandas as pd
+from textblob import TextBlob
+
+
+# Common English words that are never keywords
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her here
+hers herself him himself his how i if in into is it its itself just me more most my myself nah no nor not now of
+off ok okay on once only or other our ours ourselves out over own really same she should so some such than that
+the their theirs them themselves then there these they this those through to too under until up very was we were
+what when where which while who whom why will with would yeah yes you your yours yourself yourselves
+""".split())
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+class ParsedText:
+    """The words and sentences of an answer. The TextBlob is only built when needed.
+
+    Parameters
+    ----------
+    text: str
+        The answer.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.words = WORD_PATTERN.findall(text.lower())
+        self.sentences = [sentence.strip() for sentence in SENTENCE_PATTERN.split(text.strip()) if sentence.strip()]
+        self._blob = None
+
+    @property
+    def blob(self):
+        if self._blob is None:
+            self._blob = TextBlob(self.text)
+        return self._blob
+
+
+class TextCache:
+    """Per-request cache of the parsed answers, keyed by the answer text."""
+
+    def __init__(self):
+        self._parsed = {}
+
+    def get(self, text):
+        """Function to get the parsed answer, parsing it on the first call only.
+
+        Parameters
+        ----------
+        text: str
+
+        Returns
+        -------
+        parsed: ParsedText
+        """
+        parsed = self._parsed.get(text)
+        if parsed is None:
+            parsed = self._parsed[text] = ParsedText(text)
+        return parsed
+
+    def __len__(self):
+        return len(self._parsed)
+
+
+def extract_text_features(df, columns_to_extract, text_cache=None, top_keywords=3):
+    """Function to add the words, the sentences and the top keywords of the answers as new columns.
+    The keywords are the words with the highest TF-IDF, the document frequencies
+    are counted across all the open_ended answers of the survey.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame
+        This is the dataframe with the quest survey responses.
+    columns_to_extract: list
+        List of open_ended column names.
+    text_cache: TextCache, optional
+        The per-request cache of parsed answers.
+    top_keywords: int
+        The number of keywords kept for each answer.
+
+    Returns
+    -------
+    df: Pandas DataFrame
+        A new DataFrame with the '<column>_words', '<column>_sentences' and '<column>_keywords' columns.
+    keyword_columns: list
+        This is a list of the keyword columns for plotting
+    """
+    df = df.copy(deep=False)
+    if text_cache is None:
+        text_cache = TextCache()
+
+    # parse every distinct answer once, and count the answers each word appears in
+    distinct_answers = {}
+    document_frequency = Counter()
+    documents = 0
+    for column in columns_to_extract:
+        counts = df[column].dropna().astype(str).value_counts()
+        distinct_answers[column] = counts
+        for text, count in counts.items():
+            document_frequency.update({word: count for word in set(text_cache.get(text).words)})
+            documents += count
+
+    def keywords_of(parsed):
+        term_frequency = Counter(word for word in parsed.words if word not in STOPWORDS and not word.isdigit())
+        scores = {word: count * (math.log((1 + documents) / (1 + document_frequency[word])) + 1)
+                  for word, count in term_frequency.items()}
+        return sorted(scores, key=lambda word: (-scores[word], word))[:top_keywords]
+
+    keyword_columns = []
+    for column in columns_to_extract:
+        words, sentences, keywords = {}, {}, {}
+        for text in distinct_answers[column].index:
+            parsed = text_cache.get(text)
+            words[text] = parsed.words
+            sentences[text] = parsed.sentences
+            keywords[text] = keywords_of(parsed)
+        answers = df[column].where(df[column].isna(), df[column].astype(str))
+        df[column + "_words"] = answers.map(words)
+        df[column + "_sentences"] = answers.map(sentences)
+        df[column + "_keywords"] = answers.map(keywords)
+        keyword_columns.append(column + "_keywords")
+    return df, keyword_columns
+
+
+def get_answer_words(df, column, text_cache=None):
+    """Function to get all the words of the answers of a column, for the word cloud.
+    The '<column>_words' column is used when it was extracted already.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame
+    column: str
+    text_cache: TextCache, optional
+
+    Returns
+    -------
+    words: list
+    """
+    if column + "_words" in df.columns:
+        word_lists = df[column + "_words"].dropna()
+    else:
+        text_cache = text_cache or TextCache()
+        word_lists = df[column].dropna().astype(str).map(lambda text: text_cache.get(text).words)
+    return [word for word_list in word_lists for word in word_list]
@@ -0,0 +1,163 @@
+"""This script is the production entry point of the API and the dashboard.
+
+The parent process imports the app (pandas, numpy and the analysis engine) and
+loads the TextBlob models once, then binds the listening socket and forks the
+workers. The workers share the warm memory copy-on-write and accept the
+connections of the same socket, each with a bounded pool of threads.
+
+    python wsgi_server.py --port 5000 --threads 8
+
+The surveys parsed by the lazy mode of /charts, which the single chart requests
+and the dashboard read, are kept in the memory of the worker that parsed them.
+The workers accept the connections of the same socket, so a request can't be
+routed to a given worker: the default is a single worker, and more workers
+(--workers / WEB_WORKERS) are only for deployments that use neither the lazy
+mode nor the dashboard.
+"""
+
+import argparse
+import os
+import signal
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from textblob import TextBlob
+from werkzeug.serving import BaseWSGIServer
+
+import dashboard  # mounts the dashboard on the API app
+from flask_api import app
+
+
+def warm_up():
+    """Function to load the models TextBlob only loads on first use,
+    the spelling corrector of the text correction and the sentiment lexicon."""
+    blob = TextBlob("The sesion was very good.")
+    blob.correct()
+    blob.sentiment
+
+
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    """WSGI server that handles the requests with a bounded pool of threads.
+    The pool is started by 'serve_forever', so a forked worker starts its own.
+
+    Parameters
+    ----------
+    host: str
+    port: int
+    app: WSGI application
+    threads: int
+        The number of requests handled at the same time.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads=8, **kwargs):
+        super().__init__(host, port, app, **kwargs)
+        self.threads = threads
+        self.executor = None
+
+    def serve_forever(self, poll_interval=0.5):
+        self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve(server, workers):
+    """Function to fork the workers and serve until the parent is stopped.
+    A worker that dies is replaced.
+
+    Parameters
+    ----------
+    server: ThreadPoolWSGIServer
+        The server, already bound to its socket.
+    workers: int
+        The number of worker processes. With 1 (or without fork) the parent serves the requests itself.
+    """
+    if workers <= 1 or not hasattr(os, 'fork'):
+        server.serve_forever()
+        return
+
+    # every worker waits on the socket, the ones that lose the race to accept get EAGAIN
+    server.socket.setblocking(False)
+    children = set()
+    stopping = False
+
+    def spawn_worker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            status = 0
+            try:
+                server.serve_forever()
+            except Exception:
+                traceback.print_exc()
+                status = 1
+            os._exit(status)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn_worker()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, starting a new one.", file=sys.stderr)
+            # don't spin when the workers die on start
+            time.sleep(1)
+            spawn_worker()
+    server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the API and the dashboard with pre-forked workers.")
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', 1)),
+                        help="Number of worker processes. The lazy surveys and the dashboard only "
+                             "work with a single worker, the default.")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 8)),
+                        help="Number of request threads of each worker.")
+    args = parser.parse_args(argv)
+    if args.workers > 1:
+        print(f"Warning: with {args.workers} workers, the lazy chart requests and the dashboard "
+              f"only find the surveys parsed by the worker they reach.", file=sys.stderr)
+
+    # everything loaded before the fork is shared by the workers
+    warm_up()
+    server = ThreadPoolWSGIServer(args.host, args.port, app, threads=args.threads)
+    print(f"Serving on http://{args.host}:{server.port} with {args.workers} workers "
+          f"of {args.threads} threads", file=sys.stderr)
+    serve(server, args.workers)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())